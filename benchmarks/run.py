@@ -0,0 +1,725 @@
+#! /usr/bin/python3
+
+# vim: filetype=python3 tabstop=2 expandtab
+
+# pyds
+# Copyright (C) 2015 Jashandeep Sohi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks for the hot paths of pyds (lexing, parsing, lookup, mutation and
+serialization).
+
+Run all the benchmarks and write the results to a JSON file::
+
+  $ python3 benchmarks/run.py -o before.json
+
+Run only the benchmarks whose name contains a string::
+
+  $ python3 benchmarks/run.py -k parse -o after.json
+
+Compare two result files (e.g. from two different commits)::
+
+  $ python3 benchmarks/run.py --compare before.json after.json
+"""
+
+import argparse
+import atexit
+import json
+import mmap
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(
+  0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+)
+
+import pyds
+import pyds.testing
+from pyds import parser
+
+TEST_IMG = os.path.join(
+  os.path.dirname(os.path.abspath(__file__)), "..", "data", "test.img"
+)
+
+# Each benchmark is registered as a (name, setup) pair, where setup is a
+# function that does all the (untimed) preparation work and returns a function
+# taking no arguments which is the code to time.
+BENCHMARKS = []
+
+def benchmark(name):
+  "Decorator registering a benchmark setup function under `name`."
+  def decorator(setup):
+    BENCHMARKS.append((name, setup))
+    return setup
+  return decorator
+
+
+# Benchmarks that need files write them under a single temporary directory,
+# which is removed (along with everything in it) when the process exits.
+_SCRATCH = None
+
+def scratch_dir():
+  "Return a new, empty directory that is removed when the process exits."
+  global _SCRATCH
+  if _SCRATCH is None:
+    _SCRATCH = tempfile.TemporaryDirectory(prefix = "pyds-bench-")
+    atexit.register(_SCRATCH.cleanup)
+  return tempfile.mkdtemp(dir = _SCRATCH.name)
+
+def thread_pool(n_threads):
+  "Return a ThreadPoolExecutor that is shut down when the process exits."
+  executor = ThreadPoolExecutor(n_threads)
+  atexit.register(executor.shutdown)
+  return executor
+
+
+def synthetic_label(n_statements):
+  """
+  Return a PDS label byte string with roughly `n_statements` statements.
+
+  Every tenth statement is a group of attributes and every fiftieth is an
+  object containing a group, so that the label has some structure to it.
+  """
+  lines = ["PDS_VERSION_ID = PDS3"]
+  i = 0
+  while i < n_statements:
+    if i % 50 == 0:
+      lines.extend((
+        "OBJECT = OBJ_{}".format(i),
+        " ATTR_A = 1024 <BYTES>",
+        " ATTR_B = (1.5, 2.5, 3.5)",
+        " GROUP = GRP_{}".format(i),
+        "  ATTR_C = 2013-02-23T23:28:01.299Z",
+        "  ATTR_D = 'SYMBOL VALUE'",
+        " END_GROUP = GRP_{}".format(i),
+        "END_OBJECT = OBJ_{}".format(i),
+      ))
+      i += 6
+    elif i % 10 == 0:
+      lines.extend((
+        "GROUP = GRP_{}".format(i),
+        " ATTR_A = 16#FF#",
+        " ATTR_B = {'RED', 'GREEN', 'BLUE'}",
+        " ATTR_C = ((1, 2), (3, 4))",
+        "END_GROUP = GRP_{}".format(i),
+      ))
+      i += 4
+    else:
+      lines.extend((
+        "INTEGER_ATTR_{} = {}".format(i, i),
+        "REAL_ATTR_{} = {}.25 <KM>".format(i, i),
+        'TEXT_ATTR_{} = "SOME TEXT\r\n SPANNING LINES"'.format(i),
+        "IDENT_ATTR_{} = IDENTIFIER_VALUE".format(i),
+        "/* A COMMENT */",
+      ))
+      i += 4
+  lines.append("END")
+  return "\r\n".join(lines).encode("ascii")
+
+def nested_label(depth):
+  "Return a PDS label byte string with objects nested `depth` levels deep."
+  opening = [
+    "{}OBJECT = OBJ_{}\r\n{} ATTR = {}".format(" " * d, d, " " * d, d)
+    for d in range(depth)
+  ]
+  closing = [
+    "{}END_OBJECT = OBJ_{}".format(" " * d, d)
+    for d in reversed(range(depth))
+  ]
+  return "\r\n".join(
+    ["PDS_VERSION_ID = PDS3"] + opening + closing + ["END"]
+  ).encode()
+
+def read_test_img():
+  with open(TEST_IMG, "rb") as f:
+    return f.read()
+
+
+@benchmark("lex_test_img")
+def bench_lex_test_img():
+  byte_str = read_test_img()
+  def run():
+    for name, start, end in pyds.tokenize(byte_str):
+      if "end" == name:
+        break
+  return run
+
+@benchmark("scan_test_img")
+def bench_scan_test_img():
+  byte_str = read_test_img()
+  def run():
+    for match in parser._finditer(byte_str):
+      if match.lastgroup == "identifier" and \
+        match.group("identifier").lower() == b"end":
+        break
+  return run
+
+@benchmark("parse_test_img")
+def bench_parse_test_img():
+  byte_str = read_test_img()
+  return lambda: pyds.parse(byte_str)
+
+@benchmark("parse_pool_test_img")
+def bench_parse_pool_test_img():
+  byte_str = read_test_img()
+  pool = pyds.DedupPool()
+  return lambda: pyds.parse(byte_str, pool = pool)
+
+def _bench_parse_synthetic(n_statements):
+  byte_str = synthetic_label(n_statements)
+  run = lambda: pyds.parse(byte_str)
+  run.nbytes = len(byte_str)
+  return run
+
+for _n in (1000, 10000, 100000):
+  benchmark("parse_synthetic_{}".format(_n))(
+    lambda n = _n: _bench_parse_synthetic(n)
+  )
+
+@benchmark("parse_generated_10000")
+def bench_parse_generated():
+  byte_str = pyds.testing.generate_label_bytes(10000, seed = 0)
+  run = lambda: pyds.parse(byte_str)
+  run.nbytes = len(byte_str)
+  return run
+
+@benchmark("parse_file_gzip_head")
+def bench_parse_file_gzip():
+  # A compressed product whose label is followed by 32 MiB of data, of which
+  # only the first chunk or so should be decompressed.
+  import gzip
+  path = os.path.join(scratch_dir(), "bench.img.gz")
+  with gzip.open(path, "wb", compresslevel = 1) as f:
+    f.write(read_test_img())
+    block = os.urandom(1 << 20)
+    for i in range(32):
+      f.write(block)
+  return lambda: pyds.parse_file(path)
+
+def _bench_scan_archive(workers):
+  import zipfile
+  path = os.path.join(scratch_dir(), "bench.zip")
+  with zipfile.ZipFile(path, "w") as f:
+    for seed in range(64):
+      f.writestr(
+        "volume/data/{}.LBL".format(seed),
+        pyds.testing.generate_label_bytes(200, seed = seed)
+      )
+  def run():
+    for name, label in pyds.scan_archive(path, workers = workers):
+      pass
+  return run
+
+benchmark("scan_archive_zip_64")(lambda: _bench_scan_archive(None))
+benchmark("scan_archive_zip_64_workers_4")(lambda: _bench_scan_archive(4))
+
+def _index_labels(n):
+  return [
+    "PDS_VERSION_ID = PDS3\r\n"
+    "FILE_NAME = \"{0:06d}.IMG\"\r\n"
+    "START_TIME = 2004-01-05T12:{1:02d}:00Z\r\n"
+    "LINES = {2}\r\n"
+    "EXPOSURE_DURATION = {3} <MS>\r\n"
+    "END\r\n".format(i, i % 60, i % 1024, i * 0.5).encode("ascii")
+    for i in range(n)
+  ]
+
+_INDEX_SCHEMA = (
+  ("PDS_VERSION_ID", pyds.Identifier),
+  ("FILE_NAME", pyds.Text),
+  ("START_TIME", pyds.DateTime),
+  ("LINES", pyds.Integer),
+  ("EXPOSURE_DURATION", pyds.Real),
+)
+
+@benchmark("parse_columnar_10000")
+def bench_parse_columnar():
+  byte_strs = _index_labels(10000)
+  run = lambda: pyds.parse_columnar(byte_strs, _INDEX_SCHEMA)
+  run.nbytes = sum(map(len, byte_strs))
+  return run
+
+@benchmark("parse_index_labels_10000")
+def bench_parse_index_labels():
+  # Baseline for parse_columnar_10000.
+  byte_strs = _index_labels(10000)
+  def run():
+    for byte_str in byte_strs:
+      pyds.parse(byte_str)
+  run.nbytes = sum(map(len, byte_strs))
+  return run
+
+@benchmark("schema_parse_index_labels_10000")
+def bench_schema_parse_index_labels():
+  byte_strs = _index_labels(10000)
+  parser = pyds.Schema.infer(
+    pyds.parse(byte_str) for byte_str in byte_strs[:10]
+  ).compile()
+  def run():
+    for byte_str in byte_strs:
+      parser.parse(byte_str)
+  run.nbytes = sum(map(len, byte_strs))
+  return run
+
+@benchmark("lex_synthetic_10000")
+def bench_lex_synthetic():
+  byte_str = synthetic_label(10000)
+  def run():
+    for token in pyds.tokenize(byte_str):
+      pass
+  return run
+
+@benchmark("parse_nested_200")
+def bench_parse_nested():
+  byte_str = nested_label(200)
+  return lambda: pyds.parse(byte_str)
+
+def _bench_parse_threaded(n_threads):
+  byte_strs = [
+    pyds.testing.generate_label_bytes(1000, seed = seed) for seed in range(16)
+  ]
+  executor = thread_pool(n_threads)
+  def run():
+    for label in executor.map(pyds.parse, byte_strs):
+      pass
+  run.nbytes = sum(map(len, byte_strs))
+  return run
+
+# Throughput of parsing many labels from a pool of threads. On a free-threaded
+# build of CPython this should scale with the number of threads.
+for _n in (1, 2, 4, 8):
+  benchmark("parse_threaded_{}".format(_n))(
+    lambda n = _n: _bench_parse_threaded(n)
+  )
+
+@benchmark("frozen_read_threaded_4")
+def bench_frozen_read_threaded():
+  label = pyds.testing.generate_label(10000, seed = 0).freeze()
+  identifiers = [stmt.identifier for stmt in label]
+  executor = thread_pool(4)
+  def read(part):
+    for identifier in identifiers[part::4]:
+      label[identifier]
+  def run():
+    for result in executor.map(read, range(4)):
+      pass
+  return run
+
+@benchmark("frozen_with_nested_10000")
+def bench_frozen_with():
+  label = pyds.testing.generate_label(10000, seed = 0).freeze()
+  obj = next(stmt for stmt in label if isinstance(stmt, pyds.Object))
+  path = (obj.identifier, obj.statements.get(0).identifier)
+  value = pyds.Integer(42)
+  return lambda: label.with_(path, value)
+
+@benchmark("store_lookup_1000")
+def bench_store_lookup():
+  path = os.path.join(scratch_dir(), "bench.store")
+  pyds.write_store(path, (
+    (str(seed), pyds.testing.generate_label(100, seed = seed))
+    for seed in range(1000)
+  ))
+  store = pyds.LabelStore(path)
+  return lambda: store["500"]["PDS_VERSION_ID"]
+
+@benchmark("json_directory_100")
+def bench_json_directory():
+  # Convert a directory of label files to JSON files, as a batch export would.
+  src = scratch_dir()
+  dst = scratch_dir()
+  names = []
+  for seed in range(100):
+    name = "{}.lbl".format(seed)
+    with open(os.path.join(src, name), "wb") as f:
+      f.write(pyds.testing.generate_label_bytes(500, seed = seed))
+    names.append(name)
+  def run():
+    for name in names:
+      with open(os.path.join(src, name), "rb") as f:
+        label = pyds.parse(f.read())
+      with open(os.path.join(dst, name + ".json"), "w") as f:
+        pyds.to_json(label, f)
+  run.nbytes = sum(os.path.getsize(os.path.join(src, name)) for name in names)
+  return run
+
+@benchmark("diff_frozen_one_change_10000")
+def bench_diff_frozen():
+  old = pyds.testing.generate_label(10000, seed = 0).freeze()
+  path = next(
+    (stmt.identifier, nested.identifier)
+    for stmt in old if not isinstance(stmt, pyds.Attribute)
+    for nested in stmt.statements if isinstance(nested, pyds.Attribute)
+  )
+  new = old.with_(path, pyds.Text("changed"))
+  return lambda: pyds.diff(old, new)
+
+@benchmark("diff_one_change_10000")
+def bench_diff():
+  old = pyds.testing.generate_label(10000, seed = 0)
+  new = pyds.testing.generate_label(10000, seed = 0)
+  new.append(pyds.Attribute("ADDED", pyds.Text("added")))
+  return lambda: pyds.diff(old, new)
+
+@benchmark("fingerprint_one_change_10000")
+def bench_fingerprint_one_change():
+  label = pyds.testing.generate_label(10000, seed = 0)
+  statements = next(
+    stmt.statements for stmt in label if not isinstance(stmt, pyds.Attribute)
+  )
+  label.fingerprint()
+  def run():
+    statements["CHANGED"] = pyds.Integer(1)
+    label.fingerprint()
+  return run
+
+@benchmark("from_dict_generated_10000")
+def bench_from_dict():
+  label_dict = pyds.testing.generate_label(10000, seed = 0).to_dict()
+  return lambda: pyds.Label.from_dict(label_dict)
+
+def _big_label():
+  return pyds.parse(synthetic_label(10000))
+
+@benchmark("statements_get_middle_10000")
+def bench_get():
+  label = _big_label()
+  index = len(label) // 2
+  return lambda: label.get(index)
+
+@benchmark("statements_getitem_10000")
+def bench_getitem():
+  label = _big_label()
+  identifier = label.get(len(label) // 2).identifier
+  return lambda: label[identifier]
+
+@benchmark("statements_insert_pop_middle_10000")
+def bench_insert_pop():
+  label = _big_label()
+  index = len(label) // 2
+  stmt = pyds.Attribute("BENCH_ATTR", pyds.Integer(5))
+  def run():
+    label.insert(index, stmt)
+    label.pop(index)
+  return run
+
+@benchmark("statements_append_10000")
+def bench_append():
+  stmts = [
+    pyds.Attribute("ATTR_{}".format(i), pyds.Integer(i)) for i in range(10000)
+  ]
+  def run():
+    label = pyds.Label()
+    for stmt in stmts:
+      label.append(stmt)
+  return run
+
+@benchmark("statements_extend_10000")
+def bench_extend():
+  stmts = [
+    pyds.Attribute("ATTR_{}".format(i), pyds.Integer(i)) for i in range(10000)
+  ]
+  def run():
+    pyds.Label().extend(stmts)
+  return run
+
+@benchmark("statements_batch_append_10000")
+def bench_batch_append():
+  stmts = [
+    pyds.Attribute("ATTR_{}".format(i), pyds.Integer(i)) for i in range(10000)
+  ]
+  def run():
+    label = pyds.Label()
+    with label.batch():
+      for stmt in stmts:
+        label.append(stmt)
+  return run
+
+def _table_bytes(ncolumns):
+  "Return a label with a TABLE object of `ncolumns` COLUMN objects."
+  columns = "".join(
+    "  OBJECT = COLUMN\r\n    NAME = COL_{0}\r\n    START_BYTE = {1}\r\n"
+    "    BYTES = 4\r\n    DATA_TYPE = {2}\r\n"
+    "  END_OBJECT = COLUMN\r\n".format(
+      i, 4*i + 1, "PC_REAL" if i % 2 else "MSB_INTEGER"
+    )
+    for i in range(ncolumns)
+  )
+  return (
+    "OBJECT = TABLE\r\n  ROW_BYTES = {}\r\n{}END_OBJECT = TABLE\r\nEND\r\n"
+  ).format(4 * ncolumns, columns).encode()
+
+@benchmark("parse_duplicates_1000_columns")
+def bench_parse_duplicates():
+  byte_string = _table_bytes(1000)
+  return lambda: pyds.parse(byte_string, duplicates = True)
+
+@benchmark("getall_1000_columns")
+def bench_getall():
+  table = pyds.parse(_table_bytes(1000), duplicates = True)["TABLE"]
+  return lambda: table.getall("COLUMN")
+
+@benchmark("table_layout_compile_100_columns")
+def bench_table_layout():
+  table = pyds.parse(_table_bytes(100), duplicates = True)["TABLE"]
+  return lambda: pyds.TableLayout(table)
+
+@benchmark("table_layout_cached_100_columns")
+def bench_table_layout_cached():
+  # Frozen, so the fingerprints of the columns are computed once.
+  table = pyds.parse(_table_bytes(100), duplicates = True)["TABLE"].freeze()
+  cache = pyds.LayoutCache()
+  return lambda: cache.compile(table)
+
+@benchmark("table_rows_100_columns_1000")
+def bench_table_rows():
+  layout = pyds.TableLayout(
+    pyds.parse(_table_bytes(100), duplicates = True)["TABLE"]
+  )
+  data = bytes(layout.record_bytes * 1000)
+  return lambda: sum(1 for _ in layout.rows(data))
+
+@benchmark("resolve_includes_cached_100_columns")
+def bench_resolve_includes():
+  directory = scratch_dir()
+  with open(os.path.join(directory, "TABLE.FMT"), "wb") as stream:
+    stream.write(_table_bytes(100).split(b"\r\n", 2)[2].rsplit(
+      b"END_OBJECT = TABLE", 1
+    )[0])
+  byte_string = (
+    b"OBJECT = TABLE\r\n  ROW_BYTES = 400\r\n  ^STRUCTURE = \"TABLE.FMT\"\r\n"
+    b"END_OBJECT = TABLE\r\nEND\r\n"
+  )
+  cache = pyds.IncludeCache()
+  def run():
+    pyds.parse(byte_string, duplicates = True).resolve_includes(
+      directory, cache
+    )
+  return run
+
+def _qube(storage_order, bands, lines, samples):
+  """
+  Return the label (with 1 suffix item along each axis) and the bytes of a
+  qube of 2 byte integers.
+  """
+  axes = {"BSQ": (0, 1, 2), "BIL": (0, 2, 1), "BIP": (2, 0, 1)}[storage_order]
+  core = [(samples, "SAMPLE"), (lines, "LINE"), (bands, "BAND")]
+  core = [core[i] for i in axes]
+  label = pyds.parse((
+    "^QUBE = 1 <BYTES>\r\nOBJECT = QUBE\r\n  AXES = 3\r\n"
+    "  AXIS_NAME = ({})\r\n  CORE_ITEMS = ({})\r\n  CORE_ITEM_BYTES = 2\r\n"
+    "  CORE_ITEM_TYPE = MSB_INTEGER\r\n  SUFFIX_ITEMS = (1, 1, 1)\r\n"
+    "END_OBJECT = QUBE\r\nEND\r\n"
+  ).format(
+    ", ".join(name for _, name in core), ", ".join(str(n) for n, _ in core)
+  ).encode())
+  return label, bytes(pyds.QubeLayout(label["QUBE"]).size)
+
+@benchmark("qube_layout_bip")
+def bench_qube_layout():
+  qube = _qube("BIP", 100, 1000, 1000)[0]["QUBE"]
+  return lambda: pyds.QubeLayout(qube)
+
+@benchmark("qube_item_bil_10000")
+def bench_qube_item():
+  label, data = _qube("BIL", 10, 100, 100)
+  item = pyds.QubeLayout(label["QUBE"]).item
+  def run():
+    for band in range(10):
+      for line in range(10):
+        for sample in range(100):
+          item(data, band, line, sample)
+  return run
+
+if pyds.data.numpy is not None:
+  @benchmark("read_qube_band_window_bsq")
+  def bench_read_qube():
+    label, data = _qube("BSQ", 10, 1000, 1000)
+    return lambda: pyds.read_qube(
+      label, data, 5, (100, 356), (100, 356)
+    ).sum()
+
+def _image(lines, samples):
+  """
+  Return the label and the bytes of an image of 1 byte samples, with a 4 byte
+  prefix and suffix on each line.
+  """
+  label = pyds.parse((
+    "^IMAGE = 1 <BYTES>\r\nOBJECT = IMAGE\r\n  LINES = {}\r\n"
+    "  LINE_SAMPLES = {}\r\n  SAMPLE_BITS = 8\r\n"
+    "  SAMPLE_TYPE = MSB_UNSIGNED_INTEGER\r\n  LINE_PREFIX_BYTES = 4\r\n"
+    "  LINE_SUFFIX_BYTES = 4\r\nEND_OBJECT = IMAGE\r\nEND\r\n"
+  ).format(lines, samples).encode())
+  return label, bytes(pyds.ImageLayout(label["IMAGE"]).size)
+
+@benchmark("read_image_window_64x64")
+def bench_read_image_window():
+  label, data = _image(1000, 1000)
+  return lambda: pyds.read_image_window(
+    label, data, (100, 164), (100, 164), band = 0
+  )
+
+@benchmark("prefetch_image_window_mmap_256x256")
+def bench_prefetch_image_window():
+  label, data = _image(4000, 4000)
+  path = os.path.join(scratch_dir(), "image.img")
+  with open(path, "wb") as stream:
+    stream.write(data)
+  with open(path, "rb") as stream:
+    buf = mmap.mmap(stream.fileno(), 0, access = mmap.ACCESS_READ)
+  atexit.register(buf.close)
+  return lambda: pyds.prefetch_image_window(
+    label, buf, (1000, 1256), (1000, 1256)
+  )
+
+@benchmark("serialize_test_img")
+def bench_serialize_test_img():
+  label = pyds.parse(read_test_img())
+  return lambda: bytes(label)
+
+@benchmark("serialize_synthetic_10000")
+def bench_serialize_synthetic():
+  label = _big_label()
+  return lambda: bytes(label)
+
+
+def run_benchmark(setup, repeat, min_time):
+  """
+  Time the function returned by `setup` and return a dict of statistics (in
+  seconds per call).
+  """
+  func = setup()
+  timer = timeit.Timer(func)
+  number = 1
+  while True:
+    if timer.timeit(number) >= min_time:
+      break
+    number *= 2
+  timings = [t / number for t in timer.repeat(repeat, number)]
+  stats = {
+    "min": min(timings),
+    "mean": statistics.mean(timings),
+    "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    "number": number,
+    "repeat": repeat,
+  }
+  # Benchmarks that process a byte string also report their throughput.
+  nbytes = getattr(func, "nbytes", None)
+  if nbytes is not None:
+    stats["bytes"] = nbytes
+    stats["mb_per_sec"] = nbytes / stats["min"] / 1e6
+  return stats
+
+def git_revision():
+  try:
+    return subprocess.check_output(
+      ["git", "rev-parse", "--short", "HEAD"],
+      cwd = os.path.dirname(os.path.abspath(__file__)),
+      stderr = subprocess.DEVNULL
+    ).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def run(args):
+  results = {
+    "meta": {
+      "python": platform.python_version(),
+      "implementation": platform.python_implementation(),
+      "platform": platform.platform(),
+      "revision": git_revision(),
+      "date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+      "pyds": pyds.__version__,
+    },
+    "benchmarks": {},
+  }
+  for name, setup in BENCHMARKS:
+    if args.filter and not any(f in name for f in args.filter):
+      continue
+    stats = run_benchmark(setup, args.repeat, args.min_time)
+    results["benchmarks"][name] = stats
+    print(
+      "{:<40} {:>12.3f} us".format(name, stats["min"] * 1e6),
+      file = sys.stderr
+    )
+
+  if args.output:
+    with open(args.output, "w") as f:
+      json.dump(results, f, indent = 2, sort_keys = True)
+  else:
+    json.dump(results, sys.stdout, indent = 2, sort_keys = True)
+    print()
+
+def compare(old_path, new_path):
+  with open(old_path) as f:
+    old = json.load(f)["benchmarks"]
+  with open(new_path) as f:
+    new = json.load(f)["benchmarks"]
+
+  print("{:<40} {:>12} {:>12} {:>8}".format("benchmark", "old (us)", "new (us)",
+    "speedup"))
+  for name in sorted(set(old) & set(new)):
+    old_min, new_min = old[name]["min"], new[name]["min"]
+    print("{:<40} {:>12.3f} {:>12.3f} {:>7.2f}x".format(
+      name, old_min * 1e6, new_min * 1e6, old_min / new_min
+    ))
+  for name in sorted(set(old) ^ set(new)):
+    print("{:<40} only in {}".format(name, old_path if name in old else new_path))
+
+def main(argv = None):
+  arg_parser = argparse.ArgumentParser(description = __doc__.strip().split("\n")[0])
+  arg_parser.add_argument(
+    "-o", "--output",
+    help = "write JSON results to this file instead of stdout"
+  )
+  arg_parser.add_argument(
+    "-k", "--filter", action = "append",
+    help = "only run benchmarks whose name contains this string (repeatable)"
+  )
+  arg_parser.add_argument(
+    "-r", "--repeat", type = int, default = 5,
+    help = "number of timing repetitions (default: %(default)s)"
+  )
+  arg_parser.add_argument(
+    "-t", "--min-time", type = float, default = 0.2,
+    help = "minimum seconds per repetition (default: %(default)s)"
+  )
+  arg_parser.add_argument(
+    "--compare", nargs = 2, metavar = ("OLD", "NEW"),
+    help = "compare two JSON result files instead of running benchmarks"
+  )
+  arg_parser.add_argument(
+    "-l", "--list", action = "store_true",
+    help = "list the available benchmarks and exit"
+  )
+  args = arg_parser.parse_args(argv)
+
+  if args.list:
+    for name, setup in BENCHMARKS:
+      print(name)
+  elif args.compare:
+    compare(*args.compare)
+  else:
+    run(args)
+
+if __name__ == "__main__":
+  main()
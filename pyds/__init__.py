@@ -25,5 +25,17 @@ __version__ = "0.3.0"
 from .values import *
 from .statements import *
 from .parser import *
+from .store import *
+from .archive import *
+from .columnar import *
+from .schema import *
+from .table import *
+from .include import *
+from .data import *
+from . import pds4
 
-__all__ = values.__all__ + statements.__all__ + parser.__all__
+__all__ = (
+  values.__all__ + statements.__all__ + parser.__all__ + store.__all__ +
+  archive.__all__ + columnar.__all__ + schema.__all__ + table.__all__ +
+  include.__all__ + data.__all__
+)
@@ -0,0 +1,191 @@
+# vim: filetype=python3 tabstop=2 expandtab
+
+# pyds
+# Copyright (C) 2015 Jashandeep Sohi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Parse labels directly from the members of tar and zip archives (e.g. delivery
+bundles of PDS volumes), without extracting them to disk.
+"""
+
+from .parser import ParsingError, parse_file
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatchcase
+from tarfile import ReadError, open as tar_open
+from zipfile import ZipFile, ZipInfo, is_zipfile
+
+__all__ = (
+  "scan_archive",
+)
+
+def _open_archive(path):
+  if is_zipfile(path):
+    return ZipFile(path)
+  try:
+    return tar_open(path)
+  except ReadError:
+    raise ValueError("{!r} is not a tar or zip archive".format(path)) from None
+
+def _member_name(member):
+  return member.filename if isinstance(member, ZipInfo) else member.name
+
+def _members(archive, patterns):
+  """
+  Return an iterator over the members (ZipInfo or TarInfo objects) of
+  `archive` that are regular files and whose names match any of the upper
+  cased fnmatch `patterns` (or all of them if `patterns` is None).
+  """
+  if isinstance(archive, ZipFile):
+    members = (
+      member for member in archive.infolist()
+      if not member.filename.endswith("/")
+    )
+  else:
+    members = (member for member in archive if member.isfile())
+  if patterns is None:
+    return members
+  return (
+    member for member in members
+    if any(
+      fnmatchcase(_member_name(member).upper(), pattern)
+      for pattern in patterns
+    )
+  )
+
+def _parse_member(archive, member, chunk_size, skip_errors):
+  if isinstance(archive, ZipFile):
+    stream = archive.open(member)
+  else:
+    stream = archive.extractfile(member)
+  with stream:
+    try:
+      return parse_file(stream, chunk_size)
+    except ParsingError as error:
+      if skip_errors:
+        return None
+      raise ParsingError(
+        "{}: {}".format(_member_name(member), error)
+      ) from error
+
+def _scan_members(path, members, chunk_size, skip_errors):
+  """
+  Parse the labels of `members` of the archive at `path`, and return a list
+  of (member name, Label or None) tuples. Run in worker processes, so the
+  archive is opened again (member objects can be pickled, archives can't).
+  """
+  with _open_archive(path) as archive:
+    return [
+      (
+        _member_name(member),
+        _parse_member(archive, member, chunk_size, skip_errors)
+      )
+      for member in members
+    ]
+
+def scan_archive(path, pattern = "*.LBL|*.IMG", workers = None,
+  skip_errors = False, chunk_size = 1 << 16):
+  """
+  Return an iterator over ``(member_name, label)`` tuples for the members of
+  the tar or zip archive at `path` whose names match `pattern`, in the order
+  they appear in the archive.
+
+  Each member is read just far enough to parse its label (see
+  :func:`parse_file`), and nothing is extracted to disk. Compressed tar
+  archives (e.g. ``.tar.gz``) and compressed members (e.g. ``.IMG.gz``) are
+  decompressed on the fly.
+
+  Parameters
+    - `path` (:obj:`str`)
+
+      Path to a tar (optionally compressed with gzip, bzip2 or xz) or zip
+      archive.
+
+    - `pattern` (:obj:`None` or :obj:`str`)
+
+      Shell-style wildcard patterns separated by ``|``, matched against the
+      full names of the members. Matching is case-insensitive (e.g. ``*.LBL``
+      also matches ``data/image.lbl``). If :obj:`None`, every regular file in
+      the archive is parsed.
+
+    - `workers` (:obj:`None` or :obj:`int`)
+
+      If not :obj:`None`, labels are parsed by this many worker processes, each
+      of which opens the archive on its own. This pays off for zip archives
+      and uncompressed tar archives, whose members can be read in any order,
+      but not so much for compressed tar archives, which have to be
+      decompressed from the start to reach a member.
+
+    - `skip_errors` (:obj:`True` or :obj:`False`)
+
+      Whether to skip members that don't start with a valid PDS label (e.g.
+      data files with detached labels), instead of raising a
+      :exc:`ParsingError`.
+
+    - `chunk_size` (:obj:`int`)
+
+      Number of bytes read from a member at a time.
+
+  The archive is opened when the iterator is first advanced, and closed when
+  it's exhausted or garbage collected, so the errors below are raised by the
+  iterator.
+
+  Raises
+    - :exc:`ValueError`
+
+      If `path` is not a tar or zip archive.
+
+    - :exc:`ParsingError`
+
+      If `skip_errors` is :obj:`False` and a member doesn't start with a valid
+      PDS label. The message starts with the name of the member.
+  """
+  patterns = None if pattern is None else pattern.upper().split("|")
+  if workers is None:
+    return _scan(path, patterns, chunk_size, skip_errors)
+  return _scan_parallel(path, patterns, workers, chunk_size, skip_errors)
+
+def _scan(path, patterns, chunk_size, skip_errors):
+  with _open_archive(path) as archive:
+    for member in _members(archive, patterns):
+      label = _parse_member(archive, member, chunk_size, skip_errors)
+      if label is not None:
+        yield _member_name(member), label
+
+def _scan_parallel(path, patterns, workers, chunk_size, skip_errors):
+  with _open_archive(path) as archive:
+    members = list(_members(archive, patterns))
+  # A few batches per worker, so that the workers stay busy even if some
+  # labels take longer to parse than others.
+  batch_size = max(1, -(-len(members) // (workers * 4)))
+  with ProcessPoolExecutor(workers) as executor:
+    futures = [
+      executor.submit(
+        _scan_members,
+        path,
+        members[i:i + batch_size],
+        chunk_size,
+        skip_errors
+      )
+      for i in range(0, len(members), batch_size)
+    ]
+    try:
+      for future in futures:
+        for name, label in future.result():
+          if label is not None:
+            yield name, label
+    finally:
+      for future in futures:
+        future.cancel()
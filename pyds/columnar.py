@@ -0,0 +1,252 @@
+# vim: filetype=python3 tabstop=2 expandtab
+
+# pyds
+# Copyright (C) 2015 Jashandeep Sohi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Parse many small labels that share the same statements into columns of
+values.
+"""
+
+from . import values
+from .parser import ODL_LEX_TOK_SPEC, parse
+from array import array
+from collections import OrderedDict
+from re import compile as re_compile, escape as re_escape
+
+# NumPy is optional. Without it, columns are arrays or lists.
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+__all__ = (
+  "parse_columnar",
+)
+
+_TOKEN_RES = {
+  name: (token_re, groups) for name, token_re, groups in ODL_LEX_TOK_SPEC
+}
+
+# Anything between two tokens: whitespace and comments (which, like in the
+# lexer, extend to the end of the line and must be followed by a line
+# terminator). It's written so that there's only one way to match any string,
+# which keeps failing matches from backtracking exponentially, and keeps a
+# comment from ending before the end of its line.
+_SEP = r"""
+  [ \t\v\f\r\n]*
+  (?:/\*[^\r\n\f\v]*\*/[^\r\n\f\v]*[\r\n\f\v][ \t\v\f\r\n]*)*
+"""
+
+# Optional units following a number. Units aren't kept in the columns.
+_UNITS = r"(?:[ \t\v\f]*<[^>]*>)?"
+
+# Unquoted values must not be followed by characters that would make the lexer
+# read them (or the statement following them) differently.
+_UNQUOTED_END = r"(?![0-9a-zA-Z_.:#+-])"
+
+def _time_args(groups):
+  # The "utc" part is the 4th to last.
+  return groups[:-3] + (bool(groups[-3]),) + groups[-2:]
+
+# For each value type supported in a schema: the tokens that the fast path
+# accepts, the type of column ("i" for integers, "d" for floats and "O" for
+# other objects), and a function converting the matched groups of a token into
+# a column item.
+_COLUMN_TYPES = {
+  values.Integer: (("integer",), "i", {
+    "integer": lambda groups: int(groups[0]),
+  }),
+  values.BasedInteger: (("based_integer",), "i", {
+    "based_integer": lambda groups: int(groups[2], int(groups[1])),
+  }),
+  values.Real: (("real", "integer"), "d", {
+    "real": lambda groups: float(groups[0]),
+    "integer": lambda groups: float(groups[0]),
+  }),
+  values.Text: (("text",), "O", {
+    "text": lambda groups: groups[1].decode("utf-8"),
+  }),
+  values.Symbol: (("symbol",), "O", {
+    "symbol": lambda groups: groups[1].decode("utf-8"),
+  }),
+  values.Identifier: (("identifier",), "O", {
+    "identifier": lambda groups: groups[0].decode("utf-8").upper(),
+  }),
+  values.Date: (("date",), "O", {
+    "date": lambda groups: values.Date(*groups[1:]),
+  }),
+  values.Time: (("time",), "O", {
+    "time": lambda groups: values.Time(*_time_args(groups[1:])),
+  }),
+  values.DateTime: (("date_time",), "O", {
+    "date_time": lambda groups: values.DateTime(*_time_args(groups[1:])),
+  }),
+}
+
+def _column_item(value, cls):
+  """
+  Return the column item of `value` (from a fully parsed label) for a column
+  of values of type `cls`, or raise a ValueError if it can't be converted.
+  """
+  kind = _COLUMN_TYPES[cls][1]
+  if kind == "i" and isinstance(value, (values.Integer, values.BasedInteger)):
+    return int(value)
+  elif kind == "d" and isinstance(value, values.Numeric):
+    return float(value)
+  elif isinstance(value, cls):
+    if cls in (values.Text, values.Symbol, values.Identifier):
+      return value.value
+    return value
+  raise ValueError("{} value can not be converted to {}".format(
+    type(value).__name__, cls.__name__
+  ))
+
+def _identifier_re(identifier):
+  parts = []
+  if identifier.startswith("^"):
+    parts.append(r"\^")
+    identifier = identifier[1:]
+  parts.append((_SEP + ":" + _SEP).join(
+    re_escape(part) for part in identifier.split(":")
+  ))
+  return _SEP.join(parts)
+
+def _compile(schema):
+  """
+  Return a compiled regexp matching a label containing exactly the statements
+  in `schema` (in order), and a list with a {token name: (first group index,
+  last group index, convert)} dict for each statement. Group indices are
+  indices into match.groups().
+  """
+  pattern = [_SEP]
+  statements = []
+  group = 0
+  for identifier, cls in schema:
+    tokens, kind, converters = _COLUMN_TYPES[cls]
+    alternatives = []
+    token_groups = {}
+    for name in tokens:
+      token_re, names = _TOKEN_RES[name]
+      token_groups[name] = (group, group + 1 + len(names), converters[name])
+      end = "" if name in ("text", "symbol") else _UNQUOTED_END
+      units = _UNITS if kind != "O" else ""
+      alternatives.append("({}){}{}".format(token_re, end, units))
+      group += 1 + len(names)
+    pattern.append("{}{}={}(?:{}){}".format(
+      _identifier_re(identifier), _SEP, _SEP, "|".join(alternatives), _SEP
+    ))
+    statements.append(token_groups)
+  pattern.append(r"END(?![0-9a-zA-Z]|_[0-9a-zA-Z])")
+  pattern = "(?xsi)" + "".join(pattern)
+  return re_compile(pattern.encode("utf-8")).match, statements
+
+def _new_column(kind, n):
+  if numpy is not None:
+    dtype = {"i": numpy.int64, "d": numpy.float64}.get(kind, object)
+    return numpy.empty(n, dtype)
+  elif kind == "O":
+    return [None] * n
+  return array("q" if kind == "i" else "d", [0]) * n
+
+def parse_columnar(buffers, schema):
+  """
+  Parse many labels that contain the same statements (e.g. the labels of an
+  index) into columns of values, and return an ordered :obj:`dict` mapping
+  each identifier in `schema` to its column.
+
+  Labels containing exactly the statements in `schema`, in the same order and
+  with values of the expected types, are parsed using a fast path that
+  doesn't create any :class:`Statement` (or, except for dates and times,
+  :class:`Value`) objects. Any other label is parsed using :func:`parse`, and
+  its values are looked up by their identifiers.
+
+  If NumPy is installed, each column is a :class:`numpy.ndarray`. Otherwise
+  columns of integers and reals are :class:`array.array` objects, and other
+  columns are lists. Columns contain:
+
+    - :class:`Integer` and :class:`BasedInteger` values as 64 bit integers.
+    - :class:`Real` values (and integers, in a column of reals) as floats.
+    - :class:`Text`, :class:`Symbol` and :class:`Identifier` values as
+      :obj:`str` objects (i.e. their :attr:`value`).
+    - :class:`Date`, :class:`Time` and :class:`DateTime` values as is.
+
+  Units are not kept.
+
+  Parameters
+    - `buffers` (sequence of :obj:`bytes` or :class:`mmap.mmap` objects)
+
+      Each must start with a valid PDS label.
+
+    - `schema` (sequence of (:obj:`str`, :obj:`type`) tuples)
+
+      The identifier and value type of each statement in the labels, in the
+      order they usually appear. Value types must be one of the scalar types
+      listed above.
+
+  Raises
+    - :exc:`ParsingError`
+
+      If a buffer does not start with a valid PDS label.
+
+    - :exc:`ValueError`
+
+      If a label doesn't contain a statement in `schema`, or its value can't
+      be converted to the statement's type.
+
+    - :exc:`TypeError`
+
+      If a type in `schema` is not supported.
+  """
+  schema = [(identifier.upper(), cls) for identifier, cls in schema]
+  for identifier, cls in schema:
+    if cls not in _COLUMN_TYPES:
+      raise TypeError("{} values are not supported".format(cls.__name__))
+  if not hasattr(buffers, "__len__"):
+    buffers = list(buffers)
+
+  n = len(buffers)
+  match, statements = _compile(schema)
+  columns = [_new_column(_COLUMN_TYPES[cls][1], n) for _, cls in schema]
+  for row, buffer in enumerate(buffers):
+    m = match(buffer)
+    if m is not None:
+      groups = m.groups()
+      for column, token_groups in zip(columns, statements):
+        for first, last, convert in token_groups.values():
+          if groups[first] is not None:
+            column[row] = convert(groups[first:last])
+            break
+      continue
+
+    label = parse(buffer)
+    for column, (identifier, cls) in zip(columns, schema):
+      try:
+        value = label[identifier]
+      except KeyError:
+        raise ValueError(
+          "label {} does not contain {}".format(row, identifier)
+        ) from None
+      try:
+        column[row] = _column_item(value, cls)
+      except ValueError as error:
+        raise ValueError("label {}: {}: {}".format(
+          row, identifier, error
+        )) from None
+
+  return OrderedDict(
+    (identifier, column) for (identifier, _), column in zip(schema, columns)
+  )
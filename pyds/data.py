@@ -0,0 +1,629 @@
+# vim: filetype=python3 tabstop=2 expandtab
+
+# pyds
+# Copyright (C) 2015 Jashandeep Sohi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Locate and read the data objects (e.g. qubes) described by labels, without
+reading any more of the data than needed.
+"""
+
+from . import values
+from .table import _DATA_TYPES, _STRUCT_CODES
+from struct import Struct
+import mmap
+
+# NumPy is optional, but needed to read whole arrays.
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+__all__ = (
+  "resolve_pointer",
+  "QubeLayout",
+  "ImageLayout",
+  "read_qube",
+  "read_image_window",
+  "prefetch_image_window",
+)
+
+def resolve_pointer(label, name):
+  """
+  Return a ``(file_name, offset)`` tuple locating the data object `name`
+  (e.g. ``"IMAGE"``), using the ``^`` pointer statement to it in `label`.
+
+  `file_name` is the name of the file containing the object, as given by the
+  pointer, or :obj:`None` if the object is in the same file as the label.
+  `offset` is the offset of the object in that file, in bytes. Pointers given
+  as record numbers (e.g. ``^IMAGE = 3`` or ``^IMAGE = ("FILE.IMG", 3)``) are
+  converted using the ``RECORD_BYTES`` of the label, and pointers with
+  ``<BYTES>`` units are used as is. Both start from 1.
+
+  Parameters
+    - `label` (:class:`Label`)
+
+    - `name` (:obj:`str`)
+
+      The identifier of the data object, without the ``^``.
+      Case-insensitive.
+
+  Raises
+    - :exc:`KeyError`
+
+      If `label` has no pointer to the object, or the pointer is a record
+      number and `label` has no ``RECORD_BYTES``.
+
+    - :exc:`ValueError`
+
+      If the pointer is not a file name, a location or both.
+  """
+  pointer = label["^" + name]
+  file_name = None
+  location = pointer
+  if isinstance(pointer, values.Sequence1D) and 1 <= len(pointer) <= 2 \
+    and isinstance(pointer[0], values.Text):
+    file_name = pointer[0].value
+    location = pointer[1] if len(pointer) == 2 else None
+  elif isinstance(pointer, values.Text):
+    file_name, location = pointer.value, None
+
+  if location is None:
+    return file_name, 0
+  if not isinstance(location, values.Integer):
+    raise ValueError("invalid pointer {}".format(pointer))
+  if location.units is not None and "BYTES" == location.units.expression:
+    return file_name, location.value - 1
+  return file_name, (location.value - 1) * int(label["RECORD_BYTES"])
+
+def _item_format(data_type, item_bytes):
+  """
+  Return the byte order, kind ("i", "u" or "f") and struct format character
+  of items of the PDS data type `data_type` with size `item_bytes`.
+  """
+  kind, order = _DATA_TYPES.get(data_type.upper().replace(" ", "_"), ("", ""))
+  code = _STRUCT_CODES.get(kind, {}).get(item_bytes)
+  if code is None:
+    raise ValueError("{} byte {} items are not supported".format(
+      item_bytes, data_type
+    ))
+  return order, kind, code
+
+def _ints(value):
+  "Return the integers in a sequence value (or a single integer value)."
+  if isinstance(value, values.Sequence1D):
+    return tuple(int(item.value) for item in value)
+  return (int(value.value),)
+
+# Storage orders, by the axis names from the fastest to the slowest varying.
+_STORAGE_ORDERS = {
+  ("SAMPLE", "LINE", "BAND"): "BSQ",
+  ("SAMPLE", "BAND", "LINE"): "BIL",
+  ("BAND", "SAMPLE", "LINE"): "BIP",
+}
+
+# The advice used to prefetch pages of memory mapped files, if the platform
+# supports it (mmap.madvise is new in Python 3.8).
+_MADV_WILLNEED = getattr(mmap, "MADV_WILLNEED", None)
+
+class _ArrayLayout(object):
+  """
+  Base class of the layouts of data objects whose items are indexed by band,
+  line and sample. Subclasses set `bands`, `lines`, `samples`, `strides`,
+  `start` (the offset of the first item) and the type of the items.
+  """
+
+  start = 0
+
+  def _set_item_type(self, data_type, item_bytes):
+    self._order, self._kind, self._code = _item_format(data_type, item_bytes)
+    self._item_bytes = item_bytes
+    self._unpack_from = Struct(self._order + self._code).unpack_from
+
+  def offset(self, band, line, sample):
+    """
+    Return the offset in bytes of an item from the start of the object.
+
+    Parameters
+      - `band`, `line`, `sample` (:obj:`int`)
+
+        The indexes of the item along each axis, starting at 0.
+
+    Raises
+      - :exc:`IndexError`
+
+        If an index is out of range.
+    """
+    if not (0 <= band < self.bands and 0 <= line < self.lines and
+      0 <= sample < self.samples):
+      raise IndexError("index out of range")
+    band_stride, line_stride, sample_stride = self.strides
+    return self.start + band * band_stride + line * line_stride + \
+      sample * sample_stride
+
+  def item(self, buf, band, line, sample, offset = 0):
+    """
+    Return the value of an item (an :obj:`int` or a :obj:`float`).
+
+    Parameters
+      - `buf` (:obj:`bytes`, :class:`mmap.mmap` or any other buffer)
+
+      - `band`, `line`, `sample` (:obj:`int`)
+
+        The indexes of the item along each axis, starting at 0.
+
+      - `offset` (:obj:`int`)
+
+        Offset of the object in `buf`. Default is 0.
+
+    Raises
+      - :exc:`IndexError`
+
+        If an index is out of range.
+    """
+    return self._unpack_from(buf, offset + self.offset(band, line, sample))[0]
+
+  @property
+  def dtype(self):
+    """
+    The :class:`numpy.dtype` of the items. Read-only.
+
+    Raises
+      - :exc:`ImportError`
+
+        If NumPy is not installed.
+    """
+    if numpy is None:
+      raise ImportError("NumPy is required")
+    return numpy.dtype(
+      "{}{}{}".format(self._order, self._kind, self._item_bytes)
+    )
+
+  def _window(self, offset, band, line_range, sample_range):
+    """
+    Return the offset of the first item of a window, and its shape and
+    strides (with the samples last).
+    """
+    band_stride, line_stride, sample_stride = self.strides
+    line_start, line_stop = _range(line_range, self.lines)
+    sample_start, sample_stop = _range(sample_range, self.samples)
+    offset += self.start + line_start * line_stride + \
+      sample_start * sample_stride
+    shape = (line_stop - line_start, sample_stop - sample_start)
+    strides = (line_stride, sample_stride)
+    if band is None:
+      shape = (self.bands,) + shape
+      strides = (band_stride,) + strides
+    elif 0 <= band < self.bands:
+      offset += band * band_stride
+    else:
+      raise IndexError("band out of range")
+    return offset, shape, strides
+
+  def _row_starts(self, offset, shape, strides):
+    "Return the offsets of the first item of each row of a window."
+    starts = [offset]
+    for n, stride in zip(shape[:-1], strides[:-1]):
+      starts = [start + i * stride for start in starts for i in range(n)]
+    return starts
+
+  def read(self, buf, offset = 0, band = None, line_range = None,
+    sample_range = None):
+    """
+    Return the items of the object that starts at `offset` in `buf`, indexed
+    by band, line and sample (whatever the storage order).
+
+    If NumPy is installed, a :class:`numpy.ndarray` is returned. It's a view
+    of `buf` (whose strides skip any prefix, suffix or suffix items), so no
+    data is copied, and only the parts of a memory mapped file that are
+    actually accessed are read. It's read-only if `buf` is (e.g. a
+    :obj:`bytes` object or an :class:`mmap.mmap` opened with
+    :data:`mmap.ACCESS_READ`), and `buf` can't be closed while it exists.
+    Otherwise, nested :obj:`list` objects of the items are returned, and only
+    the items in the window are read.
+
+    Parameters
+      - `buf` (:obj:`bytes`, :class:`mmap.mmap` or any other buffer)
+
+      - `offset` (:obj:`int`)
+
+        Offset of the object in `buf`. Default is 0.
+
+      - `band` (:obj:`None` or :obj:`int`)
+
+        If not :obj:`None`, only that band is returned, indexed by line and
+        sample.
+
+      - `line_range`, `sample_range` (:obj:`None` or a ``(start, stop)``
+        tuple of :obj:`int`)
+
+        If not :obj:`None`, only the lines or samples from `start` up to (but
+        not including) `stop` are returned.
+
+    Raises
+      - :exc:`IndexError`
+
+        If a band or range is out of range.
+    """
+    offset, shape, strides = self._window(
+      offset, band, line_range, sample_range
+    )
+    if numpy is not None:
+      return numpy.ndarray(shape, self.dtype, buf, offset, strides)
+
+    n, step = shape[-1], strides[-1]
+    if step % self._item_bytes:
+      unpack_from = self._unpack_from
+      read_row = lambda pos: [
+        unpack_from(buf, pos + i * step)[0] for i in range(n)
+      ]
+    else:
+      # Unpack the bytes the row spans in one go, and keep every k-th item.
+      k = step // self._item_bytes
+      unpack_row = Struct("{}{}{}".format(
+        self._order, (n - 1) * k + 1 if n else 0, self._code
+      )).unpack_from
+      read_row = lambda pos: list(unpack_row(buf, pos)[::k])
+    rows = [read_row(start) for start in self._row_starts(
+      offset, shape, strides
+    )]
+    if len(shape) == 3:
+      lines = shape[1]
+      return [rows[i*lines:(i+1)*lines] for i in range(shape[0])]
+    return rows
+
+  def prefetch(self, buf, offset = 0, band = None, line_range = None,
+    sample_range = None):
+    """
+    Tell the operating system that the pages of a memory mapped file
+    containing a window of the object will be needed soon (using
+    :meth:`mmap.mmap.madvise` with :data:`mmap.MADV_WILLNEED`), so it can
+    start reading them in the background. Only the pages containing items in
+    the window are included.
+
+    This is useful when reading an object a window (e.g. a tile) at a time:
+    prefetch the next window before processing the current one.
+
+    It has no effect unless `buf` is an :class:`mmap.mmap` and the platform
+    supports it.
+
+    Parameters
+      - `buf`, `offset`, `band`, `line_range`, `sample_range`
+
+        See :meth:`read`.
+
+    Raises
+      - :exc:`IndexError`
+
+        If a band or range is out of range.
+    """
+    offset, shape, strides = self._window(
+      offset, band, line_range, sample_range
+    )
+    madvise = getattr(buf, "madvise", None)
+    if madvise is None or _MADV_WILLNEED is None or 0 in shape:
+      return
+    row_bytes = (shape[-1] - 1) * strides[-1] + self._item_bytes
+    # Advise whole pages, merging the rows that share (or are on adjacent)
+    # pages into a single call.
+    begin = end = None
+    for start in sorted(self._row_starts(offset, shape, strides)):
+      page_start = start - start % mmap.PAGESIZE
+      if end is not None and page_start <= end:
+        end = max(end, start + row_bytes)
+        continue
+      if end is not None:
+        madvise(_MADV_WILLNEED, begin, end - begin)
+      begin, end = page_start, start + row_bytes
+    madvise(_MADV_WILLNEED, begin, end - begin)
+
+def _range(index_range, n):
+  "Return the start and stop of `index_range`, checking that they're valid."
+  if index_range is None:
+    return 0, n
+  start, stop = index_range
+  if not 0 <= start <= stop <= n:
+    raise IndexError("range {!r} out of range".format(index_range))
+  return start, stop
+
+class QubeLayout(_ArrayLayout):
+  """
+  The layout of the data of a ``QUBE`` or ``SPECTRAL_QUBE`` object (as used
+  by ISIS and PDS3): the size of each axis, the order they are stored in, the
+  type of each core item, and where the suffix planes are.
+
+  The axes are stored in the order given by ``AXIS_NAME``, from the fastest
+  to the slowest varying: ``(SAMPLE, LINE, BAND)`` for band sequential (BSQ),
+  ``(SAMPLE, BAND, LINE)`` for band interleaved by line (BIL) and
+  ``(BAND, SAMPLE, LINE)`` for band interleaved by pixel (BIP). Along each
+  axis, the core items are followed by ``SUFFIX_ITEMS`` suffix items (e.g.
+  backplanes), each ``SUFFIX_BYTES`` bytes long. Suffix items are skipped.
+
+  Parameters
+    - `qube` (:class:`ObjectStatements`)
+
+      The statements of the qube object. ``AXES`` (which must be 3),
+      ``AXIS_NAME``, ``CORE_ITEMS``, ``CORE_ITEM_BYTES`` and
+      ``CORE_ITEM_TYPE`` are required. ``SUFFIX_ITEMS`` and ``SUFFIX_BYTES``
+      are used if present.
+
+  Raises
+    - :exc:`KeyError`
+
+      If a required statement is missing.
+
+    - :exc:`ValueError`
+
+      If the axes or the type of the core items are not supported.
+
+  Attributes
+    .. attribute:: storage_order
+
+        ``"BSQ"``, ``"BIL"`` or ``"BIP"``. A :obj:`str` instance.
+
+    .. attribute:: bands
+
+        Number of core bands. An :obj:`int` instance.
+
+    .. attribute:: lines
+
+        Number of core lines. An :obj:`int` instance.
+
+    .. attribute:: samples
+
+        Number of core samples. An :obj:`int` instance.
+
+    .. attribute:: strides
+
+        A ``(band, line, sample)`` tuple of the number of bytes from an item
+        to the next along each axis, counting suffix items.
+
+    .. attribute:: size
+
+        Size of the qube (including suffix items) in bytes. An :obj:`int`
+        instance.
+  """
+
+  def __init__(self, qube):
+    if int(qube["AXES"]) != 3:
+      raise ValueError("only qubes with 3 axes are supported")
+    axis_names = tuple(str(name.value).upper() for name in qube["AXIS_NAME"])
+    if axis_names not in _STORAGE_ORDERS:
+      raise ValueError("unsupported axes {}".format(qube["AXIS_NAME"]))
+    self.storage_order = _STORAGE_ORDERS[axis_names]
+
+    core = _ints(qube["CORE_ITEMS"])
+    item_bytes = int(qube["CORE_ITEM_BYTES"])
+    self._set_item_type(str(qube["CORE_ITEM_TYPE"].value), item_bytes)
+    suffix = _ints(qube["SUFFIX_ITEMS"]) if "SUFFIX_ITEMS" in qube \
+      else (0, 0, 0)
+    suffix_bytes = int(qube["SUFFIX_BYTES"]) if "SUFFIX_BYTES" in qube else 4
+
+    # Each record along an axis holds the core items (or, further out, the
+    # records) of the previous axis, followed by its suffix items. Suffix
+    # items along the inner axes are part of the outer axes' suffix records.
+    strides = []
+    stride = item_bytes
+    suffix_stride = suffix_bytes
+    for n, s in zip(core, suffix):
+      strides.append(stride)
+      stride, suffix_stride = \
+        n * stride + s * suffix_stride, (n + s) * suffix_stride
+    self.size = stride
+
+    axes = dict(zip(axis_names, zip(core, strides)))
+    self.bands, band_stride = axes["BAND"]
+    self.lines, line_stride = axes["LINE"]
+    self.samples, sample_stride = axes["SAMPLE"]
+    self.strides = (band_stride, line_stride, sample_stride)
+
+_BAND_STORAGE_TYPES = {
+  "BAND_SEQUENTIAL": "BSQ",
+  "LINE_INTERLEAVED": "BIL",
+  "SAMPLE_INTERLEAVED": "BIP",
+}
+
+class ImageLayout(_ArrayLayout):
+  """
+  The layout of the data of an ``IMAGE`` object: its size, the order its
+  bands are stored in, the type of each sample, and the prefix and suffix
+  bytes of each line (which are skipped).
+
+  Parameters
+    - `image` (:class:`ObjectStatements`)
+
+      The statements of the image object. ``LINES``, ``LINE_SAMPLES``,
+      ``SAMPLE_BITS`` and ``SAMPLE_TYPE`` are required. ``BANDS``,
+      ``BAND_STORAGE_TYPE``, ``LINE_PREFIX_BYTES`` and ``LINE_SUFFIX_BYTES``
+      are used if present.
+
+  Raises
+    - :exc:`KeyError`
+
+      If a required statement is missing.
+
+    - :exc:`ValueError`
+
+      If the band storage type or the type of the samples are not supported.
+
+  Attributes
+    .. attribute:: storage_order
+
+        ``"BSQ"`` (``BAND_SEQUENTIAL``), ``"BIL"`` (``LINE_INTERLEAVED``) or
+        ``"BIP"`` (``SAMPLE_INTERLEAVED``). A :obj:`str` instance.
+
+    .. attribute:: bands
+
+        Number of bands. An :obj:`int` instance.
+
+    .. attribute:: lines
+
+        Number of lines. An :obj:`int` instance.
+
+    .. attribute:: samples
+
+        Number of samples in each line. An :obj:`int` instance.
+
+    .. attribute:: line_prefix_bytes
+
+        An :obj:`int` instance.
+
+    .. attribute:: line_suffix_bytes
+
+        An :obj:`int` instance.
+
+    .. attribute:: strides
+
+        A ``(band, line, sample)`` tuple of the number of bytes from a sample
+        to the next along each axis, counting the prefix and suffix bytes.
+
+    .. attribute:: size
+
+        Size of the image (including the prefix and suffix bytes) in bytes.
+        An :obj:`int` instance.
+  """
+
+  def __init__(self, image):
+    self.lines = int(image["LINES"])
+    self.samples = int(image["LINE_SAMPLES"])
+    self.bands = int(image["BANDS"]) if "BANDS" in image else 1
+    sample_bits = int(image["SAMPLE_BITS"])
+    if sample_bits % 8:
+      raise ValueError("{} bit samples are not supported".format(sample_bits))
+    item_bytes = sample_bits // 8
+    self._set_item_type(str(image["SAMPLE_TYPE"].value), item_bytes)
+
+    storage = str(image["BAND_STORAGE_TYPE"].value).upper() \
+      if "BAND_STORAGE_TYPE" in image else "BAND_SEQUENTIAL"
+    if storage not in _BAND_STORAGE_TYPES:
+      raise ValueError("unsupported band storage type {!r}".format(storage))
+    self.storage_order = _BAND_STORAGE_TYPES[storage]
+    self.line_prefix_bytes = int(image["LINE_PREFIX_BYTES"]) \
+      if "LINE_PREFIX_BYTES" in image else 0
+    self.line_suffix_bytes = int(image["LINE_SUFFIX_BYTES"]) \
+      if "LINE_SUFFIX_BYTES" in image else 0
+
+    # The prefix and suffix bytes surround each line of a band (BSQ), or each
+    # line of all the bands (BIL and BIP).
+    line_items = self.samples if "BSQ" == self.storage_order \
+      else self.samples * self.bands
+    line_stride = self.line_prefix_bytes + line_items * item_bytes + \
+      self.line_suffix_bytes
+    if "BSQ" == self.storage_order:
+      self.strides = (self.lines * line_stride, line_stride, item_bytes)
+      self.size = self.bands * self.lines * line_stride
+    else:
+      if "BIL" == self.storage_order:
+        band_stride, sample_stride = self.samples * item_bytes, item_bytes
+      else:
+        band_stride, sample_stride = item_bytes, self.bands * item_bytes
+      self.strides = (band_stride, line_stride, sample_stride)
+      self.size = self.lines * line_stride
+    self.start = self.line_prefix_bytes
+
+def read_qube(label, buf, band = None, line_range = None,
+  sample_range = None):
+  """
+  Return the core items of the ``SPECTRAL_QUBE`` (or, if there is none,
+  ``QUBE``) object of `label`, indexed by band, line and sample.
+
+  The qube is located using the pointer to it in `label` (see
+  :func:`resolve_pointer`), and read as described by :meth:`QubeLayout.read`
+  (e.g. as a view of `buf` if NumPy is installed).
+
+  Parameters
+    - `label` (:class:`Label`)
+
+    - `buf` (:obj:`bytes`, :class:`mmap.mmap` or any other buffer)
+
+      The contents of the file containing the qube (e.g. the file of the
+      label, if the qube is attached to it).
+
+    - `band`, `line_range`, `sample_range`
+
+      See :meth:`QubeLayout.read`.
+
+  Raises
+    - :exc:`KeyError`
+
+      If `label` has no qube object, or no pointer to it.
+  """
+  name = "SPECTRAL_QUBE" if "SPECTRAL_QUBE" in label else "QUBE"
+  layout = QubeLayout(label[name])
+  offset = resolve_pointer(label, name)[1]
+  return layout.read(buf, offset, band, line_range, sample_range)
+
+def read_image_window(label, buf, line_range = None, sample_range = None,
+  band = None):
+  """
+  Return a window of the ``IMAGE`` object of `label`, indexed by band, line
+  and sample (or, if `band` is given, by line and sample).
+
+  The image is located using the pointer to it in `label` (see
+  :func:`resolve_pointer`), and read as described by :meth:`ImageLayout.read`.
+  If NumPy is installed, the window is a view of `buf`, so reading a window of
+  a memory mapped file only reads the pages containing its lines (or, for
+  wide images, the part of each line in the window).
+
+  Parameters
+    - `label` (:class:`Label`)
+
+    - `buf` (:obj:`bytes`, :class:`mmap.mmap` or any other buffer)
+
+      The contents of the file containing the image (e.g. the file of the
+      label, if the image is attached to it).
+
+    - `line_range`, `sample_range` (:obj:`None` or a ``(start, stop)``
+      tuple of :obj:`int`)
+
+      The lines and samples of the window, from `start` up to (but not
+      including) `stop`. Default is all of them.
+
+    - `band` (:obj:`None` or :obj:`int`)
+
+      If not :obj:`None`, only that band is returned.
+
+  Raises
+    - :exc:`KeyError`
+
+      If `label` has no image object, or no pointer to it.
+
+    - :exc:`IndexError`
+
+      If a band or range is out of range.
+  """
+  layout = ImageLayout(label["IMAGE"])
+  offset = resolve_pointer(label, "IMAGE")[1]
+  return layout.read(buf, offset, band, line_range, sample_range)
+
+def prefetch_image_window(label, buf, line_range = None, sample_range = None,
+  band = None):
+  """
+  Tell the operating system that a window of the ``IMAGE`` object of `label`
+  will be read soon, so the pages of the memory mapped file `buf` containing
+  it are read in the background (see :meth:`ImageLayout.prefetch`).
+
+  When scanning an image a tile at a time, prefetch the next tile before
+  reading the current one with :func:`read_image_window`.
+
+  Parameters
+    - `label`, `buf`, `line_range`, `sample_range`, `band`
+
+      See :func:`read_image_window`.
+  """
+  layout = ImageLayout(label["IMAGE"])
+  offset = resolve_pointer(label, "IMAGE")[1]
+  layout.prefetch(buf, offset, band, line_range, sample_range)
@@ -0,0 +1,204 @@
+# vim: filetype=python3 tabstop=2 expandtab
+
+# pyds
+# Copyright (C) 2015 Jashandeep Sohi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Resolve ``^STRUCTURE`` pointers to format files (``.FMT``) by splicing their
+statements into the labels that include them.
+"""
+
+from . import statements
+from . import values
+from .parser import parse
+from os import stat
+from os.path import join
+
+__all__ = (
+  "IncludeCache",
+)
+
+class IncludeCache(object):
+  """
+  Keeps the statements of the format files included by ``^STRUCTURE``
+  pointers (see :meth:`Label.resolve_includes`), so that each file is only
+  read and parsed once no matter how many labels include it.
+
+  Files are looked up by path, and parsed again if their modification time or
+  size (or that of a file they include) has changed since they were cached.
+  The statements of a file are kept as frozen statements (with any
+  ``^STRUCTURE`` pointers in the file itself already resolved), which are
+  shared by every label that includes it.
+
+  A cache keeps the statements of every file it has read alive. It can be used
+  by many threads at once; at worst, the same file is parsed more than once.
+
+  Attributes
+    .. attribute:: hits
+
+        Number of files that were found in the cache. An :obj:`int` instance.
+
+    .. attribute:: misses
+
+        Number of files that were read and parsed. An :obj:`int` instance.
+  """
+
+  def __init__(self):
+    self._files = {}
+    self.hits = 0
+    self.misses = 0
+
+  def __len__(self):
+    """
+    Return the number of files in the cache.
+
+    Called by :func:`len`.
+    """
+    return len(self._files)
+
+  def clear(self):
+    """
+    Remove every file from the cache and reset the statistics.
+    """
+    self.__init__()
+
+  def load(self, path, search_paths = ()):
+    """
+    Return a :obj:`tuple` of the (frozen) statements in the format file at
+    `path`.
+
+    Parameters
+      - `path` (:obj:`str`)
+
+      - `search_paths` (sequence of :obj:`str`)
+
+        Directories in which to look for the files included by the
+        ``^STRUCTURE`` pointers in the file itself.
+
+    Raises
+      - :exc:`FileNotFoundError`
+
+        If the file, or a file it includes, does not exist.
+
+      - :exc:`ParsingError`
+
+        If the file does not contain valid PDS statements.
+
+      - :exc:`ValueError`
+
+        If the file includes itself.
+    """
+    return self._load(path, search_paths, ())[0]
+
+  def _load(self, path, search_paths, including):
+    """
+    Return a tuple of the statements in the file at `path`, and a tuple of
+    the path and version of the file and of every file it includes.
+    """
+    cached = self._files.get(path)
+    if cached is not None and all(
+      _version(dep_path) == version for dep_path, version in cached[1]
+    ):
+      self.hits += 1
+      return cached
+
+    self.misses += 1
+    version = _version(path)
+    with open(path, "rb") as stream:
+      byte_string = stream.read()
+    # The lexer needs a line terminator after a comment, which the last line
+    # of a file may not have.
+    label = parse(
+      byte_string + b"\r\n", duplicates = True, require_end = False
+    )
+    deps = [(path, version)]
+    _resolve(label, search_paths, self, including + (path,), deps)
+    cached = self._files[path] = (label.freeze()._statements, tuple(deps))
+    return cached
+
+def _version(path):
+  "Return the modification time and size of the file at `path`."
+  st = stat(path)
+  return (st.st_mtime_ns, st.st_size)
+
+# Used when no cache is passed to resolve_includes.
+_default_cache = IncludeCache()
+
+def _find(name, search_paths):
+  """
+  Return the path of the file named `name` in the first of `search_paths`
+  that contains it. PDS file names are upper case, but volumes are often
+  copied with lower case names, so both are tried.
+  """
+  for directory in search_paths:
+    for candidate in (name, name.lower(), name.upper()):
+      path = join(directory, candidate)
+      try:
+        stat(path)
+      except FileNotFoundError:
+        continue
+      return path
+  raise FileNotFoundError("{!r} not found in {!r}".format(
+    name, list(search_paths)
+  ))
+
+def _resolve(label, search_paths, cache, including = (), deps = None):
+  """
+  Replace each ``^STRUCTURE`` pointer in `label` (and in the groups and
+  objects nested in it) with the statements of the file it points to. The
+  paths and versions of the files are added to `deps`, if it's not None.
+  """
+  if cache is None:
+    cache = _default_cache
+  if isinstance(search_paths, str):
+    search_paths = (search_paths,)
+  stack = [label]
+  while stack:
+    container = stack.pop()
+    stmts = list(container)
+    for stmt in stmts:
+      if not isinstance(stmt, statements.Attribute):
+        # Frozen statements come from format files, which were already
+        # resolved when they were cached.
+        if not isinstance(stmt.statements, statements._FrozenStatements):
+          stack.append(stmt.statements)
+    if not any("^STRUCTURE" == stmt.identifier for stmt in stmts):
+      continue
+
+    resolved = []
+    for stmt in stmts:
+      if "^STRUCTURE" != stmt.identifier:
+        resolved.append(stmt)
+        continue
+      if not isinstance(stmt.value, (values.Text, values.Symbol)):
+        raise TypeError("^STRUCTURE value must be a file name, not {}".format(
+          stmt.value
+        ))
+      path = _find(stmt.value.value, search_paths)
+      if path in including:
+        raise ValueError("{!r} includes itself".format(path))
+      included, file_deps = cache._load(path, search_paths, including)
+      resolved.extend(included)
+      if deps is not None:
+        deps.extend(file_deps)
+    # Check that the container can hold the included statements before
+    # modifying it, so it's left as is if it can't (e.g. if a file contains
+    # COLUMN objects, but duplicate identifiers aren't allowed).
+    type(container)(*resolved, duplicates = container.duplicates)
+    while len(container):
+      container.pop(0)
+    container.extend(resolved)
+  return label
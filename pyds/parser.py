@@ -18,11 +18,38 @@
 
 from . import statements
 from . import values
+from asyncio import IncompleteReadError, LimitOverrunError
+from collections import Counter
 from re import compile as re_compile
+from time import perf_counter
+from zlib import MAX_WBITS, decompressobj
+
+# bz2 and lzma are optional parts of the standard library (e.g. they're missing
+# if Python was built without libbz2 or liblzma).
+try:
+  from bz2 import BZ2Decompressor
+except ImportError:
+  BZ2Decompressor = None
+try:
+  from lzma import LZMADecompressor
+except ImportError:
+  LZMADecompressor = None
+
+# get_running_loop() was added in Python 3.7. Before that, get_event_loop()
+# returns the running loop when called from a coroutine.
+try:
+  from asyncio import get_running_loop
+except ImportError:
+  from asyncio import get_event_loop as get_running_loop
 
 __all__ = (
+  "LabelParser",
   "ParsingError",
+  "ParseStats",
+  "aparse",
   "parse",
+  "parse_file",
+  "tokenize",
 )
 
 # PDS labels are written in ODL (object description language) w/ additional
@@ -76,7 +103,7 @@ ODL_LEX_TOK_SPEC = (
     (?:
       (Z)
       |
-      ([+-][0-9]+)(?:[:][0-9]+)?
+      ([+-][0-9]+)(?:[:]([0-9]+))?
     )?
     """,
     (
@@ -99,7 +126,7 @@ ODL_LEX_TOK_SPEC = (
     (?:
       (Z)
       |
-      ([+-][0-9]+)(?:[:][0-9]+)?
+      ([+-][0-9]+)(?:[:]([0-9]+))?
     )?
     """,
     ("hour", "minute", "second", "utc", "zone_hour", "zone_minute")
@@ -227,31 +254,110 @@ ODL_LEX_TOK_RE = re_compile(
   ).encode()
 )
 
-# This dict maps each token's groups to the corresponding group index in
-# ODL_LEX_TOK_RE. This is used later when creating Token objects.
-ODL_LEX_TOK_GROUPS_INDEX = {
-  token_name: {
-    group_name: ODL_LEX_TOK_RE.groupindex[token_name]+i
-  for i, group_name in enumerate([token_name] + list(token_groups))
-  }
-for token_name, token_re, token_groups in ODL_LEX_TOK_SPEC
+# Since most tokens can only start with a handful of characters, trying every
+# alternative of ODL_LEX_TOK_RE at each position is wasteful (e.g. an
+# identifier is first tried as a date_time, time, date, based_integer, real and
+# integer). Instead, the lexer looks at the first non-whitespace byte and
+# dispatches to a smaller regexp made up of only the tokens that can start with
+# that byte (in the same order as ODL_LEX_TOK_SPEC, so the results are
+# identical).
+#
+# This dict maps each token name to the characters it can start with.
+_DIGITS = "0123456789"
+_LETTERS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+ODL_LEX_TOK_FIRST_CHARS = {
+  "comment": "/",
+  "date_time": _DIGITS,
+  "time": _DIGITS,
+  "date": _DIGITS,
+  "based_integer": _DIGITS,
+  "real": _DIGITS + "+-.",
+  "integer": _DIGITS + "+-",
+  "text": '"',
+  "symbol": "'",
+  "identifier": _LETTERS,
+  "equal": "=",
+  "comma": ",",
+  "two_asterisk": "*",
+  "asterisk": "*",
+  "slant": "/",
+  "circumflex": "^",
+  "open_bracket": "<",
+  "close_bracket": ">",
+  "open_paren": "(",
+  "close_paren": ")",
+  "open_brace": "{",
+  "close_brace": "}",
+  "colon": ":",
 }
 
-
-class _Token(dict):
+def _build_dispatch():
   """
-  Used internally to represent tokens.
+  Return a tuple of 256 compiled regexps (or None) indexed by the first byte
+  of a token.
   """
+  patterns = {}
+  dispatch = []
+  for byte in range(256):
+    char = chr(byte)
+    specs = tuple(
+      spec for spec in ODL_LEX_TOK_SPEC
+      if char in ODL_LEX_TOK_FIRST_CHARS[spec[0]]
+    )
+    if not specs:
+      dispatch.append(None)
+      continue
+    if specs not in patterns:
+      patterns[specs] = re_compile(
+        r"""(?xi)
+        (?:
+          {}
+        )
+        [ \t\v\f]*
+        """.format(
+          "|".join("(?P<{}>{})".format(n, r) for n, r, g in specs)
+        ).encode()
+      )
+    dispatch.append(patterns[specs])
+  return tuple(dispatch)
+
+ODL_LEX_DISPATCH = _build_dispatch()
+
+# Characters that never start a token (i.e. whitespace and line terminators).
+_ODL_LEX_SKIP_RE = re_compile(rb"[ \t\v\f\r\n]*")
+
+def _finditer(byte_str, pos = 0, endpos = None, partial = False):
+  """
+  Return an iterator over the tokens in ``byte_str[pos:endpos]`` as match
+  objects.
   
-  __slots__ = ("name",)  
+  Equivalent to ``ODL_LEX_TOK_RE.finditer(byte_str, pos, endpos)``, except
+  that each match only contains groups for the tokens that start with the same
+  character. The name of the matched token is ``match.lastgroup``, and the
+  parts of its lexeme can be extracted with _ODL_LEX_TOK_PARTS_RE.
   
-  def __init__(self, name, *args, **kwargs):
-    self.name = name
-    super().__init__(*args, **kwargs)
-    
-  def __repr__(self):
-    return repr(self[self.name].decode("utf-8"))
-    
+  If `partial` is True, more bytes are expected to follow `endpos`, so stop at
+  the first text value that isn't terminated before `endpos` (instead of
+  skipping over its opening quote).
+  """
+  dispatch = ODL_LEX_DISPATCH
+  skip = _ODL_LEX_SKIP_RE.match
+  if endpos is None:
+    endpos = len(byte_str)
+  pos = skip(byte_str, pos, endpos).end()
+  while pos < endpos:
+    pattern = dispatch[byte_str[pos]]
+    match = pattern.match(byte_str, pos, endpos) \
+      if pattern is not None else None
+    if match is None:
+      if partial and 0x22 == byte_str[pos]:
+        return
+      # Just like re.finditer, skip over anything that isn't a token.
+      pos = skip(byte_str, pos + 1, endpos).end()
+    else:
+      yield match
+      pos = skip(byte_str, match.end(), endpos).end()
+
 
 class ParsingError(Exception):
   """
@@ -261,269 +367,505 @@ class ParsingError(Exception):
   pass
 
 
-def _generate_tokens(byte_str):
+class ParseStats(object):
   """
-  Generate _Token objects using the ODL_LEX_TOK_RE sepc.
-  Generator/iterator supports stepping back using the send() method.
+  Collects statistics about calls to :func:`parse`.
+  
+  Pass an instance to :func:`parse` using its `stats` argument to have the
+  parser record what it does and where it spends its time. The same instance
+  can be passed to any number of calls to :func:`parse`, in which case the
+  statistics are aggregated across all the calls. Instances can also be
+  combined using :meth:`merge`.
+  
+  Attributes
+    .. attribute:: parses
+    
+        Number of labels parsed.
+        An :obj:`int` instance.
+        
+    .. attribute:: bytes_scanned
+    
+        Number of bytes scanned by the lexer, up to and including the ``END``
+        statement.
+        An :obj:`int` instance.
+    
+    .. attribute:: tokens
+    
+        Number of lexical tokens by token type (e.g. ``"identifier"``,
+        ``"equal"``, ``"comment"``).
+        A :class:`collections.Counter` instance.
+        
+    .. attribute:: statements
+    
+        Number of statements by statement class name (e.g. ``"Attribute"``).
+        A :class:`collections.Counter` instance.
+        
+    .. attribute:: values
+    
+        Number of values by value class name (e.g. ``"Integer"``), including
+        values nested in sequences and sets.
+        A :class:`collections.Counter` instance.
+        
+    .. attribute:: max_depth
+    
+        Maximum nesting depth of group and object statements.
+        An :obj:`int` instance.
+        
+    .. attribute:: times
+    
+        Seconds spent in each phase of parsing. The phases are:
+        
+        - ``"scan"``: matching the lexical token regular expression
+        - ``"tokens"``: creating token objects from the matches
+        - ``"values"``: creating :class:`Value` objects
+        - ``"statements"``: creating statement objects and inserting them into
+          their containers
+        - ``"parse"``: everything else (i.e. the grammar itself)
+        
+        A :obj:`dict` instance.
   """
   
-  reserved_identifiers = {
-    b"end": "end",
-    b"group": "begin_group",
-    b"begin_group": "begin_group",
-    b"end_group": "end_group",
-    b"object": "begin_object",
-    b"begin_object": "begin_object", 
-    b"end_object": "end_object"
-  }
-  for match in ODL_LEX_TOK_RE.finditer(byte_str):
+  PHASES = ("scan", "tokens", "values", "statements", "parse")
+  
+  def __init__(self):
+    self.parses = 0
+    self.bytes_scanned = 0
+    self.tokens = Counter()
+    self.statements = Counter()
+    self.values = Counter()
+    self.max_depth = 0
+    self.times = dict.fromkeys(self.PHASES, 0.0)
+    
+    self._phase = "parse"
+    self._clock = None
+    self._depth = 0
+    self._pos = 0
+  
+  def _start(self):
+    self._phase = "parse"
+    self._depth = 0
+    self._pos = 0
+    self._clock = perf_counter()
+  
+  def _stop(self):
+    self._switch("parse")
+    self.parses += 1
+    self.bytes_scanned += self._pos
+  
+  def _switch(self, phase):
+    """
+    Charge the time elapsed since the last switch to the current phase and
+    make `phase` the current phase.
+    """
+    now = perf_counter()
+    self.times[self._phase] += now - self._clock
+    self._phase = phase
+    self._clock = now
+  
+  def _enter(self):
+    self._depth += 1
+    if self._depth > self.max_depth:
+      self.max_depth = self._depth
+  
+  def _exit(self):
+    self._depth -= 1
+  
+  @property
+  def total_time(self):
+    """
+    Total seconds spent parsing (i.e. the sum of :attr:`times`).
+    """
+    return sum(self.times.values())
+  
+  def merge(self, other):
+    """
+    Add the statistics collected by `other` to this object and return it.
+    
+    Parameters
+      - `other` (:class:`ParseStats`)
+    """
+    self.parses += other.parses
+    self.bytes_scanned += other.bytes_scanned
+    self.tokens.update(other.tokens)
+    self.statements.update(other.statements)
+    self.values.update(other.values)
+    self.max_depth = max(self.max_depth, other.max_depth)
+    for phase, seconds in other.times.items():
+      self.times[phase] += seconds
+    return self
+  
+  def as_dict(self):
+    """
+    Return the statistics as a :obj:`dict` (e.g. to serialize them as JSON).
+    """
+    return {
+      "parses": self.parses,
+      "bytes_scanned": self.bytes_scanned,
+      "tokens": dict(self.tokens),
+      "statements": dict(self.statements),
+      "values": dict(self.values),
+      "max_depth": self.max_depth,
+      "times": dict(self.times),
+    }
+
+
+def _timed_matches(matches, stats):
+  """
+  Wrap the match iterator `matches`, charging the time spent in it to the
+  "scan" phase of `stats`.
+  """
+  switch = stats._switch
+  while True:
+    switch("scan")
+    match = next(matches, None)
+    switch("tokens")
+    if match is None:
+      return
+    stats._pos = match.end()
+    yield match
+
+# Reserved identifiers are recognized by their length first, so most
+# identifiers never need to be lower cased and compared. Each reserved
+# identifier has a different length.
+_RESERVED_IDENTIFIERS = {
+  len(word): (word, token_name)
+  for word, token_name in (
+    (b"end", "end"),
+    (b"group", "begin_group"),
+    (b"begin_group", "begin_group"),
+    (b"end_group", "end_group"),
+    (b"object", "begin_object"),
+    (b"begin_object", "begin_object"),
+    (b"end_object", "end_object"),
+  )
+}
+
+# Tokens whose lexemes have parts the parser needs (e.g. the year of a date)
+# are matched again against these regexps to get at those parts.
+_ODL_LEX_TOK_PARTS_RE = {
+  token_name: re_compile("(?xi){}".format(token_re).encode())
+  for token_name, token_re, token_groups in ODL_LEX_TOK_SPEC
+  if token_name in ("date_time", "time", "date")
+}
+
+def _tokenize(byte_str, comments, stats, pos = 0, endpos = None,
+  partial = False):
+  reserved_identifiers = _RESERVED_IDENTIFIERS
+  matches = _finditer(byte_str, pos, endpos, partial)
+  if stats is not None:
+    matches = _timed_matches(matches, stats)
+  for match in matches:
     name = match.lastgroup
-    val = match.group(name).lower()
-    if "identifier" == name and val in reserved_identifiers:
-      token_name = reserved_identifiers[val]
-      token = _Token(token_name, ((token_name, match.group(name)),))
-    elif "comment" == name:
+    start, end = match.span(name)
+    if "identifier" == name:
+      reserved = reserved_identifiers.get(end - start)
+      if reserved is not None and byte_str[start:end].lower() == reserved[0]:
+        name = reserved[1]
+    elif "comment" == name and not comments:
+      if stats is not None:
+        stats.tokens[name] += 1
       continue
-    else:
-      token = _Token(
-        name,
-        (
-          (group_name, match.group(group_index))
-          for group_name, group_index in ODL_LEX_TOK_GROUPS_INDEX[name].items()
-        )
-      )
-    sent_token = yield token
-    if sent_token is not None:
-      yield None
-      yield sent_token
+    if stats is not None:
+      stats.tokens[name] += 1
+      stats._switch("parse")
+    yield name, start, end
+
+def tokenize(byte_str, comments = False):
+  """
+  Return an :obj:`iterator` over the lexical tokens of `byte_str`.
+  
+  Each token is a tuple of the form ``(name, start, end)``, where `name` is the
+  type of the token (e.g. ``"identifier"``, ``"equal"``, ``"integer"``,
+  ``"text"``, ``"begin_object"``, ``"end"``), and ``byte_str[start:end]`` is
+  the token's lexeme. No bytes are copied out of `byte_str` (other than to
+  recognize reserved identifiers), which makes this a cheap way to scan a label
+  (e.g. for linters and indexers).
+  
+  Reserved identifiers are returned as their own token types:
+  ``"end"``, ``"begin_group"`` (``GROUP`` or ``BEGIN_GROUP``), ``"end_group"``,
+  ``"begin_object"`` (``OBJECT`` or ``BEGIN_OBJECT``) and ``"end_object"``.
+  
+  Tokenizing does not stop at the ``END`` statement. Anything that isn't a
+  token (e.g. binary data following the label) is skipped.
+  
+  Parameters
+    - `byte_str` (:obj:`bytes` or :class:`mmap.mmap`)
+    
+    - `comments` (:obj:`True` or :obj:`False`)
+    
+      Whether to also return ``"comment"`` tokens. Default is :obj:`False`.
+  """
+  return _tokenize(byte_str, comments, None)
+
 
-def _parse_units(tokens):
+class _Parser(object):
   """
-  Parse and return the tokens into a Units object if possible.
-  Other wise return an empty string.
+  Used internally to parse the tokens of a byte string (as returned by
+  tokenize) into a Label object. Bytes are only copied out of the byte string
+  for the values that are actually kept.
   """
   
-  tok1 = next(tokens)
-  if "open_bracket" in tok1:
-    tok2 = next(tokens)
-    units = b""
-    while "close_bracket" not in tok2:
-      units += tok2[tok2.name]
-      tok2 = next(tokens)
-    units = values.Units(units.decode("utf-8"))
-  else:
-    tokens.send(tok1)
-    units = None
-  return units
-
-def _parse_value(tok1, tokens):
-  "Return a Value subclass depending on what the tokens are."
-  
-  if "open_paren" in tok1:
-    tok2 = next(tokens)
-    if "open_paren" in tok2:
-      def gen_values():
-        yield _parse_value(tok2, tokens)
-        tok3 = next(tokens)
-        while "close_paren" not in tok3:
-          if "comma" not in tok3:
-            raise ParsingError(
-              "expected comma instead of {!r}".format(tok3)
-            )
-          yield _parse_value(next(tokens), tokens)
-          tok3 = next(tokens)
-      return values.Sequence2D(*gen_values())
-    else:
-      def gen_values():
-        yield _parse_value(tok2, tokens)
-        tok3 = next(tokens)
-        while "close_paren" not in tok3:
-          if "comma" not in tok3:
-            raise ParsingError(
-              "expected comma instead of {!r}".format(tok3)
-            )
-          yield _parse_value(next(tokens), tokens)
-          tok3 = next(tokens)
-      return values.Sequence1D(*gen_values())
-  elif "open_brace" in tok1:
-    def gen_values():
-      tok2 = next(tokens)
-      if "close_brace" not in tok2:
-        yield _parse_value(tok2, tokens)        
-        tok2 = next(tokens)
-        while "close_brace" not in tok2:
-          if "comma" not in tok2:
-            raise ParsingError(
-              "expected comma instead of {!r}".format(tok2)
-            )
-          yield _parse_value(next(tokens), tokens)
-          tok2 = next(tokens)
-    return values.Set(*gen_values())
-  elif "identifier" in tok1:
-    return values.Identifier(tok1["identifier"].decode("utf-8"), False)
-  elif "symbol" in tok1:
-    return values.Symbol(tok1["string"].decode("utf-8"), False)
-  elif "text" in tok1:
-    return values.Text(tok1["string"].decode("utf-8"), False)
-  elif "date" in tok1:
-    return values.Date(tok1["year"], tok1["month"], tok1["day"])
-  elif "time" in tok1:
-    return values.Time(
-      tok1["hour"],
-      tok1["minute"],
-      tok1["second"],
-      bool(tok1["utc"]),
-      tok1["zone_hour"],
-      tok1["zone_minute"]
-    )
-  elif "date_time" in tok1:
-    return values.DateTime(
-      tok1["year"],
-      tok1["month"],
-      tok1["day"],
-      tok1["hour"],
-      tok1["minute"],
-      tok1["second"],
-      bool(tok1["utc"]),
-      tok1["zone_hour"],
-      tok1["zone_minute"]
-    )
-  elif "integer" in tok1:
-    units = _parse_units(tokens)
-    return values.Integer(tok1["integer"], units) 
-  elif "based_integer" in tok1:
-    units = _parse_units(tokens)
-    return values.BasedInteger(
-      tok1["radix"], tok1["digits"].decode("utf-8"), units
-    )
-  elif "real" in tok1:
-    units = _parse_units(tokens)
-    return values.Real(tok1["real"], units)
-  else:
-    raise ParsingError("unexpected {!r}".format(tok1))
-
-def _parse_stmt(tok1, tokens):
-  "Return a subclass of Statement depending what the tokens are."
-  
-  if "identifier" in tok1:
-    tok2 = next(tokens)
-    if "colon" in tok2:
-      tok3 = next(tokens)
-      if "identifier" not in tok3:
-        raise ParsingError(
-          "expected namespace identifier instead of {!r}".format(tok3)
-        )
-      identifier = tok1["identifier"] + b":" + tok3["identifier"]  
-      tok2 = next(tokens)
+  def __init__(self, byte_str, tokens, stats = None, duplicates = False):
+    self.byte_str = byte_str
+    self.tokens = iter(tokens)
+    self.pushed = []
+    self.stats = stats
+    self.duplicates = duplicates
+  
+  def next(self):
+    "Return the next token."
+    if self.pushed:
+      return self.pushed.pop()
+    return next(self.tokens)
+  
+  def push(self, token):
+    "Step back, so that `token` is returned by the next call to next()."
+    self.pushed.append(token)
+  
+  def lexeme(self, token):
+    return self.byte_str[token[1]:token[2]]
+  
+  def error(self, message, *tokens):
+    "Return a ParsingError with `tokens` formatted into `message`."
+    return ParsingError(message.format(*(
+      self.lexeme(token).decode("utf-8") for token in tokens
+    )))
+  
+  def parse_units(self):
+    """
+    Parse and return the tokens into a Units object if possible.
+    Other wise return None.
+    """
+    tok1 = self.next()
+    if "open_bracket" != tok1[0]:
+      self.push(tok1)
+      return None
+    
+    tok2 = self.next()
+    parts = []
+    while "close_bracket" != tok2[0]:
+      parts.append(self.lexeme(tok2))
+      tok2 = self.next()
+    expression = b"".join(parts).decode("utf-8")
+    
+    stats = self.stats
+    if stats is None:
+      return values.Units(expression)
+    
+    stats._switch("values")
+    units = values.Units(expression)
+    stats.values["Units"] += 1
+    stats._switch("parse")
+    return units
+  
+  def parse_values(self, tok1, close_name):
+    """
+    Parse and return a list of comma separated values starting with the token
+    `tok1` and ending with a `close_name` token.
+    """
+    items = [self.parse_value(tok1)]
+    tok2 = self.next()
+    while close_name != tok2[0]:
+      if "comma" != tok2[0]:
+        raise self.error("expected comma instead of {!r}", tok2)
+      items.append(self.parse_value(self.next()))
+      tok2 = self.next()
+    return items
+  
+  def parse_value(self, tok1):
+    "Return a Value subclass depending on what the tokens are."
+    
+    name, start, end = tok1
+    byte_str = self.byte_str
+    if "identifier" == name:
+      cls = values.Identifier
+      args = (byte_str[start:end].decode("utf-8"), False)
+    elif "integer" == name:
+      cls = values.Integer
+      args = (byte_str[start:end], self.parse_units())
+    elif "text" == name:
+      cls = values.Text
+      args = (byte_str[start+1:end-1].decode("utf-8"), False)
+    elif "real" == name:
+      cls = values.Real
+      args = (byte_str[start:end], self.parse_units())
+    elif "open_paren" == name:
+      tok2 = self.next()
+      if "open_paren" == tok2[0]:
+        cls = values.Sequence2D
+      else:
+        cls = values.Sequence1D
+      args = self.parse_values(tok2, "close_paren")
+    elif "open_brace" == name:
+      cls = values.Set
+      tok2 = self.next()
+      if "close_brace" == tok2[0]:
+        args = ()
+      else:
+        args = self.parse_values(tok2, "close_brace")
+    elif "symbol" == name:
+      cls = values.Symbol
+      args = (byte_str[start+1:end-1].decode("utf-8"), False)
+    elif "date" == name:
+      cls = values.Date
+      args = _ODL_LEX_TOK_PARTS_RE[name].match(byte_str, start, end).groups()
+    elif "time" == name or "date_time" == name:
+      cls = values.Time if "time" == name else values.DateTime
+      parts = _ODL_LEX_TOK_PARTS_RE[name].match(byte_str, start, end).groups()
+      # The "utc" part is the 4th to last.
+      args = parts[:-3] + (bool(parts[-3]),) + parts[-2:]
+    elif "based_integer" == name:
+      cls = values.BasedInteger
+      lexeme = byte_str[start:end]
+      radix, digits, _ = lexeme.split(b"#")
+      args = (radix, digits.decode("utf-8"), self.parse_units())
     else:
-      identifier = tok1["identifier"]
+      raise self.error("unexpected {!r}", tok1)
     
-    if not "equal" in tok2:
-      raise ParsingError(
-        "expected equal sign instead of {!r}".format(tok2)
-      )
-    value = _parse_value(next(tokens), tokens)
-    return statements.Attribute(identifier.decode("utf-8"), value, False)  
-  elif "circumflex" in tok1:
-    tok2 = next(tokens)
-    if "identifier" not in tok2:
-      raise ParsingError(
-        "expected identifier instead of {!r}".format(tok2)
-      )
-    tok3 = next(tokens)
-    if "equal" not in tok3:
-      raise ParsingError(
-        "expected equal sign instead of {!r}".format(tok3)
-      )
-    identifier = b"^" + tok2["identifier"]
-    value = _parse_value(next(tokens), tokens)
-    return statements.Attribute(identifier.decode("utf-8"), value, False)
-  elif "begin_object" in tok1:
-    tok2 = next(tokens)
-    if "equal" not in tok2:
-      raise ParsingError(
-        "expected equal sign instead of {!r}".format(tok2)
-      )
-    tok3 = next(tokens)
-    if "identifier" not in tok3:
-      raise ParsingError(
-        "expected object identifier instead of {!r}".format(tok3)
-      )
-    identifier = tok3["identifier"]
-    object_statements = statements.ObjectStatements()
-    tok4 = next(tokens)
-    while "end_object" not in tok4:
-      object_statements.append(_parse_stmt(tok4, tokens))
-      tok4 = next(tokens)
-    tok5 = next(tokens)
-    if "equal" in tok5:
-      tok6 = next(tokens)
-      if "identifier" not in tok6:
-        raise ParsingError(
-          "expected object identifier instead of {!r}".format(tok6)
-        )
-      if tok6["identifier"] != identifier:
-        raise ParsingError(
-          "object identifier {!r} does not match end object \
-           identifier {!r}".format(tok3, tok6)
-        )
+    stats = self.stats
+    if stats is None:
+      return cls(*args)
+    
+    stats._switch("values")
+    value = cls(*args)
+    stats.values[cls.__name__] += 1
+    stats._switch("parse")
+    return value
+  
+  def parse_stmt(self, tok1):
+    "Return a subclass of Statement depending what the tokens are."
+    
+    name = tok1[0]
+    if "identifier" == name:
+      tok2 = self.next()
+      if "colon" == tok2[0]:
+        tok3 = self.next()
+        if "identifier" != tok3[0]:
+          raise self.error(
+            "expected namespace identifier instead of {!r}", tok3
+          )
+        identifier = self.lexeme(tok1) + b":" + self.lexeme(tok3)
+        tok2 = self.next()
+      else:
+        identifier = self.lexeme(tok1)
+      
+      if "equal" != tok2[0]:
+        raise self.error("expected equal sign instead of {!r}", tok2)
+      value = self.parse_value(self.next())
+      cls = statements.Attribute
+    elif "circumflex" == name:
+      tok2 = self.next()
+      if "identifier" != tok2[0]:
+        raise self.error("expected identifier instead of {!r}", tok2)
+      tok3 = self.next()
+      if "equal" != tok3[0]:
+        raise self.error("expected equal sign instead of {!r}", tok3)
+      identifier = b"^" + self.lexeme(tok2)
+      value = self.parse_value(self.next())
+      cls = statements.Attribute
+    elif "begin_object" == name:
+      identifier, value = self.parse_block("object", statements.ObjectStatements)
+      cls = statements.Object
+    elif "begin_group" == name:
+      identifier, value = self.parse_block("group", statements.GroupStatements)
+      cls = statements.Group
     else:
-      tokens.send(tok5)
-    return statements.Object(identifier.decode("utf-8"), object_statements, False)
-  elif "begin_group" in tok1:
-    tok2 = next(tokens)
-    if "equal" not in tok2:
-      raise ParsingError(
-        "expected equal sign instead of {!r}".format(tok2)
-      )
-    tok3 = next(tokens)
-    if "identifier" not in tok3:
-      raise ParsingError(
-        "expected group identifier instead of {!r}".format(tok3)
+      raise self.error("unexpected {!r}", tok1)
+    
+    stats = self.stats
+    if stats is None:
+      return cls(identifier.decode("utf-8"), value, False)
+    
+    stats._switch("statements")
+    stmt = cls(identifier.decode("utf-8"), value, False)
+    stats.statements[cls.__name__] += 1
+    stats._switch("parse")
+    return stmt
+  
+  def parse_block(self, kind, statements_cls):
+    """
+    Parse the rest of an object or group statement (i.e. everything after the
+    "begin_object" or "begin_group" token). `kind` is either "object" or
+    "group". Return a tuple of the identifier and a `statements_cls` instance
+    containing the nested statements.
+    """
+    
+    tok2 = self.next()
+    if "equal" != tok2[0]:
+      raise self.error("expected equal sign instead of {!r}", tok2)
+    tok3 = self.next()
+    if "identifier" != tok3[0]:
+      raise self.error(
+        "expected {} identifier instead of {{!r}}".format(kind), tok3
       )
-    identifier = tok3["identifier"]
-    group_statements = statements.GroupStatements()
-    tok4 = next(tokens)
-    while "end_group" not in tok4:
-      group_statements.append(_parse_stmt(tok4, tokens))
-      tok4 = next(tokens)
-    tok5 = next(tokens)
-    if "equal" in tok5:
-      tok6 = next(tokens)
-      if "identifier" not in tok6:
-        raise ParsingError(
-          "expected group identifier instead of {!r}".format(tok6)
+    identifier = self.lexeme(tok3)
+    block_statements = statements_cls(duplicates = self.duplicates)
+    end_name = "end_" + kind
+    
+    stats = self.stats
+    if stats is not None:
+      stats._enter()
+    tok4 = self.next()
+    while end_name != tok4[0]:
+      stmt = self.parse_stmt(tok4)
+      if stats is not None:
+        stats._switch("statements")
+      block_statements.append(stmt)
+      if stats is not None:
+        stats._switch("parse")
+      tok4 = self.next()
+    if stats is not None:
+      stats._exit()
+    
+    tok5 = self.next()
+    if "equal" == tok5[0]:
+      tok6 = self.next()
+      if "identifier" != tok6[0]:
+        raise self.error(
+          "expected {} identifier instead of {{!r}}".format(kind), tok6
         )
-      if tok6["identifier"] != identifier:
-        raise ParsingError(
-          "group identifier {!r} does not match end group \
-           identifier {!r}".format(tok3, tok6)
+      if self.lexeme(tok6) != identifier:
+        raise self.error(
+          "{0} identifier {{!r}} does not match end {0} "
+          "identifier {{!r}}".format(kind), tok3, tok6
         )
     else:
-      tokens.send(tok5)
-    return statements.Group(identifier.decode("utf-8"), group_statements, False)
-  else:
-    raise ParsingError("unexpected {!r}".format(tok1))
+      self.push(tok5)
+    return identifier, block_statements
+  
+  def parse_label(self):
+    """
+    Build and return a Label object using the statment objects returned by
+    repeatedly calling parse_stmt until an "end" token is encountered.
+    """
+    label = statements.Label(duplicates = self.duplicates)
+    stats = self.stats
+    while True:
+      try:
+        tok = self.next()
+        if "end" == tok[0]:
+          break
+        stmt = self.parse_stmt(tok)
+        if stats is not None:
+          stats._switch("statements")
+        label.append(stmt)
+        if stats is not None:
+          stats._switch("parse")
+      except StopIteration:
+        raise ParsingError("unexpected end")
+    return label
 
-def _parse_label(tokens):
+
+def _end_at_eof(tokens, byte_str):
   """
-  Build and return a Label object using the statment objects returned by
-  repeatedly calling _parse_stmt until an "end" _Token is encountered.
+  Yield the tokens in `tokens`, followed by an "end" token at the end of
+  `byte_str` (so a label without an END statement ends there).
   """
-  label = statements.Label()
-  while True:
-    try:
-      tok = next(tokens)
-      if "end" in tok:
-        break
-      stmt = _parse_stmt(tok, tokens)
-      label.append(stmt)
-    except StopIteration:
-      raise ParsingError("unexpected end")
-  return label
-
+  yield from tokens
+  yield ("end", len(byte_str), len(byte_str))
 
-def parse(byte_string):
+def parse(byte_string, stats = None, pool = None, duplicates = False,
+  require_end = True):
   """
   Return a :class:`Label` parsed from `byte_string`.
   
@@ -533,11 +875,363 @@ def parse(byte_string):
       A string of bytes that contains a valid PDS label. Other data may follow
       the PDS label, but `bytes` must start with a valid PDS label.
       
+    - `stats` (:obj:`None` or :class:`ParseStats`)
+    
+      If not :obj:`None`, statistics about the parse are added to `stats`.
+      Collecting statistics slows down parsing, so it's off by default.
+      
+    - `pool` (:obj:`None` or :class:`DedupPool`)
+    
+      If not :obj:`None`, a :class:`FrozenLabel` is returned instead, whose
+      group and object bodies and values are shared with the other labels
+      parsed using `pool`. See :meth:`DedupPool.intern`.
+      
+    - `duplicates` (:obj:`True` or :obj:`False`)
+    
+      If :obj:`True`, the label and its groups and objects may contain more
+      than one statement with the same identifier (e.g. the ``COLUMN``
+      objects of a ``TABLE``), which can then be read with
+      :meth:`Label.getall`. Default is :obj:`False`.
+      
+    - `require_end` (:obj:`True` or :obj:`False`)
+    
+      If :obj:`False`, `byte_string` may contain statements without an
+      ``END`` statement following them, like the format files (``.FMT``)
+      included by ``^STRUCTURE`` pointers. Default is :obj:`True`.
       
   Raises
     - :exc:`ParsingError`
     
       If `byte_string` does not start with a valid PDS label.      
   """
-  tokens = _generate_tokens(byte_string)
-  return _parse_label(tokens)
+  if stats is None:
+    tokens = _tokenize(byte_string, False, None)
+    if not require_end:
+      tokens = _end_at_eof(tokens, byte_string)
+    label = _Parser(byte_string, tokens, None, duplicates).parse_label()
+  else:
+    stats._start()
+    try:
+      tokens = _tokenize(byte_string, False, stats)
+      if not require_end:
+        tokens = _end_at_eof(tokens, byte_string)
+      label = _Parser(byte_string, tokens, stats, duplicates).parse_label()
+    finally:
+      stats._stop()
+  
+  if pool is not None:
+    label = pool.intern(label)
+  return label
+
+
+# An identifier following one of these tokens is (part of) a value, the
+# identifier of a group or object, or the second half of a namespaced
+# identifier. Any other identifier starts a new statement.
+_IDENTIFIER_CONTINUES = frozenset((
+  "equal",
+  "comma",
+  "colon",
+  "circumflex",
+  "open_paren",
+  "open_brace",
+  "open_bracket",
+  "asterisk",
+  "two_asterisk",
+  "slant",
+))
+
+class LabelParser(object):
+  """
+  A push parser for PDS labels that arrive in chunks (e.g. from a socket, an
+  archive member or a decompressor).
+  
+  Instead of needing the entire label at once like :func:`parse` does, bytes
+  are passed in as they become available using :meth:`feed`. Tokens (including
+  multi-line text values and comments) may be split across any number of
+  chunks. Only the bytes of the statement currently being parsed are kept
+  around.
+  
+  Parameters
+    - `duplicates` (:obj:`True` or :obj:`False`)
+    
+      Whether statements with the same identifier are allowed, like for
+      :func:`parse`. Default is :obj:`False`.
+  
+  Attributes
+    .. attribute:: label
+    
+        The parsed :class:`Label` once the ``END`` statement has been fed,
+        :obj:`None` before that.
+  """
+  
+  def __init__(self, duplicates = False):
+    self.label = None
+    self._duplicates = duplicates
+    self._statements = statements.Label(duplicates = duplicates)
+    self._buf = bytearray()
+    self._pos = 0
+    self._pending = []
+    self._depth = 0
+    self._previous = None
+  
+  def feed(self, data):
+    """
+    Parse the bytes in `data` and return a :obj:`list` of the top-level
+    statements that were completed by them, in order.
+    
+    Once the ``END`` statement has been fed, any more data (e.g. the rest of a
+    file following the label) is ignored.
+    
+    Parameters
+      - `data` (:obj:`bytes`, :obj:`bytearray` or :obj:`memoryview`)
+    
+    Raises
+      - :exc:`ParsingError`
+      
+        If the bytes fed so far are not the start of a valid PDS label.
+    """
+    if self.label is not None:
+      return []
+    buf = self._buf
+    buf += data
+    # Tokens never span line terminators, except for text values (which the
+    # lexer waits on) and comments (which end with line terminators). So
+    # everything up to the last one can be tokenized.
+    endpos = max(buf.rfind(b"\n"), buf.rfind(b"\r")) + 1
+    if endpos <= self._pos:
+      return []
+    return self._consume(endpos, True)
+  
+  def close(self):
+    """
+    Parse any bytes left over and return the parsed :class:`Label`.
+    
+    Raises
+      - :exc:`ParsingError`
+      
+        If the ``END`` statement was not fed.
+    """
+    if self.label is None:
+      self._consume(len(self._buf), False)
+      if self.label is None:
+        raise ParsingError("unexpected end")
+    return self.label
+  
+  def _consume(self, endpos, partial):
+    buf = self._buf
+    pending = self._pending
+    completed = []
+    tokens = _tokenize(buf, False, None, self._pos, endpos, partial)
+    for token in tokens:
+      name = token[0]
+      self._pos = token[2]
+      if self._depth == 0:
+        if ("identifier" == name and self._previous not in
+          _IDENTIFIER_CONTINUES) or name in ("circumflex", "begin_object",
+          "begin_group", "end"):
+          if pending:
+            completed.append(self._complete(token))
+          if "end" == name:
+            self.label = self._statements
+            del self._statements, self._pending
+            self._buf = None
+            return completed
+      if "begin_object" == name or "begin_group" == name:
+        self._depth += 1
+      elif "end_object" == name or "end_group" == name:
+        self._depth -= 1
+      self._previous = name
+      pending.append(token)
+    
+    # Drop the bytes of the completed statements.
+    start = pending[0][1] if pending else self._pos
+    if start:
+      del buf[:start]
+      self._pos -= start
+      pending[:] = [(n, s - start, e - start) for n, s, e in pending]
+    return completed
+  
+  def _complete(self, next_token):
+    """
+    Parse the pending tokens into a statement, append it to the label and
+    return it. `next_token` is the first token of the next statement.
+    """
+    pending = self._pending
+    pending.append(next_token)
+    parser = _Parser(self._buf, pending, None, self._duplicates)
+    try:
+      stmt = parser.parse_stmt(parser.next())
+      token = parser.next()
+    except StopIteration:
+      raise ParsingError("unexpected end")
+    if token is not next_token:
+      raise parser.error("unexpected {!r}", token)
+    del pending[:]
+    self._statements.append(stmt)
+    return stmt
+
+
+async def aparse(reader, executor = None, executor_threshold = 1 << 20,
+  chunk_size = 1 << 16):
+  """
+  Return a :class:`Label` parsed from the :class:`asyncio.StreamReader`
+  `reader`.
+  
+  This is a :ref:`coroutine <coroutine>`. The label is read a line at a time
+  and fed to a :class:`LabelParser`, so `reader` is only read up to and
+  including the line containing the ``END`` statement (e.g. the data product
+  following the label is left unread).
+  
+  Parameters
+    - `reader` (:class:`asyncio.StreamReader`)
+    
+    - `executor` (:obj:`None` or :class:`concurrent.futures.Executor`)
+    
+      Executor used to parse large labels, so that parsing them doesn't block
+      the event loop. Default is the event loop's default executor.
+      
+    - `executor_threshold` (:obj:`int`)
+    
+      Once more than this many bytes have been read, the rest of the label is
+      parsed in `executor`. Default is 1 MiB.
+      
+    - `chunk_size` (:obj:`int`)
+    
+      Lines are collected into chunks of about this many bytes before being
+      parsed. Default is 64 KiB.
+  
+  Raises
+    - :exc:`ParsingError`
+    
+      If `reader` does not start with a valid PDS label.
+  """
+  label_parser = LabelParser()
+  loop = get_running_loop()
+  nbytes = 0
+  lines = []
+  lines_size = 0
+  eof = False
+  while True:
+    try:
+      line = await reader.readuntil(b"\n")
+    except IncompleteReadError as e:
+      line = e.partial
+      eof = True
+    except LimitOverrunError as e:
+      line = await reader.readexactly(e.consumed)
+    lines.append(line)
+    lines_size += len(line)
+    if not (eof or lines_size >= chunk_size or
+      b"END" == line.lstrip()[:3].upper()):
+      continue
+    
+    chunk = b"".join(lines)
+    nbytes += lines_size
+    del lines[:]
+    lines_size = 0
+    if nbytes > executor_threshold:
+      await loop.run_in_executor(executor, label_parser.feed, chunk)
+    else:
+      label_parser.feed(chunk)
+    if label_parser.label is not None:
+      return label_parser.label
+    if eof:
+      return label_parser.close()
+
+
+# Magic bytes at the start of compressed files, and functions returning a
+# decompressor for each (or None if the module isn't available).
+_COMPRESSION_MAGIC = (
+  (b"\x1f\x8b", "gzip", lambda: decompressobj(16 + MAX_WBITS)),
+  (b"BZh", "bzip2", BZ2Decompressor),
+  (b"\xfd7zXZ\x00", "xz", LZMADecompressor),
+)
+
+def _decompressor(head):
+  """
+  Return a decompressor for a file starting with the bytes `head`, or None if
+  it's not compressed.
+  """
+  for magic, name, factory in _COMPRESSION_MAGIC:
+    if head.startswith(magic):
+      if factory is None:
+        raise ValueError("{} compressed files are not supported".format(name))
+      return factory()
+  return None
+
+def _read_chunks(stream, chunk_size):
+  """
+  Yield chunks of (at most about `chunk_size`) bytes read from the binary file
+  object `stream`, decompressing them if it's compressed. Data is only read
+  and decompressed as the chunks are consumed.
+  """
+  data = stream.read(chunk_size)
+  decompressor = _decompressor(data)
+  if decompressor is None:
+    while data:
+      yield data
+      data = stream.read(chunk_size)
+    return
+  
+  while True:
+    yield decompressor.decompress(data, chunk_size)
+    if decompressor.eof:
+      return
+    # Output is limited to chunk_size, so the decompressor may still have
+    # input left over, which zlib hands back and bz2 and lzma keep internally.
+    if hasattr(decompressor, "unconsumed_tail"):
+      data = decompressor.unconsumed_tail
+      needs_input = not data
+    else:
+      data = b""
+      needs_input = decompressor.needs_input
+    if needs_input:
+      data = stream.read(chunk_size)
+      if not data:
+        return
+
+def parse_file(file, chunk_size = 1 << 16, duplicates = False):
+  """
+  Return a :class:`Label` parsed from the start of a file.
+  
+  The file is read in chunks that are fed to a :class:`LabelParser`, and
+  reading stops as soon as the ``END`` statement has been parsed. Files
+  compressed with gzip, bzip2 or xz (e.g. ``.IMG.gz`` products with attached
+  labels) are detected by their magic bytes and decompressed on the fly, so
+  only the start of the file (i.e. the label) is ever read and decompressed,
+  no matter how large the data following the label is.
+  
+  Parameters
+    - `file` (:obj:`str` or a binary file object)
+    
+      Path to the file, or a file object open for reading in binary mode.
+    
+    - `chunk_size` (:obj:`int`)
+    
+      Number of bytes read (and decompressed) at a time. Default is 64 KiB.
+    
+    - `duplicates` (:obj:`True` or :obj:`False`)
+    
+      Whether statements with the same identifier are allowed, like for
+      :func:`parse`. Default is :obj:`False`.
+  
+  Raises
+    - :exc:`ParsingError`
+    
+      If the file does not start with a valid PDS label.
+    
+    - :exc:`ValueError`
+    
+      If the file is compressed with bzip2 or xz, but Python was built without
+      the :mod:`bz2` or :mod:`lzma` module.
+  """
+  if not hasattr(file, "read"):
+    with open(file, "rb") as stream:
+      return parse_file(stream, chunk_size, duplicates)
+  
+  label_parser = LabelParser(duplicates)
+  for chunk in _read_chunks(file, chunk_size):
+    label_parser.feed(chunk)
+    if label_parser.label is not None:
+      return label_parser.label
+  return label_parser.close()
@@ -0,0 +1,256 @@
+# vim: filetype=python3 tabstop=2 expandtab
+
+# pyds
+# Copyright (C) 2015 Jashandeep Sohi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Read PDS4 (XML) labels into the same :class:`Label` objects that PDS3 labels
+are parsed into.
+"""
+
+from . import statements
+from . import values
+from .parser import ParsingError, _ODL_LEX_TOK_PARTS_RE, tokenize
+from itertools import islice
+from xml.etree.ElementTree import ParseError, iterparse
+
+__all__ = (
+  "parse",
+)
+
+def _scalar_value(text, unit):
+  """
+  Return the value of an element whose text is `text` and whose unit
+  attribute is `unit` (or None). Numbers, dates and times are recognized using
+  the same rules as in PDS3 labels. Anything else is a Text value.
+  """
+  text = (text or "").strip()
+  byte_str = text.encode("utf-8")
+  tokens = list(islice(tokenize(byte_str), 2))
+  if len(tokens) == 1 and tokens[0][1:] == (0, len(byte_str)):
+    name = tokens[0][0]
+    units = None if unit is None else values.Units(unit, False)
+    try:
+      if "integer" == name:
+        return values.Integer(byte_str, units)
+      elif "real" == name:
+        return values.Real(byte_str, units)
+      elif unit is None and "date" == name:
+        return values.Date(
+          *_ODL_LEX_TOK_PARTS_RE[name].match(byte_str).groups()
+        )
+      elif unit is None and ("time" == name or "date_time" == name):
+        cls = values.Time if "time" == name else values.DateTime
+        parts = _ODL_LEX_TOK_PARTS_RE[name].match(byte_str).groups()
+        return cls(*(parts[:-3] + (bool(parts[-3]),) + parts[-2:]))
+    except ValueError:
+      # Looks like a number, date or time, but is out of range (e.g.
+      # 2019-02-30), which is fine in XML.
+      pass
+  return values.Text(text, False)
+
+def _normalize_path(path):
+  if isinstance(path, str):
+    path = path.split("/")
+  path = tuple(component.upper() for component in path)
+  if not path:
+    raise ValueError("empty path")
+  return path
+
+class _Frame(object):
+  """
+  Used internally to keep track of an element that has been started, but not
+  ended yet.
+  """
+
+  __slots__ = (
+    "identifier", "statements", "keep", "candidates", "matches", "repeats"
+  )
+
+  def __init__(self, identifier, statements, keep, candidates, matches):
+    self.identifier = identifier
+    # Created when the first child is added, since until then it's not known
+    # whether the element is an attribute or an object.
+    self.statements = statements
+    # Whether the whole subtree is kept, or only the requested paths in it.
+    self.keep = keep
+    # Indices of the requested paths that may match a descendant.
+    self.candidates = candidates
+    # Indices of the requested paths that match this element.
+    self.matches = matches
+    # Maps the identifiers of repeated elements to the last suffix used.
+    self.repeats = {}
+
+  def add(self, cls, identifier, value):
+    container = self.statements
+    if container is None:
+      container = self.statements = statements.ObjectStatements()
+    if identifier in container:
+      n = self.repeats.get(identifier, 1) + 1
+      while "{}_{}".format(identifier, n) in container:
+        n += 1
+      self.repeats[identifier] = n
+      identifier = "{}_{}".format(identifier, n)
+    container._append(cls(identifier, value, False))
+
+def parse(source, paths = None):
+  """
+  Return a :class:`Label` read from a PDS4 (XML) label.
+
+  The XML is read incrementally, and each element is discarded as soon as it
+  has been converted, so even very large labels are read in bounded memory.
+
+  The label contains a single :class:`Object` statement for the root element
+  (e.g. ``Product_Observational``). An element that contains other elements is
+  converted into an :class:`Object` statement, and any other element into an
+  :class:`Attribute` assignment statement whose identifier is the element's
+  name:
+
+    - Elements in a namespace with a prefix (e.g. ``<sp:Spectral_Qube>``) keep
+      the prefix as a namespace, i.e. ``SP:SPECTRAL_QUBE``.
+    - The text of an element is converted into an :class:`Integer`,
+      :class:`Real`, :class:`Date`, :class:`Time` or :class:`DateTime` value,
+      if it's formatted like one in a PDS3 label, or a :class:`Text` value
+      otherwise.
+    - The ``unit`` attribute of an element containing a number is converted
+      into the number's :class:`Units`. Other XML attributes are ignored.
+    - Since identifiers must be unique, repeated elements get a numbered
+      suffix, e.g. the second ``<Field_Character>`` element is named
+      ``FIELD_CHARACTER_2``.
+
+  Unlike PDS3 labels, the text of PDS4 labels may contain any character, so
+  the label may not serialize to a valid PDS3 label.
+
+  Parameters
+    - `source` (:obj:`str` or a binary file object)
+
+      Path to the XML file, or a file object open for reading in binary mode.
+
+    - `paths` (:obj:`None` or an iterable of paths)
+
+      If not :obj:`None`, only the first element matching each path (along
+      with the elements it contains and the objects along the path) is read,
+      and reading stops as soon as all of them have been read. A path is either
+      a :obj:`str` of element names separated by slashes, e.g.
+      ``"Product_Observational/Identification_Area/logical_identifier"``, or a
+      sequence of element names. Names are case-insensitive, and a ``*``
+      matches any element.
+
+  Raises
+    - :exc:`ParsingError`
+
+      If `source` is not well-formed XML.
+
+    - :exc:`ValueError`
+
+      If any of the `paths` is empty.
+  """
+  if paths is not None:
+    paths = tuple(_normalize_path(path) for path in paths)
+
+  if hasattr(source, "read"):
+    return _read(source, paths)
+  with open(source, "rb") as stream:
+    return _read(stream, paths)
+
+def _read(stream, paths):
+  label = statements.Label()
+  if paths is None:
+    frames = [_Frame(None, label, True, (), ())]
+    remaining = None
+  else:
+    frames = [_Frame(None, label, False, tuple(range(len(paths))), ())]
+    found = [False] * len(paths)
+    remaining = len(paths)
+
+  prefixes = {}
+  elements = []
+  skip = 0
+  try:
+    for event, item in iterparse(stream, ("start", "end", "start-ns")):
+      if "start" == event:
+        elements.append(item)
+        if skip:
+          skip += 1
+          continue
+
+        uri, _, name = item.tag[1:].rpartition("}") \
+          if item.tag.startswith("{") else ("", "", item.tag)
+        prefix = prefixes.get(uri)
+        identifier = (prefix + ":" + name if prefix else name).upper()
+
+        parent = frames[-1]
+        if paths is None:
+          frames.append(_Frame(identifier, None, True, (), ()))
+          continue
+
+        depth = len(frames) - 1
+        candidates = tuple(
+          i for i in parent.candidates
+          if not found[i] and paths[i][depth] in ("*", identifier)
+        )
+        matches = tuple(i for i in candidates if len(paths[i]) == depth + 1)
+        if matches or parent.keep or candidates:
+          frames.append(_Frame(
+            identifier,
+            None,
+            parent.keep or bool(matches),
+            tuple(i for i in candidates if len(paths[i]) > depth + 1),
+            matches,
+          ))
+        else:
+          skip = 1
+      elif "end" == event:
+        elements.pop()
+        if elements:
+          # Discard the element (and anything it contains) once it has been
+          # converted, so the tree never grows beyond the current path.
+          elements[-1].remove(item)
+
+        if skip:
+          skip -= 1
+        else:
+          frame = frames.pop()
+          if frame.statements is not None:
+            frames[-1].add(statements.Object, frame.identifier, frame.statements)
+          elif frame.keep:
+            frames[-1].add(
+              statements.Attribute,
+              frame.identifier,
+              _scalar_value(item.text, item.get("unit"))
+            )
+
+          if frame.matches:
+            for i in frame.matches:
+              if not found[i]:
+                found[i] = True
+                remaining -= 1
+            if not remaining:
+              break
+        item.clear()
+      else:
+        prefix, uri = item
+        prefixes.setdefault(uri, prefix)
+  except ParseError as error:
+    raise ParsingError("invalid XML: {}".format(error)) from error
+
+  # If reading stopped early, add the objects along the path to the last
+  # requested element.
+  while len(frames) > 1:
+    frame = frames.pop()
+    if frame.statements is not None:
+      frames[-1].add(statements.Object, frame.identifier, frame.statements)
+  return label
@@ -0,0 +1,493 @@
+# vim: filetype=python3 tabstop=2 expandtab
+
+# pyds
+# Copyright (C) 2015 Jashandeep Sohi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Learn the layout of a collection of similar labels, and parse more labels like
+them faster.
+"""
+
+from . import statements
+from . import values
+from .columnar import (
+  _SEP, _TOKEN_RES, _UNQUOTED_END, _identifier_re, _time_args
+)
+from .parser import ParsingError, _Parser, _tokenize, parse as _parse
+from re import compile as re_compile, escape as re_escape
+
+__all__ = (
+  "Schema",
+  "SchemaParser",
+)
+
+class Schema(object):
+  """
+  The layout of a label: the identifiers of its statements (in order), the
+  types of the values of its attribute assignment statements, and the layout
+  of the statements nested in its group and object statements.
+
+  Use :meth:`infer` to learn a schema from existing labels, and
+  :meth:`compile` to create a parser that is specialized for labels with that
+  layout.
+
+  Parameters
+    - `entries` (iterable of tuples)
+
+      The entries of the schema, in order. See :attr:`entries`.
+
+  Attributes
+    .. attribute:: entries
+
+        A :obj:`tuple` with an ``(identifier, type, nested)`` tuple for each
+        statement. For an attribute assignment statement, `type` is the
+        :class:`Value` subclass of its value (or :obj:`None` if it varies) and
+        `nested` is :obj:`None`. For a group or object statement, `type` is
+        either :class:`Group` or :class:`Object`, and `nested` is the
+        :class:`Schema` of its statements.
+        Read-only.
+  """
+
+  def __init__(self, entries):
+    self.entries = tuple(
+      (identifier.upper(), cls, nested) for identifier, cls, nested in entries
+    )
+
+  @classmethod
+  def infer(cls, labels):
+    """
+    Return a :class:`Schema` learned from `labels`.
+
+    Statements are in the same order as in the first label. If the values of
+    a statement have different types in different labels, its type is
+    :obj:`None`. If there are several statements with the same identifier
+    (e.g. the ``COLUMN`` objects of a ``TABLE``, see :meth:`Label.getall`),
+    each of them is merged with the statement in the same position in the
+    other labels.
+
+    Parameters
+      - `labels` (iterable of :class:`Label` objects)
+
+    Raises
+      - :exc:`ValueError`
+
+        If `labels` is empty.
+    """
+    labels = iter(labels)
+    try:
+      schema = cls._from_statements(next(labels))
+    except StopIteration:
+      raise ValueError("labels is empty") from None
+    for label in labels:
+      schema = schema._merge(label)
+    return schema
+
+  @classmethod
+  def _from_statements(cls, container):
+    return cls(
+      (stmt.identifier, values._value_type(stmt.value), None)
+      if isinstance(stmt, statements.Attribute) else
+      (stmt.identifier, type(stmt), cls._from_statements(stmt.statements))
+      for stmt in container
+    )
+
+  def _merge(self, container):
+    """
+    Return a schema like this one, but generalized to also fit `container`.
+    """
+    entries = []
+    # The number of entries with each identifier so far, so that the n-th
+    # one is merged with the n-th statement with that identifier.
+    seen = {}
+    for identifier, cls, nested in self.entries:
+      n = seen[identifier] = seen.get(identifier, 0) + 1
+      matches = container.getall(identifier)
+      if n <= len(matches):
+        value = matches[n - 1]
+        if nested is None:
+          if values._value_type(value) is not cls:
+            cls = None
+        elif isinstance(value, statements.Statements):
+          nested = nested._merge(value)
+      entries.append((identifier, cls, nested))
+    return type(self)(entries)
+
+  def __eq__(self, other):
+    if isinstance(other, Schema):
+      return self.entries == other.entries
+    else:
+      return NotImplemented
+
+  def __ne__(self, other):
+    if isinstance(other, Schema):
+      return self.entries != other.entries
+    else:
+      return NotImplemented
+
+  def __hash__(self):
+    return hash(self.entries)
+
+  def compile(self, duplicates = False):
+    """
+    Return a :class:`SchemaParser` specialized for labels with this layout.
+
+    Parameters
+      - `duplicates` (:obj:`True` or :obj:`False`)
+
+        Passed to :class:`SchemaParser`.
+    """
+    return SchemaParser(self, duplicates)
+
+
+def _units(units):
+  if units is None:
+    return None
+  # Like the parser, ignore whitespace in units expressions.
+  return values.Units(b"".join(units.split()).decode("utf-8"))
+
+# For each value type that can be predicted: the token of its value and a
+# function creating the value from the matched groups of the token (and the
+# units group).
+_PREDICTED_VALUES = {
+  values.Integer: ("integer", lambda g: values.Integer(g[0], _units(g[-1]))),
+  values.BasedInteger: ("based_integer", lambda g: values.BasedInteger(
+    g[1], g[2].decode("utf-8"), _units(g[-1])
+  )),
+  values.Real: ("real", lambda g: values.Real(g[0], _units(g[-1]))),
+  values.Text: ("text", lambda g: values.Text(g[1].decode("utf-8"), False)),
+  values.Symbol: (
+    "symbol", lambda g: values.Symbol(g[1].decode("utf-8"), False)
+  ),
+  values.Identifier: (
+    "identifier", lambda g: values.Identifier(g[0].decode("utf-8"), False)
+  ),
+  values.Date: ("date", lambda g: values.Date(*g[1:4])),
+  values.Time: ("time", lambda g: values.Time(*_time_args(g[1:7]))),
+  values.DateTime: (
+    "date_time", lambda g: values.DateTime(*_time_args(g[1:10]))
+  ),
+}
+
+_NUMERIC_TYPES = (values.Integer, values.BasedInteger, values.Real)
+
+def _compile_re(pattern):
+  return re_compile("(?xsi){}".format(pattern).encode("utf-8")).match
+
+def _value_re(cls, name = None):
+  """
+  Return a regexp string matching a value of type `cls` (in a group named
+  `name`, if given) followed by its units, if it's a number.
+  """
+  token_name = _PREDICTED_VALUES[cls][0]
+  token_re = _TOKEN_RES[token_name][0]
+  end = "" if token_name in ("text", "symbol") else _UNQUOTED_END
+  units = r"(?:{}<([^>]*)>)?".format(_SEP) if cls in _NUMERIC_TYPES else "()"
+  value_re = "({}){}{}".format(token_re, end, units)
+  return "(?P<{}>{})".format(name, value_re) if name else value_re
+
+# Any scalar value. The alternatives are in the same order as in the lexer, so
+# a value that matches more than one (e.g. an integer is also the start of a
+# date) is read the same way.
+_SCALAR_TYPES = tuple(
+  cls for name in (
+    "date_time", "time", "date", "based_integer", "real", "integer", "text",
+    "symbol", "identifier"
+  )
+  for cls in _PREDICTED_VALUES if _PREDICTED_VALUES[cls][0] == name
+)
+
+_SCALAR_MATCH = _compile_re(r"{}(?:{})".format(
+  _SEP, "|".join(_value_re(cls, cls.__name__) for cls in _SCALAR_TYPES)
+))
+
+def _scalar_group_slices():
+  # Each alternative is a named group containing the token's groups and a
+  # units group.
+  slices = {}
+  for cls in _SCALAR_TYPES:
+    name = cls.__name__
+    first = _SCALAR_MATCH.__self__.groupindex[name]
+    n_groups = len(_TOKEN_RES[_PREDICTED_VALUES[cls][0]][1])
+    slices[name] = (first, first + n_groups + 2, _PREDICTED_VALUES[cls][1])
+  return slices
+
+_SCALAR_GROUP_SLICES = _scalar_group_slices()
+
+_OPEN_PAREN_MATCH = _compile_re(r"{}\(".format(_SEP))
+_CLOSE_PAREN_MATCH = _compile_re(r"{}\)".format(_SEP))
+_OPEN_BRACE_MATCH = _compile_re(r"{}\{{".format(_SEP))
+_CLOSE_BRACE_MATCH = _compile_re(r"{}\}}".format(_SEP))
+_COMMA_MATCH = _compile_re(r"{},".format(_SEP))
+
+def _match_scalar(byte_str, pos):
+  m = _SCALAR_MATCH(byte_str, pos)
+  if m is None:
+    return None
+  first, last, create = _SCALAR_GROUP_SLICES[m.lastgroup]
+  return create(m.groups()[first:last]), m.end()
+
+def _match_items(byte_str, pos, match_item, close_match):
+  """
+  Match a comma separated list of items (using `match_item`) ending with
+  `close_match`, and return a list of the items and the position following
+  the list, or None if it doesn't match.
+  """
+  items = []
+  while True:
+    m = match_item(byte_str, pos)
+    if m is None:
+      return None
+    item, pos = m
+    items.append(item)
+    m = _COMMA_MATCH(byte_str, pos)
+    if m is None:
+      break
+    pos = m.end()
+  m = close_match(byte_str, pos)
+  if m is None:
+    return None
+  return items, m.end()
+
+def _match_sequence_1d(byte_str, pos):
+  m = _OPEN_PAREN_MATCH(byte_str, pos)
+  if m is None:
+    return None
+  m = _match_items(byte_str, m.end(), _match_scalar, _CLOSE_PAREN_MATCH)
+  if m is None:
+    return None
+  return values.Sequence1D(*m[0]), m[1]
+
+def _match_value(byte_str, pos):
+  """
+  Match any value at `pos` in `byte_str`, and return it and the position
+  following it, or None if it doesn't match.
+  """
+  m = _OPEN_PAREN_MATCH(byte_str, pos)
+  if m is not None:
+    if _OPEN_PAREN_MATCH(byte_str, m.end()) is not None:
+      m = _match_items(
+        byte_str, m.end(), _match_sequence_1d, _CLOSE_PAREN_MATCH
+      )
+      return None if m is None else (values.Sequence2D(*m[0]), m[1])
+    return _match_sequence_1d(byte_str, pos)
+
+  m = _OPEN_BRACE_MATCH(byte_str, pos)
+  if m is not None:
+    pos = m.end()
+    m = _CLOSE_BRACE_MATCH(byte_str, pos)
+    if m is not None:
+      return values.Set(), m.end()
+    m = _match_items(byte_str, pos, _match_scalar, _CLOSE_BRACE_MATCH)
+    return None if m is None else (values.Set(*m[0]), m[1])
+
+  return _match_scalar(byte_str, pos)
+
+class _Container(object):
+  """
+  Used internally to hold the compiled regexps for the statements of a
+  container in a schema.
+  """
+
+  def __init__(self, schema, end_match):
+    self.end_match = end_match
+    self.entries = []
+    # Maps each identifier to the indices of its entries.
+    self.positions = {}
+    for i, (identifier, cls, nested) in enumerate(schema.entries):
+      self.positions.setdefault(identifier, []).append(i)
+      if nested is not None:
+        kind = "OBJECT" if cls is statements.Object else "GROUP"
+        statements_cls = statements.ObjectStatements \
+          if cls is statements.Object else statements.GroupStatements
+        begin = _compile_re(
+          r"{0}(?:BEGIN_)?{1}{0}={0}{2}(?![0-9a-zA-Z_])".format(
+            _SEP, kind, re_escape(identifier)
+          )
+        )
+        # Without an identifier, the end statement must be followed by the
+        # next statement (or the end of the string); anything else is left
+        # to the generic parser.
+        end = _compile_re(
+          r"{0}END_{1}(?![0-9a-zA-Z]|_[0-9a-zA-Z])"
+          r"(?:{0}={0}{2}(?![0-9a-zA-Z_])|(?={0}(?:[a-zA-Z^]|\Z)))"
+          .format(_SEP, kind, re_escape(identifier))
+        )
+        self.entries.append((
+          identifier, begin, None, (cls, statements_cls, _Container(nested, end))
+        ))
+      elif cls in _PREDICTED_VALUES:
+        # The value is matched along with the identifier.
+        create = _PREDICTED_VALUES[cls][1]
+        match = _compile_re(r"{0}{1}{0}={0}{2}".format(
+          _SEP, _identifier_re(identifier), _value_re(cls)
+        ))
+        self.entries.append((
+          identifier,
+          match,
+          lambda byte_str, m, create = create: (create(m.groups()), m.end()),
+          None
+        ))
+      else:
+        # Sets, sequences and values whose type varies are matched after the
+        # identifier, whatever their type.
+        match = _compile_re(r"{0}{1}{0}=".format(
+          _SEP, _identifier_re(identifier)
+        ))
+        self.entries.append((
+          identifier,
+          match,
+          lambda byte_str, m: _match_value(byte_str, m.end()),
+          None
+        ))
+
+_END_MATCH = _compile_re(r"{}END(?![0-9a-zA-Z]|_[0-9a-zA-Z])".format(_SEP))
+
+class SchemaParser(object):
+  """
+  A parser specialized for labels with the layout of a :class:`Schema`.
+  Create one with :meth:`Schema.compile`.
+
+  At each point in a label, the parser expects the next statement in the
+  schema, and only checks that the statement's identifier and value match
+  what it expects (e.g. that the value is an integer). Statements that don't
+  match (e.g. statements that aren't in the schema, or values of a different
+  type, or values the parser can't create, like units it doesn't understand)
+  are parsed like :func:`parse` would, and the parser continues with the
+  statement in the schema following them. If the label still can't be parsed
+  that way (e.g. because the generic parser would have read a statement
+  differently), the whole label is parsed again by :func:`parse`. So the
+  parser returns the same :class:`Label` as :func:`parse`, and raises the
+  same errors, but it's only faster for labels that (mostly) match the
+  schema.
+
+  Parameters
+    - `schema` (:class:`Schema`)
+
+    - `duplicates` (:obj:`True` or :obj:`False`)
+
+      Whether the labels may contain more than one statement with the same
+      identifier, like the `duplicates` argument of :func:`parse`. Default is
+      :obj:`False`.
+
+  Attributes
+    .. attribute:: schema
+
+        The :class:`Schema` of the parser.
+
+    .. attribute:: fallbacks
+
+        The number of statements (including group and object statements) that
+        didn't match the schema and were parsed by the generic parser, over
+        all the calls to :meth:`parse`. A label that is parsed again by
+        :func:`parse` counts as one fallback.
+
+    .. attribute:: duplicates
+
+        Whether the labels may contain duplicate identifiers.
+  """
+
+  def __init__(self, schema, duplicates = False):
+    self.schema = schema
+    self.duplicates = duplicates
+    self.fallbacks = 0
+    self._root = _Container(schema, _END_MATCH)
+
+  def parse(self, byte_string):
+    """
+    Return a :class:`Label` parsed from `byte_string`.
+
+    .. seealso::
+        :func:`parse`
+
+    Raises
+      - :exc:`ParsingError`
+
+        If `byte_string` does not start with a valid PDS label.
+    """
+    label = statements.Label(duplicates = self.duplicates)
+    try:
+      self._parse_container(byte_string, 0, self._root, label)
+    except (ParsingError, ValueError):
+      self.fallbacks += 1
+      return _parse(byte_string, duplicates = self.duplicates)
+    return label
+
+  def _parse_container(self, byte_str, pos, container, out):
+    """
+    Parse the statements of `container` starting at `pos` in `byte_str`,
+    append them to `out` and return the position following the end of the
+    container.
+    """
+    entries = container.entries
+    n = len(entries)
+    i = 0
+    while True:
+      if i < n:
+        identifier, match, match_value, block = entries[i]
+        m = match(byte_str, pos)
+        if m is not None and block is not None:
+          stmt_cls, statements_cls, nested = block
+          nested_statements = statements_cls(duplicates = self.duplicates)
+          pos = self._parse_container(
+            byte_str, m.end(), nested, nested_statements
+          )
+          out.append(stmt_cls(identifier, nested_statements, False))
+          i += 1
+          continue
+        elif m is not None:
+          try:
+            m = match_value(byte_str, m)
+          except ValueError:
+            # E.g. units that the generic parser reads differently.
+            m = None
+          if m is not None:
+            value, pos = m
+            out.append(statements.Attribute(identifier, value, False))
+            i += 1
+            continue
+
+      m = container.end_match(byte_str, pos)
+      if m is not None:
+        return m.end()
+
+      stmt, pos = self._parse_stmt(byte_str, pos, self.duplicates)
+      self.fallbacks += 1
+      out.append(stmt)
+      for j in container.positions.get(stmt.identifier, ()):
+        if j >= i:
+          i = j + 1
+          break
+
+  @staticmethod
+  def _parse_stmt(byte_str, pos, duplicates):
+    """
+    Parse the statement starting at `pos` in `byte_str` using the generic
+    parser, and return it along with the position following it.
+    """
+    last = [pos]
+    def tokens():
+      for token in _tokenize(byte_str, False, None, pos):
+        last[0] = token[2]
+        yield token
+    parser = _Parser(byte_str, tokens(), duplicates = duplicates)
+    try:
+      stmt = parser.parse_stmt(parser.next())
+    except StopIteration:
+      raise ParsingError("unexpected end") from None
+    if parser.pushed:
+      # A token was read ahead (e.g. to check for units) and pushed back.
+      return stmt, parser.pushed[-1][1]
+    return stmt, last[0]
@@ -19,14 +19,25 @@
 import abc
 
 from . import values
+from collections import Counter, OrderedDict
+from functools import partial
+from hashlib import blake2b
+from json import JSONEncoder
 from re import compile as re_compile
-from weakref import WeakValueDictionary, ref, proxy
+from sys import getsizeof
+from weakref import WeakSet, ref, proxy
 
 __all__ = (
   "Statements",
   "Label",
   "GroupStatements",
   "ObjectStatements",
+  "FrozenLabel",
+  "FrozenGroupStatements",
+  "FrozenObjectStatements",
+  "DedupPool",
+  "to_json",
+  "diff",
   "Statement",
   "Attribute",
   "Group",
@@ -86,6 +97,17 @@ class _DoubleLinkedNodes(object):
     
     self.length -= 1
   
+  def extend_nodes(self, nodes):
+    node_before = self.root.prev()
+    for node in nodes:
+      node.prev = ref(node_before)
+      node_before.next = node
+      node_before = node
+    node_before.next = self.root
+    self.root.prev = ref(node_before)
+    
+    self.length += len(nodes)
+  
   def __len__(self):
     return self.length 
   
@@ -109,18 +131,86 @@ class Statements(object, metaclass = abc.ABCMeta):
     )
   
   @abc.abstractmethod
-  def __init__(self, *statements):
+  def __init__(self, *statements, duplicates = False):
     self._nodes = _DoubleLinkedNodes()
-    self._dict = WeakValueDictionary()
+    self._dict = {}
+    # If duplicate identifiers are allowed, maps each identifier to the nodes
+    # of all the statements with that identifier, in order. Otherwise None.
+    self._multi = {} if duplicates else None
+    self._fingerprint = None
+    # Containers whose cached fingerprint includes this one's.
+    self._parents = None
+    # Statements appended inside a batch() block, or None outside of one.
+    self._pending = None
     
-    for statement in statements:
-      self.append(statement)
+    self.extend(statements)
                
   def _insert(self, index, statement):
     index = max(0, len(self) + index) if index < 0 else min(len(self), index)
     new_node = _DoubleLinkNode(statement)
     self._nodes.insert_node(new_node, index)
-    self._dict[statement.identifier] = new_node
+    if self._multi is None:
+      self._dict[statement.identifier] = new_node
+    else:
+      self._index_duplicate(new_node, index == len(self) - 1)
+    if self._fingerprint is not None:
+      self._invalidate()
+  
+  def _index_duplicate(self, node, last):
+    """
+    Add `node` to the multi-index. `last` is True if it's the last node.
+    """
+    identifier = node.value.identifier
+    nodes = self._multi.get(identifier)
+    if nodes is None:
+      self._multi[identifier] = [node]
+    elif last:
+      nodes.append(node)
+    else:
+      # Find the node's place among the others by walking the list, which
+      # costs no more than inserting it did.
+      nodes = []
+      current_node = self._nodes.root.next
+      while current_node is not self._nodes.root:
+        if current_node.value.identifier == identifier:
+          nodes.append(current_node)
+        current_node = current_node.next
+      self._multi[identifier] = nodes
+    # Like without duplicates, lookups find the last statement.
+    self._dict[identifier] = self._multi[identifier][-1]
+  
+  def _unindex_duplicate(self, node):
+    """
+    Remove `node` from the multi-index.
+    """
+    identifier = node.value.identifier
+    nodes = self._multi[identifier]
+    nodes.remove(node)
+    if nodes:
+      self._dict[identifier] = nodes[-1]
+    else:
+      del self._multi[identifier], self._dict[identifier]
+  
+  def _invalidate(self):
+    """
+    Clear the cached fingerprint of the object, and of every container whose
+    cached fingerprint includes it.
+    """
+    stack = [self]
+    while stack:
+      container = stack.pop()
+      if container._fingerprint is not None:
+        container._fingerprint = None
+        if container._parents is not None:
+          stack.extend(container._parents)
+  
+  def _get_statement(self, identifier):
+    """
+    Return the statement whose identifier is `identifier` (which must be upper
+    case), or None if it doesn't exist.
+    """
+    node = self._dict.get(identifier)
+    return None if node is None else node.value
   
   def _append(self, statement):
     self._insert(len(self), statement)
@@ -147,8 +237,9 @@ class Statements(object, metaclass = abc.ABCMeta):
         The statement to insert. It must be an instance of either
         :class:`Attribute`, :class:`Group` or :class:`Object`.
         
-        Also, `statement`'s identifier must not be the same as any other
-        statement previously inserted.
+        Also, unless the object allows duplicate identifiers, `statement`'s
+        identifier must not be the same as any other statement previously
+        inserted.
        
     Raises
       - :exc:`TypeError`
@@ -160,12 +251,9 @@ class Statements(object, metaclass = abc.ABCMeta):
         
         If `statements`'s identifier is not unique.
     """
-    if not isinstance(statement, (Attribute, Group, Object)):
-      raise TypeError(
-        "statement is not an instance of Attribute, Group or Object"
-      )
+    self._check_type(statement)
     
-    if statement.identifier in self:
+    if self._multi is None and statement.identifier in self:
       raise ValueError(
         "statement with identifier {!r} already exists".format(
           statement.identifier
@@ -173,6 +261,12 @@ class Statements(object, metaclass = abc.ABCMeta):
       )
     self._insert(index, statement)
     
+  def _check_type(self, statement):
+    if not isinstance(statement, (Attribute, Group, Object)):
+      raise TypeError(
+        "statement is not an instance of Attribute, Group or Object"
+      )
+  
   def append(self, statement):
     """
     Append the statement `statement`.
@@ -181,8 +275,94 @@ class Statements(object, metaclass = abc.ABCMeta):
         Calling ``s.append(stmt)`` is the same as calling
         ``s.insert(len(s), stmt)``.
         See :meth:`insert` for further documentation.
+        
+        Inside a :meth:`batch` block, the statement is only type checked, and
+        is appended when the block exits.
+    """
+    if self._pending is not None:
+      self._check_type(statement)
+      self._pending.append(statement)
+    else:
+      self.insert(len(self), statement)
+  
+  def extend(self, statements):
+    """
+    Append each statement in the iterable `statements`, in order.
+    
+    This is the same as calling :meth:`append` with each statement, but much
+    faster for a large number of statements: the identifiers are checked for
+    uniqueness with a single :obj:`set`, the statements are linked in one pass
+    and the index of identifiers is updated once at the end. If any statement
+    is invalid, none of them are appended.
+    
+    Parameters
+      - `statements` (iterable of :class:`Attribute`, :class:`Group` or
+        :class:`Object`)
+    
+    Raises
+      - :exc:`TypeError`
+        
+        If any of the statements is not of the correct type (see
+        :meth:`insert`).
+        
+      - :exc:`ValueError`
+        
+        If any of the statements's identifier is not unique (and the object
+        doesn't allow duplicate identifiers).
+    """
+    statements = tuple(statements)
+    if not statements:
+      return
+    
+    check_type = self._check_type
+    existing = self._dict
+    if self._multi is None:
+      identifiers = set()
+      add = identifiers.add
+      for statement in statements:
+        check_type(statement)
+        identifier = statement.identifier
+        if identifier in identifiers or identifier in existing:
+          raise ValueError(
+            "statement with identifier {!r} already exists".format(identifier)
+          )
+        add(identifier)
+    else:
+      for statement in statements:
+        check_type(statement)
+    
+    nodes = [_DoubleLinkNode(statement) for statement in statements]
+    self._nodes.extend_nodes(nodes)
+    if self._multi is None:
+      existing.update(
+        (statement.identifier, node)
+        for statement, node in zip(statements, nodes)
+      )
+    else:
+      for node in nodes:
+        self._index_duplicate(node, True)
+    if self._fingerprint is not None:
+      self._invalidate()
+  
+  def batch(self):
+    """
+    Return a context manager in which statements appended with :meth:`append`
+    are collected, and then added all at once with :meth:`extend` when the
+    block exits. This makes building a large label one statement at a time
+    about as fast as calling :meth:`extend`::
+    
+      with label.batch():
+        for stmt in stmts:
+          label.append(stmt)
+    
+    Until the block exits, the collected statements are not part of the object
+    (e.g. they are not counted by :func:`len` and can't be looked up). If the
+    block raises an exception, or any of the collected statements has an
+    identifier that is not unique, none of them are appended.
+    
+    Nested ``batch()`` blocks are part of the outermost one.
     """
-    self.insert(len(self), statement)
+    return _Batch(self)
   
   def get(self, index):
     """
@@ -232,11 +412,20 @@ class Statements(object, metaclass = abc.ABCMeta):
     else:
       node = self._nodes.get_node(index)
       self._nodes.remove_node(node)
+      identifier = node.value.identifier
+      if self._multi is not None:
+        self._unindex_duplicate(node)
+      elif self._dict.get(identifier) is node:
+        del self._dict[identifier]
+      if self._fingerprint is not None:
+        self._invalidate()
       return node.value
   
   def __setitem__(self, key, value):
     """
-    Create and insert a new statement using `key` and `value`.
+    Create and insert a new statement using `key` and `value`. If a statement
+    with the identifier `key` already exists (or, if the object allows
+    duplicate identifiers, several), the (last) one is replaced.
     
     Parameters
       - `key` (:obj:`str`)
@@ -279,27 +468,40 @@ class Statements(object, metaclass = abc.ABCMeta):
       
         If `key` is not a valid identifier.
     """
+    stmt = self._make_statement(key, value)
+    try:
+      old_node = self._dict[stmt.identifier]
+    except KeyError:
+      self._append(stmt)
+    else:
+      old_node.value = stmt
+      if self._fingerprint is not None:
+        self._invalidate()
+  
+  def _make_statement(self, key, value):
+    """
+    Return a new statement with the identifier `key` whose type depends on the
+    type of `value`. See __setitem__.
+    """
     try:
-      stmt = Attribute(key, value)
+      return Attribute(key, value)
     except TypeError:
       try:
-        stmt = Group(key, value)
+        return Group(key, value)
       except TypeError:
         try:
-          stmt = Object(key, value)
+          return Object(key, value)
         except TypeError:
           raise TypeError("value type is not correct")
-    try:
-      old_node = self._dict[stmt.identifier]
-    except KeyError:
-      self._append(stmt)
-    else:
-      old_node.value = stmt
   
   def __getitem__(self, key):
     """
     Return the value of the statement whose identifier is `key`.
     
+    If the object allows duplicate identifiers, the value of the last
+    statement with that identifier is returned. Use :meth:`getall` to get all
+    of them.
+    
     Parameters
       - `key` (:obj:`str`)
       
@@ -311,10 +513,41 @@ class Statements(object, metaclass = abc.ABCMeta):
         If a statement with an identifier equal to `key` does not exist.
     """
     return self._dict[key.upper()].value.value
+  
+  def getall(self, key):
+    """
+    Return a :obj:`list` of the values of all the statements whose identifier
+    is `key`, in order (or an empty list if there are none).
+    
+    Unless the object allows duplicate identifiers, the list contains at most
+    one value. Otherwise, the statements with each identifier are kept in an
+    index, so this takes time proportional to the number of values returned
+    (e.g. the ``COLUMN`` objects of a ``TABLE``), not to the number of
+    statements.
+    
+    Parameters
+      - `key` (:obj:`str`)
+      
+        The identifier of the statements. `key` is case-insensitive.
+    """
+    key = key.upper()
+    if self._multi is None:
+      node = self._dict.get(key)
+      return [] if node is None else [node.value.value]
+    return [node.value.value for node in self._multi.get(key, ())]
+  
+  @property
+  def duplicates(self):
+    """
+    Whether the object allows more than one statement with the same
+    identifier. Read-only.
+    """
+    return self._multi is not None
     
   def __delitem__(self, key):
     """
-    Remove the statement whose identifier is `key`.
+    Remove the statement whose identifier is `key` (or, if the object allows
+    duplicate identifiers, all of them).
     
     Parameters
       - `key` (:obj:`str`)
@@ -326,9 +559,15 @@ class Statements(object, metaclass = abc.ABCMeta):
       
         If a statement with an identifier equal to `key` does not exist.
     """
-    node = self._dict[key.upper()]
-    self._nodes.remove_node(node)
-    del node
+    key = key.upper()
+    node = self._dict.pop(key)
+    if self._multi is None:
+      self._nodes.remove_node(node)
+    else:
+      for node in self._multi.pop(key):
+        self._nodes.remove_node(node)
+    if self._fingerprint is not None:
+      self._invalidate()
   
   def __contains__(self, key):
     """
@@ -365,8 +604,10 @@ class Statements(object, metaclass = abc.ABCMeta):
     
     Called by :func:`reversed`.
     """
+    # Previous links are weak references to the nodes themselves, so the
+    # first node links back to the root node rather than its proxy.
     current_node = self._nodes.root.prev()
-    while current_node is not self._nodes.root:
+    while current_node is not self._nodes.root_hard:
       yield current_node.value
       current_node = current_node.prev()
     
@@ -400,6 +641,249 @@ class Statements(object, metaclass = abc.ABCMeta):
     Called by :func:`bytes`.
     """
     return str(self).encode("ascii")
+  
+  def __reduce__(self):
+    # The linked list of statements uses weak references, which can't be
+    # pickled, so pickle the statements instead.
+    if self._multi is not None:
+      return (partial(type(self), duplicates = True), tuple(self))
+    return (type(self), tuple(self))
+  
+  def resolve_includes(self, search_paths, cache = None):
+    """
+    Replace each ``^STRUCTURE`` pointer statement (in the object, and in the
+    groups and objects nested in it) with the statements in the format file
+    (``.FMT``) it points to, and return the object.
+    
+    Format files contain statements without an ``END`` statement, and may
+    include other format files. They are parsed with ``duplicates=True``
+    (since they usually contain many ``COLUMN`` objects), so the containers
+    that include them must allow duplicate identifiers too. The included
+    statements are frozen, and shared with the other labels that include the
+    same file.
+    
+    Parameters
+      - `search_paths` (:obj:`str` or a sequence of :obj:`str`)
+      
+        Directories in which to look for format files, in order (e.g. the
+        directory of the label, followed by the ``LABEL`` directory of its
+        volume). The file name in the pointer is tried as is, and in lower and
+        upper case.
+        
+      - `cache` (:obj:`None` or :class:`IncludeCache`)
+      
+        Cache of the format files that were already parsed. Default is a
+        cache shared by the whole process, so a file included by any number of
+        labels is only parsed once (or again if it's modified).
+    
+    Raises
+      - :exc:`FileNotFoundError`
+      
+        If a format file does not exist.
+        
+      - :exc:`ParsingError`
+      
+        If a format file does not contain valid PDS statements.
+      
+      - :exc:`ValueError`
+      
+        If a format file includes itself, or if a container that doesn't
+        allow duplicate identifiers would contain more than one statement with
+        the same identifier. That container is left unchanged.
+    """
+    # Imported here, since the include module depends on the parser, which
+    # depends on this module.
+    from .include import _resolve
+    return _resolve(self, search_paths, cache)
+  
+  def freeze(self):
+    """
+    Return a read-only copy of the object (i.e. a :class:`FrozenLabel`,
+    :class:`FrozenGroupStatements` or :class:`FrozenObjectStatements`).
+    
+    Nested statements are frozen as well, and values that can be modified in
+    place (i.e. :class:`Set`, :class:`Sequence1D` and :class:`Sequence2D`) are
+    copied into read-only values (i.e. :class:`FrozenSet`,
+    :class:`FrozenSequence1D` and :class:`FrozenSequence2D`), so changes made
+    to the object afterwards do not affect the copy, and the copy can't be
+    modified at all.
+    """
+    for cls in type(self).__mro__:
+      if cls in _FROZEN_TYPES:
+        frozen = _FROZEN_TYPES[cls]._from_statements(
+          tuple(_freeze_statement(stmt) for stmt in self)
+        )
+        # Equal statements have the same fingerprint, frozen or not.
+        frozen._fingerprint = self._fingerprint
+        return frozen
+    raise TypeError("{} can not be frozen".format(type(self).__name__))
+  
+  def fingerprint(self):
+    """
+    Return a 128 bit fingerprint of the statements, as a 16 byte :obj:`bytes`
+    string.
+    
+    The fingerprint only depends on the type of the object (ignoring whether
+    it's frozen or not) and the statements it contains, in order. So two
+    objects with equal statements have the same fingerprint, in any process
+    and on any platform, and any change to the statements (however deeply
+    nested) changes it. Like for :func:`diff` and the ``==`` operator of
+    frozen objects, values are equal if they are serialized the same way
+    (ignoring the order of the items of sets), so e.g. ``0.0`` and ``-0.0``
+    are not. This makes it usable as a :obj:`dict` key or a cache
+    key, e.g. for the results of processing a label.
+    
+    The fingerprint of the object, and of each group and object nested in it,
+    is computed once and then cached until the statements are modified (with
+    :meth:`insert`, :meth:`append`, :meth:`pop`, :meth:`__setitem__` or
+    :meth:`__delitem__`), so computing it again after changing a single
+    statement only rehashes the containers leading to that statement.
+    
+    .. note::
+        Changes made to :class:`Set`, :class:`Sequence1D` and
+        :class:`Sequence2D` values in place are not noticed. Assign the value
+        to its statement again (e.g. ``label["key"] = label["key"]``) to
+        update the fingerprint, or use a frozen copy (see :meth:`freeze`),
+        whose values can't be changed in place.
+    """
+    if self._fingerprint is None:
+      _compute_fingerprint(self)
+    return self._fingerprint
+  
+  def to_dict(self):
+    """
+    Return an ordered :obj:`dict` that maps the identifier of each statement
+    to a :obj:`dict` representing it, and which can be serialized to JSON.
+    
+    An attribute assignment statement is represented by its value's
+    :meth:`Value.to_dict`, and a group or object statement by
+    ``{"type": "Group", "statements": {...}}`` or
+    ``{"type": "Object", "statements": {...}}``, where ``{...}`` is the
+    :meth:`to_dict` of its nested statements.
+    
+    If there are several statements with the same identifier (see
+    :meth:`getall`), a :obj:`list` of ``[identifier, dict]`` pairs (one for
+    each statement, in order) is returned instead, so none of them are lost.
+    The same goes for the statements of each group and object.
+    
+    Nested statements are converted iteratively, so labels of any depth can be
+    converted.
+    
+    .. seealso::
+        :meth:`from_dict`, :func:`to_json`
+    """
+    root = _new_dict(self)
+    stack = [(iter(self), root)]
+    while stack:
+      stmts, out = stack[-1]
+      for stmt in stmts:
+        if isinstance(stmt, Attribute):
+          node = stmt.value.to_dict()
+        else:
+          nested = _new_dict(stmt.statements)
+          node = {
+            "type": _STATEMENT_TYPE_NAMES[type(stmt)],
+            "statements": nested,
+          }
+        if isinstance(out, list):
+          out.append([stmt.identifier, node])
+        else:
+          out[stmt.identifier] = node
+        if not isinstance(stmt, Attribute):
+          stack.append((iter(stmt.statements), nested))
+          break
+      else:
+        stack.pop()
+    return root
+  
+  @classmethod
+  def from_dict(cls, statements_dict):
+    """
+    Return a new object created from `statements_dict`, a :obj:`dict` (or
+    :obj:`list` of pairs) as returned by :meth:`to_dict` (e.g. after a round
+    trip through JSON).
+    
+    The object (and each group and object in it) allows duplicate identifiers
+    if its statements are given as a :obj:`list` of pairs.
+    
+    Parameters
+      - `statements_dict` (:obj:`dict` or :obj:`list`)
+      
+    Raises
+      - :exc:`TypeError`
+      
+        If a group statement contains a group or object statement.
+      
+      - :exc:`ValueError`
+      
+        If an identifier is invalid, or a value has an unknown type.
+    """
+    for base in cls.__mro__:
+      if base in _FROZEN_TYPES:
+        break
+    else:
+      raise TypeError("{} can not be created from a dict".format(cls.__name__))
+    
+    root = base(duplicates = isinstance(statements_dict, list))
+    stack = [(_dict_items(statements_dict), root)]
+    while stack:
+      items, container = stack[-1]
+      for identifier, node in items:
+        try:
+          stmt_cls, statements_cls = _STATEMENT_TYPES[node.get("type")]
+        except KeyError:
+          container.append(
+            Attribute(identifier, values.Value.from_dict(node))
+          )
+        else:
+          nested_dict = node["statements"]
+          nested = statements_cls(duplicates = isinstance(nested_dict, list))
+          container.append(stmt_cls(identifier, nested))
+          stack.append((_dict_items(nested_dict), nested))
+          break
+      else:
+        stack.pop()
+    return root if base is cls else root.freeze()
+
+def _has_duplicates(statements):
+  "Return True if `statements` contains duplicate identifiers."
+  if isinstance(statements, _FrozenStatements):
+    return statements.duplicates
+  return len(statements._dict) != len(statements)
+
+def _new_dict(statements):
+  """
+  Return the empty :obj:`dict` (or, if `statements` contains duplicate
+  identifiers, :obj:`list`) that :meth:`Statements.to_dict` fills in.
+  """
+  return [] if _has_duplicates(statements) else OrderedDict()
+
+def _dict_items(statements_dict):
+  "Return an iterator over the (identifier, dict) pairs of `statements_dict`."
+  if isinstance(statements_dict, list):
+    return iter(statements_dict)
+  return iter(statements_dict.items())
+
+class _Batch(object):
+  """
+  Context manager returned by :meth:`Statements.batch`.
+  """
+  
+  def __init__(self, statements):
+    self.statements = statements
+    self.outermost = False
+  
+  def __enter__(self):
+    if self.statements._pending is None:
+      self.statements._pending = []
+      self.outermost = True
+    return self.statements
+  
+  def __exit__(self, exc_type, exc_value, traceback):
+    if self.outermost:
+      pending, self.statements._pending = self.statements._pending, None
+      if exc_type is None:
+        self.statements.extend(pending)
 
 class Label(Statements):
   """
@@ -410,6 +894,12 @@ class Label(Statements):
       :class:`Object` arguments)
       
       Statements to intially insert.
+    
+    - `duplicates` (:obj:`True` or :obj:`False`)
+    
+      Whether more than one statement may have the same identifier (as
+      happens in real labels, e.g. the ``COLUMN`` objects of a ``TABLE``).
+      Default is :obj:`False`. See :meth:`getall`.
   
   Raises
     - :exc:`TypeError`
@@ -419,11 +909,12 @@ class Label(Statements):
       
     - :exc:`ValueError`
       
-      If any of the `*statements`'s identifier is not unique.
+      If any of the `*statements`'s identifier is not unique (and
+      `duplicates` is :obj:`False`).
   """
   
-  def __init__(self, *statements):
-    super().__init__(*statements)
+  def __init__(self, *statements, duplicates = False):
+    super().__init__(*statements, duplicates = duplicates)
   
   def __str__(self):
     """
@@ -443,6 +934,12 @@ class GroupStatements(Statements):
       :class:`Object` arguments)
       
       Statements to intially insert.
+    
+    - `duplicates` (:obj:`True` or :obj:`False`)
+    
+      Whether more than one statement may have the same identifier (as
+      happens in real labels, e.g. the ``COLUMN`` objects of a ``TABLE``).
+      Default is :obj:`False`. See :meth:`getall`.
   
   Raises
     - :exc:`TypeError`
@@ -452,11 +949,12 @@ class GroupStatements(Statements):
       
     - :exc:`ValueError`
       
-      If any of the `*statements`'s identifier is not unique.
+      If any of the `*statements`'s identifier is not unique (and
+      `duplicates` is :obj:`False`).
   """
   
-  def __init__(self, *statements):
-    super().__init__(*statements)  
+  def __init__(self, *statements, duplicates = False):
+    super().__init__(*statements, duplicates = duplicates)  
   
   @Statements._max_identifier_width.getter
   def _max_identifier_width(self):
@@ -484,8 +982,9 @@ class GroupStatements(Statements):
         
         The statement to insert. It must be an instance of :class:`Attribute`.
         
-        Also, `statement`'s identifier must not be the same as any other
-        statement previously inserted.
+        Also, unless the object allows duplicate identifiers, `statement`'s
+        identifier must not be the same as any other statement previously
+        inserted.
        
     Raises
       - :exc:`TypeError`
@@ -496,12 +995,9 @@ class GroupStatements(Statements):
         
         If `statements`'s identifier is not unique.
     """
-    if not isinstance(statement, (Attribute)):
-      raise TypeError(
-        "statement is not an instance of Attribute"
-      )
+    self._check_type(statement)
     
-    if statement.identifier in self:
+    if self._multi is None and statement.identifier in self:
       raise ValueError(
         "statement with identifier {!r} already exists".format(
           statement.identifier
@@ -509,9 +1005,20 @@ class GroupStatements(Statements):
       )
     self._insert(index, statement)
   
-  def __setitem__(key, value):
+  def _check_type(self, statement):
+    if not isinstance(statement, Attribute):
+      raise TypeError(
+        "statement is not an instance of Attribute"
+      )
+  
+  def _make_statement(self, key, value):
+    return Attribute(key, value)
+  
+  def __setitem__(self, key, value):
     """
-    Create and insert a new statement using `key` and `value`.
+    Create and insert a new statement using `key` and `value`. If a statement
+    with the identifier `key` already exists (or, if the object allows
+    duplicate identifiers, several), the (last) one is replaced.
     
     Parameters
       - `key` (:obj:`str`)
@@ -534,13 +1041,15 @@ class GroupStatements(Statements):
       
         If `key` is not a valid identifier.
     """
-    stmt = Attribute(key, value)
+    stmt = self._make_statement(key, value)
     try:
       old_node = self._dict[stmt.identifier]
     except KeyError:
       self._append(stmt)
     else:
       old_node.value = stmt
+      if self._fingerprint is not None:
+        self._invalidate()
     
     
 class ObjectStatements(Statements):
@@ -552,6 +1061,12 @@ class ObjectStatements(Statements):
       :class:`Object` arguments)
       
       Statements to intially insert.
+    
+    - `duplicates` (:obj:`True` or :obj:`False`)
+    
+      Whether more than one statement may have the same identifier (as
+      happens in real labels, e.g. the ``COLUMN`` objects of a ``TABLE``).
+      Default is :obj:`False`. See :meth:`getall`.
   
   Raises
     - :exc:`TypeError`
@@ -561,11 +1076,12 @@ class ObjectStatements(Statements):
       
     - :exc:`ValueError`
       
-      If any of the `*statements`'s identifier is not unique.
+      If any of the `*statements`'s identifier is not unique (and
+      `duplicates` is :obj:`False`).
   """
   
-  def __init__(self, *statements):
-    super().__init__(*statements)
+  def __init__(self, *statements, duplicates = False):
+    super().__init__(*statements, duplicates = duplicates)
 
 class Statement(object, metaclass = abc.ABCMeta):
   """
@@ -810,3 +1326,704 @@ class Object(Statement):
       format("END_OBJECT", width),
       self.identifier
     )
+
+
+_STATEMENT_TYPES = {
+  "Group": (Group, GroupStatements),
+  "Object": (Object, ObjectStatements),
+}
+
+_STATEMENT_TYPE_NAMES = {
+  Group: "Group",
+  Object: "Object",
+}
+
+_json_encode = JSONEncoder().encode
+
+def to_json(statements, stream, buffer_size = 1 << 16):
+  """
+  Write `statements` (e.g. a :class:`Label`) to `stream` as JSON.
+  
+  The JSON is the same as ``json.dump(statements.to_dict(), stream)`` would
+  write (including the lists of pairs written for statements with duplicate
+  identifiers), but it's written iteratively (so labels of any depth can be
+  written) and without building the whole :obj:`dict` in memory first.
+  
+  Parameters
+    - `statements` (:class:`Statements`)
+    
+    - `stream`
+    
+      A text stream (e.g. a file opened with ``open(path, "w")``).
+    
+    - `buffer_size` (:obj:`int`)
+    
+      Approximate number of characters to buffer before each write to
+      `stream`.
+  
+  .. seealso::
+      :meth:`Statements.to_dict`, :meth:`Statements.from_dict`
+  """
+  write = stream.write
+  pairs = _has_duplicates(statements)
+  parts = ["[" if pairs else "{"]
+  size = 0
+  first = True
+  # Each frame holds an iterator over the remaining statements of a
+  # container, and whether they are written as a list of pairs.
+  stack = [(iter(statements), pairs)]
+  while stack:
+    stmts, pairs = stack[-1]
+    for stmt in stmts:
+      part = _json_encode(stmt.identifier)
+      part = "[" + part + ", " if pairs else part + ": "
+      parts.append(part if first else ", " + part)
+      if isinstance(stmt, Attribute):
+        part = _json_encode(stmt.value.to_dict())
+        parts.append(part + "]" if pairs else part)
+        size += len(part)
+        first = False
+      else:
+        nested_pairs = _has_duplicates(stmt.statements)
+        parts.append('{{"type": "{}", "statements": {}'.format(
+          _STATEMENT_TYPE_NAMES[type(stmt)], "[" if nested_pairs else "{"
+        ))
+        stack.append((iter(stmt.statements), nested_pairs))
+        first = True
+        break
+    else:
+      stack.pop()
+      part = "]" if pairs else "}"
+      if stack:
+        # Close the dict of the group or object statement (and its pair).
+        part += "}]" if stack[-1][1] else "}"
+      parts.append(part)
+      first = False
+    if size >= buffer_size:
+      write("".join(parts))
+      parts.clear()
+      size = 0
+  write("".join(parts))
+
+def _netstring(data):
+  return b"%d:%s," % (len(data), data)
+
+def _value_bytes(value):
+  """
+  Return a byte string that is the same for values that are serialized the
+  same way (and only for them), independent of the order in which the items
+  of sets are iterated. This is what equal values means for fingerprints,
+  :func:`diff` and frozen statements (see :func:`_value_key`).
+  """
+  if isinstance(value, values.Sequence1D):
+    items = [_value_bytes(item) for item in value]
+  elif isinstance(value, values.Set):
+    items = sorted(_value_bytes(item) for item in value)
+  else:
+    items = [str(value).encode("utf-8")]
+  type_name = values._value_type(value).__name__.encode("ascii")
+  return _netstring(type_name) + _netstring(b"".join(map(_netstring, items)))
+
+def _type_name(statements):
+  for cls in type(statements).__mro__:
+    if cls in _FROZEN_TYPES:
+      return cls.__name__.encode("ascii")
+  return type(statements).__name__.encode("ascii")
+
+def _add_nested_part(container, stmt, parts):
+  """
+  Add the part hashed for the group or object statement `stmt` of `container`
+  to `parts`, once its statements have a fingerprint.
+  """
+  nested = stmt.statements
+  parts.append(_netstring(type(stmt).__name__.encode("ascii")))
+  parts.append(_netstring(stmt.identifier.encode("utf-8")))
+  parts.append(_netstring(nested._fingerprint))
+  if not isinstance(nested, _FrozenStatements):
+    if nested._parents is None:
+      nested._parents = WeakSet()
+    nested._parents.add(container)
+
+def _compute_fingerprint(statements):
+  """
+  Compute and cache the fingerprints of `statements` and of the statements
+  nested in it that don't have a cached fingerprint yet.
+  """
+  # Each frame holds a container, an iterator over its remaining statements,
+  # the parts hashed so far, and the group or object statement containing the
+  # container.
+  stack = [(statements, iter(statements), [_netstring(_type_name(statements))],
+    None)]
+  while stack:
+    container, stmts, parts, owner = stack[-1]
+    for stmt in stmts:
+      if isinstance(stmt, Attribute):
+        parts.append(_netstring(b"Attribute"))
+        parts.append(_netstring(stmt.identifier.encode("utf-8")))
+        parts.append(_value_bytes(stmt.value))
+      elif stmt.statements._fingerprint is None:
+        nested = stmt.statements
+        stack.append(
+          (nested, iter(nested), [_netstring(_type_name(nested))], stmt)
+        )
+        break
+      else:
+        _add_nested_part(container, stmt, parts)
+    else:
+      stack.pop()
+      container._fingerprint = blake2b(
+        b"".join(parts), digest_size = 16
+      ).digest()
+      if stack:
+        parent, _, parent_parts, _ = stack[-1]
+        _add_nested_part(parent, owner, parent_parts)
+
+def _same_statements(a, b):
+  """
+  Return True if statements `a` and `b` are equal, comparing their (cached)
+  fingerprints.
+  """
+  return a is b or a.fingerprint() == b.fingerprint()
+
+def diff(a, b):
+  """
+  Return a :obj:`list` of the differences between the statements `a` and `b`
+  (e.g. two :class:`Label` objects), in the order they appear in `a` (followed
+  by the statements that were added to `b`).
+  
+  Each difference is a ``(change, path, old, new)`` tuple, where `path` is a
+  :obj:`tuple` of the identifiers leading to the statement (like the `path` of
+  :meth:`FrozenLabel.with_`), and `change` is one of:
+  
+    - ``"added"``, if the statement is only in `b`. `old` is :obj:`None` and
+      `new` is its value.
+    - ``"removed"``, if the statement is only in `a`. `old` is its value and
+      `new` is :obj:`None`.
+    - ``"changed"``, if the statement is in both, but its values are not equal
+      (i.e. they are serialized differently, e.g. ``0.0`` and ``-0.0``, as
+      for :meth:`Statements.fingerprint`) or it's a different type of
+      statement (e.g. an attribute assignment statement in `a` and an object
+      statement in `b`).
+  
+  Groups and objects that are in both are compared statement by statement,
+  so only the statements that differ inside them are reported. Identical
+  groups and objects are skipped without walking them by comparing their
+  cached fingerprints (see :meth:`Statements.fingerprint`). The order of
+  statements is not compared.
+  
+  If either of two containers allows (or, if frozen, contains) duplicate
+  identifiers (see :meth:`Statements.getall`), the statements with the same
+  identifier are paired in order, i.e. the first ``COLUMN`` object of `a` is
+  compared with the first ``COLUMN`` object of `b`, and so on. Any extra
+  statements are reported as added or removed.
+  
+  Parameters
+    - `a` (:class:`Statements`)
+    
+    - `b` (:class:`Statements`)
+  """
+  changes = []
+  if _same_statements(a, b):
+    return changes
+  
+  stack = [_diff_frame((), a, b)]
+  while stack:
+    path, old_statements, new_statements, old_iter, new_multi, seen = stack[-1]
+    for old_stmt in old_iter:
+      identifier = old_stmt.identifier
+      stmt_path = path + (identifier,)
+      if new_multi is None:
+        new_stmt = new_statements._get_statement(identifier)
+      else:
+        # Pair the n-th statement with the identifier in the old container
+        # with the n-th one in the new container.
+        n = seen.get(identifier, 0)
+        seen[identifier] = n + 1
+        new_stmts = new_multi.get(identifier, ())
+        new_stmt = new_stmts[n] if n < len(new_stmts) else None
+      if new_stmt is None:
+        changes.append(("removed", stmt_path, old_stmt.value, None))
+      elif type(old_stmt) is not type(new_stmt):
+        changes.append(
+          ("changed", stmt_path, old_stmt.value, new_stmt.value)
+        )
+      elif isinstance(old_stmt, Attribute):
+        old_value = old_stmt.value
+        new_value = new_stmt.value
+        if old_value is not new_value and \
+          _value_key(old_value) != _value_key(new_value):
+          changes.append(("changed", stmt_path, old_value, new_value))
+      elif not _same_statements(old_stmt.statements, new_stmt.statements):
+        stack.append(
+          _diff_frame(stmt_path, old_stmt.statements, new_stmt.statements)
+        )
+        break
+    else:
+      stack.pop()
+      if new_multi is None:
+        for new_stmt in new_statements:
+          if old_statements._get_statement(new_stmt.identifier) is None:
+            changes.append(
+              ("added", path + (new_stmt.identifier,), None, new_stmt.value)
+            )
+      else:
+        # seen now holds the number of statements with each identifier in the
+        # old container, so any more than that in the new one were added.
+        counts = {}
+        for new_stmt in new_statements:
+          identifier = new_stmt.identifier
+          n = counts[identifier] = counts.get(identifier, 0) + 1
+          if n > seen.get(identifier, 0):
+            changes.append(
+              ("added", path + (identifier,), None, new_stmt.value)
+            )
+  return changes
+
+def _diff_frame(path, old_statements, new_statements):
+  """
+  Return a frame of the stack used by :func:`diff` to compare
+  `old_statements` and `new_statements`.
+  """
+  if old_statements.duplicates or new_statements.duplicates:
+    new_multi = {}
+    for stmt in new_statements:
+      new_multi.setdefault(stmt.identifier, []).append(stmt)
+    seen = {}
+  else:
+    new_multi = seen = None
+  return (
+    path, old_statements, new_statements, iter(old_statements), new_multi,
+    seen
+  )
+
+def _value_key(value):
+  """
+  Return a hashable object that compares equal for equal values, i.e. values
+  that are serialized the same way, ignoring the order of the items of sets
+  (like :func:`_value_bytes`, but cheaper to compare).
+  """
+  cls = values._value_type(value)
+  if cls is values.Sequence1D or cls is values.Sequence2D:
+    return (cls, tuple(_value_key(v) for v in value))
+  elif cls is values.Set:
+    return (cls, frozenset(_value_key(v) for v in value))
+  return (cls, str(value))
+
+def _freeze_statement(statement):
+  """
+  Return a copy of `statement` whose nested statements (if any) are frozen.
+  """
+  if isinstance(statement, Attribute):
+    return Attribute(
+      statement.identifier, values._freeze(statement.value), False
+    )
+  return type(statement)(
+    statement.identifier, statement.statements.freeze(), False
+  )
+
+class _FrozenStatements(object):
+  """
+  Mixin used internally to make a subclass of :class:`Statements` read-only.
+  
+  Instead of a linked list, the statements are stored in a :obj:`tuple` along
+  with a :obj:`dict` mapping identifiers to statements. Neither is modified
+  after the object is created, so an instance can be read from any number of
+  threads at the same time.
+  """
+  
+  def __init__(self, *statements, duplicates = False):
+    # Let the mutable base class validate the statements.
+    for cls in type(self).__mro__:
+      if cls in _FROZEN_TYPES:
+        self._set(
+          cls(*statements, duplicates = duplicates).freeze()._statements
+        )
+        break
+  
+  @classmethod
+  def _from_statements(cls, statements, index = None):
+    self = cls.__new__(cls)
+    self._set(statements, index)
+    return self
+  
+  def _set(self, statements, index = None):
+    self._statements = statements
+    self._index = {stmt.identifier: stmt for stmt in statements} \
+      if index is None else index
+    self._multi_index = None
+    self._hash = None
+    self._fingerprint = None
+  
+  def _get_statement(self, identifier):
+    return self._index.get(identifier)
+  
+  def _read_only(self, *args, **kwargs):
+    raise TypeError("{} object is read-only".format(type(self).__name__))
+  
+  _insert = insert = append = extend = batch = pop = __setitem__ = \
+    __delitem__ = resolve_includes = _read_only
+  
+  def get(self, index):
+    """
+    Return the statement at index `index`.
+    
+    .. seealso::
+        :meth:`Statements.get`
+    """
+    try:
+      return self._statements[index]
+    except IndexError:
+      raise IndexError("index out of range") from None
+  
+  def __getitem__(self, key):
+    """
+    Return the value of the statement whose identifier is `key`.
+    
+    .. seealso::
+        :meth:`Statements.__getitem__`
+    """
+    return self._index[key.upper()].value
+  
+  def getall(self, key):
+    """
+    Return a :obj:`list` of the values of all the statements whose identifier
+    is `key`, in order.
+    
+    .. seealso::
+        :meth:`Statements.getall`
+    """
+    key = key.upper()
+    if len(self._index) == len(self._statements):
+      stmt = self._index.get(key)
+      return [] if stmt is None else [stmt.value]
+    if self._multi_index is None:
+      # Built on first use. Building it twice from different threads is
+      # harmless, since both results are equal.
+      multi_index = {}
+      for stmt in self._statements:
+        multi_index.setdefault(stmt.identifier, []).append(stmt)
+      self._multi_index = multi_index
+    return [stmt.value for stmt in self._multi_index.get(key, ())]
+  
+  @property
+  def duplicates(self):
+    """
+    Whether the object contains more than one statement with the same
+    identifier. Read-only.
+    """
+    return len(self._index) != len(self._statements)
+  
+  def __iter__(self):
+    return iter(self._statements)
+  
+  def __reversed__(self):
+    return reversed(self._statements)
+  
+  def __len__(self):
+    return len(self._statements)
+  
+  def freeze(self):
+    """
+    Return the object itself, since it's already read-only.
+    """
+    return self
+  
+  def __reduce__(self):
+    frozen = self.freeze()
+    return (type(frozen)._from_statements, (frozen._statements,))
+  
+  def with_(self, path, value):
+    """
+    Return a copy of the object in which the statement at `path` is replaced
+    by (or, if it doesn't exist, appended as) a new statement whose identifier
+    is the last component of `path` and whose value is `value`.
+    
+    Only the containers along `path` are copied. Every other statement, group
+    and object is shared with the original object, so the cost depends on the
+    depth of `path` (and the number of statements in each container along it)
+    rather than the size of the whole label.
+    
+    Parameters
+      - `path` (:obj:`str` or a sequence of :obj:`str`)
+      
+        The identifier of the statement, or a sequence of identifiers
+        leading to it through nested groups and objects (e.g.
+        ``("IMAGE", "LINES")``). Identifiers are case-insensitive.
+        
+      - `value` (:class:`Value`, :class:`GroupStatements` or
+        :class:`ObjectStatements`)
+        
+        `value` determines the type of the new statement, just like it does
+        for :meth:`Statements.__setitem__`. Nested statements are frozen.
+        
+    Raises
+      - :exc:`KeyError`
+      
+        If a group or object leading to the statement does not exist.
+        
+      - :exc:`TypeError`
+      
+        If a statement leading to the statement is not a group or object, or
+        if `value` is not of the correct type.
+        
+      - :exc:`ValueError`
+      
+        If the last component of `path` is not a valid identifier.
+    """
+    if isinstance(path, str):
+      path = (path,)
+    key, rest = path[0], path[1:]
+    
+    if rest:
+      old_stmt = self._index[key.upper()]
+      if isinstance(old_stmt, Attribute):
+        raise TypeError(
+          "{!r} is not a group or object statement".format(old_stmt.identifier)
+        )
+      new_stmt = type(old_stmt)(
+        old_stmt.identifier, old_stmt.statements.with_(rest, value), False
+      )
+    else:
+      new_stmt = _freeze_statement(self._make_statement(key, value))
+      old_stmt = self._index.get(new_stmt.identifier)
+    
+    statements = self._statements
+    if old_stmt is None:
+      statements += (new_stmt,)
+    else:
+      # Statements don't define __eq__, so this looks old_stmt up by identity.
+      i = statements.index(old_stmt)
+      statements = statements[:i] + (new_stmt,) + statements[i+1:]
+    index = self._index.copy()
+    index[new_stmt.identifier] = new_stmt
+    return type(self)._from_statements(statements, index)
+  
+  def _key(self):
+    return tuple(
+      (
+        type(stmt), stmt.identifier,
+        _value_key(stmt.value) if isinstance(stmt, Attribute) else stmt.value
+      )
+      for stmt in self._statements
+    )
+  
+  def __eq__(self, other):
+    """
+    Test if `other` is of the same type and contains equal statements (in the
+    same order).
+    """
+    if type(self) is not type(other):
+      return NotImplemented
+    return self is other or (
+      hash(self) == hash(other) and self._key() == other._key()
+    )
+  
+  def __ne__(self, other):
+    result = self.__eq__(other)
+    return result if result is NotImplemented else not result
+  
+  def __hash__(self):
+    """
+    Return a hash of the statements. It's computed once and then cached,
+    which is safe because neither the statements nor their values (see
+    :class:`FrozenSet`, :class:`FrozenSequence1D` and
+    :class:`FrozenSequence2D`) can be modified.
+    
+    Called by :func:`hash`.
+    """
+    if self._hash is None:
+      self._hash = hash((type(self), self._key()))
+    return self._hash
+
+class FrozenLabel(_FrozenStatements, Label):
+  """
+  A read-only :class:`Label`.
+  
+  A frozen label can be read (e.g. with :meth:`get`, ``label[key]``,
+  :func:`iter` or :func:`bytes`) but any method that would modify it raises a
+  :exc:`TypeError`. Nested groups and objects are frozen too, so a frozen
+  label can be safely shared between threads.
+  
+  Use :meth:`Statements.freeze` to create one from an existing label, and
+  :meth:`with_` to create a modified copy of one. Frozen labels are hashable
+  (e.g. they can be used as :obj:`dict` keys) and compare equal if their
+  statements are equal.
+  
+  Parameters
+    - `*statements` (list of either :class:`Attribute`, :class:`Group` or 
+      :class:`Object` arguments)
+      
+      Statements of the label.
+  
+  Raises
+    - :exc:`TypeError`
+      
+      If any of the `*statements` is not an instance of either 
+      :class:`Attribute`, :class:`Group` or :class:`Object`.
+      
+    - :exc:`ValueError`
+      
+      If any of the `*statements`'s identifier is not unique.
+  """
+
+class FrozenGroupStatements(_FrozenStatements, GroupStatements):
+  """
+  A read-only :class:`GroupStatements`.
+  
+  .. seealso::
+      :class:`FrozenLabel`
+  """
+
+class FrozenObjectStatements(_FrozenStatements, ObjectStatements):
+  """
+  A read-only :class:`ObjectStatements`.
+  
+  .. seealso::
+      :class:`FrozenLabel`
+  """
+
+_FROZEN_TYPES = {
+  Label: FrozenLabel,
+  GroupStatements: FrozenGroupStatements,
+  ObjectStatements: FrozenObjectStatements,
+}
+
+
+def _shallow_size(obj):
+  """
+  Return the approximate size in bytes of `obj` and its attribute dict (but not
+  of the objects it refers to).
+  """
+  size = getsizeof(obj)
+  attrs = getattr(obj, "__dict__", None)
+  if attrs is not None:
+    size += getsizeof(attrs)
+  return size
+
+class DedupPool(object):
+  """
+  Stores a single copy of identical group and object bodies, and values,
+  across any number of labels.
+  
+  Pass an instance to :func:`parse` (using its `pool` argument), or call
+  :meth:`intern` directly, to get a :class:`FrozenLabel` whose nested
+  :class:`FrozenGroupStatements`, :class:`FrozenObjectStatements` and values
+  are shared with every other label interned in the same pool that contains an
+  equal copy of them. This saves memory when many similar labels (e.g. the
+  labels of a volume) are kept around.
+  
+  A pool keeps every group or object body and value it has seen alive, and
+  should only be used by one thread at a time.
+  
+  Attributes
+    .. attribute:: hits
+    
+        Number of group or object bodies and values that were replaced by an
+        equal copy already in the pool, by type name.
+        A :class:`collections.Counter` instance.
+        
+    .. attribute:: bytes_saved
+    
+        Approximate number of bytes saved by replacing group or object bodies
+        and values with the copies already in the pool.
+        An :obj:`int` instance.
+  """
+  
+  def __init__(self):
+    self._values = {}
+    self._statements = {}
+    self.hits = Counter()
+    self.bytes_saved = 0
+  
+  def __len__(self):
+    """
+    Return the number of distinct group or object bodies and values in the
+    pool.
+    
+    Called by :func:`len`.
+    """
+    return len(self._values) + len(self._statements)
+  
+  def clear(self):
+    """
+    Remove everything from the pool and reset the statistics.
+    """
+    self.__init__()
+  
+  def intern(self, statements):
+    """
+    Return a frozen copy of `statements` (e.g. a :class:`FrozenLabel` if
+    `statements` is a :class:`Label`) whose nested group and object bodies and
+    values are replaced by the equal copies in the pool, if any. Bodies and
+    values that are not in the pool yet are added to it.
+    
+    Parameters
+      - `statements` (:class:`Statements`)
+    """
+    frozen = []
+    for stmt in statements:
+      if isinstance(stmt, Attribute):
+        frozen.append(
+          Attribute(stmt.identifier, self._intern_value(stmt.value), False)
+        )
+      else:
+        frozen.append(type(stmt)(
+          stmt.identifier,
+          self._intern_statements(self.intern(stmt.statements)),
+          False
+        ))
+    for cls in type(statements).__mro__:
+      if cls in _FROZEN_TYPES:
+        return _FROZEN_TYPES[cls]._from_statements(tuple(frozen))
+    raise TypeError("{} can not be frozen".format(type(statements).__name__))
+  
+  def _intern_statements(self, frozen):
+    # The nested bodies and values were already interned, so equal bodies
+    # hold the same objects. Comparing them by identity (rather than with ==,
+    # which ignores the order of the items of sets) never replaces a body by
+    # one that is serialized differently.
+    key = (type(frozen), tuple(
+      (type(stmt), stmt.identifier, id(stmt.value))
+      for stmt in frozen._statements
+    ))
+    canonical = self._statements.setdefault(key, frozen)
+    if canonical is not frozen:
+      self.hits[type(frozen).__name__] += 1
+      # The nested bodies and values were already interned, so only the
+      # container and its statements are duplicates.
+      self.bytes_saved += _shallow_size(frozen) + getsizeof(frozen._statements) \
+        + getsizeof(frozen._index) \
+        + sum(_shallow_size(stmt) for stmt in frozen._statements)
+    return canonical
+
+  def _intern_value(self, value):
+    # Keyed on the serialized value (including its units), so that values
+    # that are equal but serialized differently (e.g. 0.0 and -0.0) are not
+    # replaced by each other.
+    key = (values._value_type(value), str(value))
+    canonical = self._values.get(key)
+    if canonical is not None:
+      self.hits[type(value).__name__] += 1
+      self.bytes_saved += _shallow_size(value)
+      if isinstance(value, (values.Sequence1D, values.Set)):
+        self.bytes_saved += sum(map(_shallow_size, value))
+      return canonical
+
+    if isinstance(value, (values.Sequence1D, values.Set)):
+      # Values in the pool are shared between labels, so they must be
+      # read-only.
+      value = values._freeze(type(value)(*map(self._intern_value, value)))
+    self._values[key] = value
+    return value
+  
+  def as_dict(self):
+    """
+    Return the statistics of the pool as a :obj:`dict` (e.g. for logging or
+    serializing to JSON).
+    """
+    return {
+      "values": len(self._values),
+      "statements": len(self._statements),
+      "hits": dict(self.hits),
+      "bytes_saved": self.bytes_saved,
+    }
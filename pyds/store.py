@@ -0,0 +1,599 @@
+# vim: filetype=python3 tabstop=2 expandtab
+
+# pyds
+# Copyright (C) 2015 Jashandeep Sohi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from . import statements
+from . import values
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+
+__all__ = (
+  "LabelStore",
+  "write_store",
+)
+
+# A store file is laid out as follows (all integers are little endian):
+#
+#   header    magic (8 bytes), number of labels (u32), reserved (u32),
+#             offset of the label table (u64)
+#   labels    the encoded statements of each label, one after the other
+#   table     offset of each label (u64 each), followed by the key of each
+#             label (u16 length + utf-8 bytes each)
+#
+# A container of statements (i.e. a label, or the body of a group or object) is
+# encoded as the number of statements (u32), followed by the offset of each
+# statement relative to the start of the container (u32 each), followed by the
+# statements. So any statement can be found in O(1) without decoding the ones
+# before it. Each statement is encoded as a kind byte, its identifier (u16
+# length + ascii bytes) and then either an encoded value or an encoded
+# container.
+#
+# Each value is encoded as a tag byte followed by its fields (see
+# _Encoder.value).
+
+_MAGIC = b"PYDSLBS1"
+
+_HEADER = Struct("<8sIIQ")
+_U8 = Struct("<B")
+_U16 = Struct("<H")
+_U32 = Struct("<I")
+_U64 = Struct("<Q")
+_I64 = Struct("<q")
+_F64 = Struct("<d")
+_DATE = Struct("<qBH")
+_TIME = Struct("<BBBdBbBB")
+
+_ATTRIBUTE = 0
+_GROUP = 1
+_OBJECT = 2
+
+_INTEGER = 1
+_BIG_INTEGER = 2
+_BASED_INTEGER = 3
+_REAL = 4
+_TEXT = 5
+_SYMBOL = 6
+_IDENTIFIER = 7
+_DATE_VALUE = 8
+_TIME_VALUE = 9
+_DATE_TIME = 10
+_SET = 11
+_SEQUENCE_1D = 12
+_SEQUENCE_2D = 13
+
+_I64_MIN = -2**63
+_I64_MAX = 2**63 - 1
+
+
+class _Encoder(object):
+  """
+  Used internally to encode statements and values into a bytearray.
+  """
+
+  def __init__(self, out):
+    self.out = out
+
+  def str(self, string, length = _U16):
+    data = string.encode("utf-8")
+    self.out += length.pack(len(data))
+    self.out += data
+
+  def units(self, units):
+    self.str("" if units is None else units.expression)
+
+  def statements(self, stmts):
+    out = self.out
+    start = len(out)
+    stmts = list(stmts)
+    out += _U32.pack(len(stmts))
+    table = len(out)
+    out += bytes(4 * len(stmts))
+    for i, stmt in enumerate(stmts):
+      _U32.pack_into(out, table + 4 * i, len(out) - start)
+      if isinstance(stmt, statements.Attribute):
+        out += _U8.pack(_ATTRIBUTE)
+        self.str(stmt.identifier)
+        self.value(stmt.value)
+      else:
+        out += _U8.pack(
+          _GROUP if isinstance(stmt, statements.Group) else _OBJECT
+        )
+        self.str(stmt.identifier)
+        self.statements(stmt.statements)
+
+  def value(self, value):
+    out = self.out
+    if isinstance(value, values.Integer):
+      if _I64_MIN <= value.value <= _I64_MAX:
+        out += _U8.pack(_INTEGER)
+        out += _I64.pack(value.value)
+      else:
+        out += _U8.pack(_BIG_INTEGER)
+        self.str(str(value.value))
+      self.units(value.units)
+    elif isinstance(value, values.BasedInteger):
+      out += _U8.pack(_BASED_INTEGER)
+      out += _U8.pack(value.radix)
+      self.str(value.digits)
+      self.units(value.units)
+    elif isinstance(value, values.Real):
+      out += _U8.pack(_REAL)
+      out += _F64.pack(value.value)
+      self.units(value.units)
+    elif isinstance(value, values.Text):
+      out += _U8.pack(_TEXT)
+      self.str(value.value, _U32)
+    elif isinstance(value, values.Symbol):
+      out += _U8.pack(_SYMBOL)
+      self.str(value.value)
+    elif isinstance(value, values.Identifier):
+      out += _U8.pack(_IDENTIFIER)
+      self.str(value.value)
+    elif isinstance(value, values.Date):
+      out += _U8.pack(_DATE_VALUE)
+      self.date(value)
+    elif isinstance(value, values.Time):
+      out += _U8.pack(_TIME_VALUE)
+      self.time(value)
+    elif isinstance(value, values.DateTime):
+      out += _U8.pack(_DATE_TIME)
+      self.date(value.date)
+      self.time(value.time)
+    elif isinstance(value, values.Set):
+      out += _U8.pack(_SET)
+      out += _U32.pack(len(value))
+      for v in value:
+        self.value(v)
+    elif isinstance(value, values.Sequence1D):
+      out += _U8.pack(
+        _SEQUENCE_2D if isinstance(value, values.Sequence2D) else _SEQUENCE_1D
+      )
+      out += _U32.pack(len(value))
+      for v in value:
+        self.value(v)
+    else:
+      raise TypeError("can not encode {!r}".format(value))
+
+  def date(self, date):
+    self.out += _DATE.pack(date.year, date.month or 0, date.day)
+
+  def time(self, time):
+    self.out += _TIME.pack(
+      time.hour,
+      time.minute,
+      time.second is not None,
+      time.second or 0.0,
+      time.utc,
+      time.zone_hour or 0,
+      time.zone_hour is not None,
+      0 if time.zone_minute is None else time.zone_minute + 1,
+    )
+
+
+class _Decoder(object):
+  """
+  Used internally to decode values from a buffer.
+  """
+
+  def __init__(self, buf):
+    self.buf = buf
+
+  def str(self, pos, length = _U16):
+    n, = length.unpack_from(self.buf, pos)
+    pos += length.size
+    return self.buf[pos:pos+n].decode("utf-8"), pos + n
+
+  def units(self, pos):
+    expression, pos = self.str(pos)
+    return (values.Units(expression, False) if expression else None), pos
+
+  def value(self, pos):
+    "Return the value encoded at `pos` and the position after it."
+    buf = self.buf
+    tag = buf[pos]
+    pos += 1
+    if _INTEGER == tag:
+      number, = _I64.unpack_from(buf, pos)
+      units, pos = self.units(pos + 8)
+      return values.Integer(number, units), pos
+    elif _BIG_INTEGER == tag:
+      number, pos = self.str(pos)
+      units, pos = self.units(pos)
+      return values.Integer(number, units), pos
+    elif _BASED_INTEGER == tag:
+      radix = buf[pos]
+      digits, pos = self.str(pos + 1)
+      units, pos = self.units(pos)
+      return values.BasedInteger(radix, digits, units), pos
+    elif _REAL == tag:
+      number, = _F64.unpack_from(buf, pos)
+      units, pos = self.units(pos + 8)
+      return values.Real(number, units), pos
+    elif _TEXT == tag:
+      string, pos = self.str(pos, _U32)
+      return values.Text(string, False), pos
+    elif _SYMBOL == tag:
+      string, pos = self.str(pos)
+      return values.Symbol(string, False), pos
+    elif _IDENTIFIER == tag:
+      string, pos = self.str(pos)
+      return values.Identifier(string, False), pos
+    elif _DATE_VALUE == tag:
+      return values.Date(*self.date(pos)), pos + _DATE.size
+    elif _TIME_VALUE == tag:
+      return values.Time(*self.time(pos)), pos + _TIME.size
+    elif _DATE_TIME == tag:
+      date = self.date(pos)
+      pos += _DATE.size
+      return values.DateTime(*(date + self.time(pos))), pos + _TIME.size
+    elif tag in (_SET, _SEQUENCE_1D, _SEQUENCE_2D):
+      n, = _U32.unpack_from(buf, pos)
+      pos += 4
+      items = []
+      for _ in range(n):
+        item, pos = self.value(pos)
+        items.append(item)
+      cls = values.FrozenSet if _SET == tag else values.FrozenSequence1D \
+        if _SEQUENCE_1D == tag else values.FrozenSequence2D
+      return cls(*items), pos
+    raise ValueError("unknown value tag {} at {}".format(tag, pos - 1))
+
+  def date(self, pos):
+    year, month, day = _DATE.unpack_from(self.buf, pos)
+    return year, month or None, day
+
+  def time(self, pos):
+    hour, minute, has_second, second, utc, zone_hour, has_zone_hour, \
+      zone_minute = _TIME.unpack_from(self.buf, pos)
+    return (
+      hour,
+      minute,
+      second if has_second else None,
+      bool(utc),
+      zone_hour if has_zone_hour else None,
+      zone_minute - 1 if zone_minute else None,
+    )
+
+
+class _StoredStatements(statements._FrozenStatements):
+  """
+  Mixin used internally for read-only views of containers encoded in a store.
+  Statements (and their values) are decoded each time they are accessed.
+  """
+
+  def __init__(self, *args, **kwargs):
+    raise TypeError("{} objects are created by LabelStore".format(
+      type(self).__name__
+    ))
+
+  @classmethod
+  def _view(cls, decoder, pos):
+    self = cls.__new__(cls)
+    self._decoder = decoder
+    self._pos = pos
+    self._length, = _U32.unpack_from(decoder.buf, pos)
+    self._positions = None
+    self._fingerprint = None
+    return self
+
+  def _offset(self, index):
+    return self._pos + _U32.unpack_from(self._decoder.buf, self._pos+4+4*index)[0]
+
+  def _decode(self, pos):
+    decoder = self._decoder
+    kind = decoder.buf[pos]
+    identifier, pos = decoder.str(pos + 1)
+    if _ATTRIBUTE == kind:
+      return statements.Attribute(identifier, decoder.value(pos)[0], False)
+    elif _GROUP == kind:
+      return statements.Group(
+        identifier, StoredGroupStatements._view(decoder, pos), False
+      )
+    return statements.Object(
+      identifier, StoredObjectStatements._view(decoder, pos), False
+    )
+
+  def _identifier_positions(self):
+    "Return a dict mapping each identifier to the position of its statement."
+    if self._positions is None:
+      decoder = self._decoder
+      positions = {}
+      for i in range(self._length):
+        pos = self._offset(i)
+        positions.setdefault(decoder.str(pos + 1)[0], []).append(pos)
+      self._all_positions = positions
+      # Like Statements, lookups find the last statement with an identifier.
+      self._positions = {
+        identifier: all_pos[-1] for identifier, all_pos in positions.items()
+      }
+    return self._positions
+
+  def _get_statement(self, identifier):
+    pos = self._identifier_positions().get(identifier)
+    return None if pos is None else self._decode(pos)
+
+  def get(self, index):
+    """
+    Return the statement at index `index`.
+
+    .. seealso::
+        :meth:`Statements.get`
+    """
+    index = self._length + index if index < 0 else index
+    if index >= self._length or index < 0:
+      raise IndexError("index out of range")
+    return self._decode(self._offset(index))
+
+  def __getitem__(self, key):
+    """
+    Return the value of the statement whose identifier is `key`.
+
+    .. seealso::
+        :meth:`Statements.__getitem__`
+    """
+    return self._decode(self._identifier_positions()[key.upper()]).value
+
+  def getall(self, key):
+    """
+    Return a :obj:`list` of the values of all the statements whose identifier
+    is `key`, in order.
+
+    .. seealso::
+        :meth:`Statements.getall`
+    """
+    self._identifier_positions()
+    return [
+      self._decode(pos).value
+      for pos in self._all_positions.get(key.upper(), ())
+    ]
+
+  @property
+  def duplicates(self):
+    """
+    Whether the object contains more than one statement with the same
+    identifier. Read-only.
+    """
+    return len(self._identifier_positions()) != self._length
+
+  def __contains__(self, key):
+    return key.upper() in self._identifier_positions()
+
+  def __iter__(self):
+    for i in range(self._length):
+      yield self._decode(self._offset(i))
+
+  def __reversed__(self):
+    for i in reversed(range(self._length)):
+      yield self._decode(self._offset(i))
+
+  def __len__(self):
+    return self._length
+
+  def freeze(self):
+    """
+    Decode all the statements and return them as a :class:`FrozenLabel`,
+    :class:`FrozenGroupStatements` or :class:`FrozenObjectStatements`.
+    """
+    for cls in type(self).__mro__:
+      if cls in statements._FROZEN_TYPES:
+        return statements._FROZEN_TYPES[cls]._from_statements(
+          tuple(statements._freeze_statement(stmt) for stmt in self)
+        )
+
+  def with_(self, path, value):
+    """
+    Return a :class:`FrozenLabel` (or :class:`FrozenGroupStatements` or
+    :class:`FrozenObjectStatements`) copy of the object in which the statement
+    at `path` is replaced by a new one.
+
+    .. seealso::
+        :meth:`FrozenLabel.with_`
+    """
+    return self.freeze().with_(path, value)
+
+  # Views are compared and hashed by identity. Use freeze() to compare
+  # contents.
+  __eq__ = object.__eq__
+  __ne__ = object.__ne__
+  __hash__ = object.__hash__
+
+class StoredLabel(_StoredStatements, statements.Label):
+  """
+  A read-only view of a label in a :class:`LabelStore`.
+
+  It can be read just like a :class:`Label`, but statements and values are
+  decoded from the store every time they are accessed. Use :meth:`freeze` to
+  decode the whole label at once.
+  """
+
+class StoredGroupStatements(_StoredStatements, statements.GroupStatements):
+  """
+  A read-only view of the statements of a group in a :class:`LabelStore`.
+
+  .. seealso::
+      :class:`StoredLabel`
+  """
+
+class StoredObjectStatements(_StoredStatements, statements.ObjectStatements):
+  """
+  A read-only view of the statements of an object in a :class:`LabelStore`.
+
+  .. seealso::
+      :class:`StoredLabel`
+  """
+
+
+def write_store(path, labels):
+  """
+  Write the labels `labels` to a new store file at `path`, which can then be
+  opened with :class:`LabelStore`.
+
+  Parameters
+    - `path` (:obj:`str`)
+
+    - `labels` (:obj:`dict` or iterable)
+
+      Either a mapping of keys (:obj:`str`) to labels, or an iterable of
+      ``(key, label)`` pairs. Each label can be any :class:`Statements` object
+      (e.g. a :class:`Label` or :class:`FrozenLabel`).
+
+  Raises
+    - :exc:`TypeError`
+
+      If a label contains an object that is not a PDS value.
+  """
+  if isinstance(labels, dict):
+    labels = labels.items()
+
+  offsets = []
+  keys = []
+  with open(path, "wb") as f:
+    f.write(_HEADER.pack(_MAGIC, 0, 0, 0))
+    position = _HEADER.size
+    for key, label in labels:
+      out = bytearray()
+      _Encoder(out).statements(label)
+      f.write(out)
+      offsets.append(position)
+      keys.append(key)
+      position += len(out)
+
+    out = bytearray()
+    encoder = _Encoder(out)
+    for offset in offsets:
+      out += _U64.pack(offset)
+    for key in keys:
+      encoder.str(key)
+    f.write(out)
+    f.seek(0)
+    f.write(_HEADER.pack(_MAGIC, len(offsets), 0, position))
+
+class LabelStore(object):
+  """
+  A read-only collection of labels stored in a file written by
+  :func:`write_store`.
+
+  The file is memory mapped, so opening a store is cheap no matter how many
+  labels it contains and any label can be accessed in O(1) without decoding
+  the others. Since the mapping is read-only, processes that open the same
+  store share its pages through the operating system's page cache. A store can
+  be pickled (e.g. to pass it to a worker process), in which case it is opened
+  again from `path` when unpickled.
+
+  Labels are returned as :class:`StoredLabel` views.
+
+  Parameters
+    - `path` (:obj:`str`)
+
+  Raises
+    - :exc:`ValueError`
+
+      If `path` is not a store file.
+
+  Attributes
+    .. attribute:: path
+
+        Path of the store file.
+        A :obj:`str` instance.
+  """
+
+  def __init__(self, path):
+    self.path = path
+    with open(path, "rb") as f:
+      self._mmap = mmap(f.fileno(), 0, access = ACCESS_READ)
+    buf = self._mmap
+    if len(buf) < _HEADER.size:
+      raise ValueError("not a label store")
+    magic, self._length, _, self._table = _HEADER.unpack_from(buf, 0)
+    if magic != _MAGIC:
+      raise ValueError("not a label store")
+    self._decoder = _Decoder(buf)
+    self._keys = None
+
+  def __reduce__(self):
+    return (type(self), (self.path,))
+
+  def close(self):
+    """
+    Close the memory mapped file. Labels (and nested statements) from the
+    store can not be accessed once it's closed.
+    """
+    self._mmap.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def keys(self):
+    """
+    Return a :obj:`list` of the keys of the labels, in the order they were
+    written.
+    """
+    if self._keys is None:
+      self._keys = {}
+      pos = self._table + 8 * self._length
+      for i in range(self._length):
+        key, pos = self._decoder.str(pos)
+        self._keys[key] = i
+    return list(self._keys)
+
+  def get(self, index):
+    """
+    Return the label at index `index` as a :class:`StoredLabel`.
+
+    Raises
+      - :exc:`IndexError`
+
+        If `index` is out of range.
+    """
+    index = self._length + index if index < 0 else index
+    if index >= self._length or index < 0:
+      raise IndexError("index out of range")
+    offset, = _U64.unpack_from(self._mmap, self._table + 8 * index)
+    return StoredLabel._view(self._decoder, offset)
+
+  def __getitem__(self, key):
+    """
+    Return the label whose key is `key` as a :class:`StoredLabel`.
+
+    Raises
+      - :exc:`KeyError`
+
+        If a label with the key `key` does not exist.
+    """
+    if self._keys is None:
+      self.keys()
+    return self.get(self._keys[key])
+
+  def __contains__(self, key):
+    if self._keys is None:
+      self.keys()
+    return key in self._keys
+
+  def __iter__(self):
+    """
+    Return an :obj:`iterator` over the keys of the labels.
+    """
+    return iter(self.keys())
+
+  def __len__(self):
+    """
+    Return the number of labels.
+    """
+    return self._length
@@ -0,0 +1,487 @@
+# vim: filetype=python3 tabstop=2 expandtab
+
+# pyds
+# Copyright (C) 2015 Jashandeep Sohi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compile the ``COLUMN`` objects of a ``TABLE`` object into a plan for decoding
+its rows.
+"""
+
+from struct import Struct
+
+# NumPy is optional. Without it, tables are read into lists of rows.
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+__all__ = (
+  "Column",
+  "TableLayout",
+  "LayoutCache",
+)
+
+# The kind of each PDS data type ("i" for signed and "u" for unsigned binary
+# integers, "f" for binary reals, "c" for characters, "ai" and "af" for ASCII
+# integers and reals) and its byte order.
+_DATA_TYPES = {}
+for _names, _kind, _order in (
+  (("INTEGER", "MSB_INTEGER", "MAC_INTEGER", "SUN_INTEGER"), "i", ">"),
+  (
+    (
+      "UNSIGNED_INTEGER", "MSB_UNSIGNED_INTEGER", "MAC_UNSIGNED_INTEGER",
+      "SUN_UNSIGNED_INTEGER"
+    ),
+    "u", ">"
+  ),
+  (("LSB_INTEGER", "PC_INTEGER", "VAX_INTEGER"), "i", "<"),
+  (
+    ("LSB_UNSIGNED_INTEGER", "PC_UNSIGNED_INTEGER", "VAX_UNSIGNED_INTEGER"),
+    "u", "<"
+  ),
+  (("IEEE_REAL", "FLOAT", "REAL", "MAC_REAL", "SUN_REAL"), "f", ">"),
+  (("PC_REAL",), "f", "<"),
+  (("CHARACTER", "DATE", "TIME"), "c", ""),
+  (("ASCII_INTEGER",), "ai", ""),
+  (("ASCII_REAL",), "af", ""),
+):
+  for _name in _names:
+    _DATA_TYPES[_name] = (_kind, _order)
+del _names, _kind, _order, _name
+
+# struct format characters of binary integers and reals, by size.
+_STRUCT_CODES = {
+  "i": {1: "b", 2: "h", 4: "i", 8: "q"},
+  "u": {1: "B", 2: "H", 4: "I", 8: "Q"},
+  "f": {4: "f", 8: "d"},
+}
+
+def _int(statements, identifier, default = None):
+  "Return the integer value of a statement, or `default` if it's missing."
+  stmt = statements._get_statement(identifier)
+  if stmt is None:
+    if default is None:
+      raise KeyError(identifier)
+    return default
+  return int(stmt.value.value)
+
+def _item_decoder(kind, order, size):
+  """
+  Return a function decoding a single item of `size` bytes at a position in a
+  buffer.
+  """
+  if kind in _STRUCT_CODES:
+    try:
+      unpack_from = Struct(order + _STRUCT_CODES[kind][size]).unpack_from
+    except KeyError:
+      raise ValueError(
+        "{} byte binary {} are not supported".format(
+          size, "reals" if "f" == kind else "integers"
+        )
+      ) from None
+    return lambda buf, pos: unpack_from(buf, pos)[0]
+  elif "c" == kind:
+    return lambda buf, pos: bytes(buf[pos:pos+size]).decode("latin-1").strip()
+  elif "ai" == kind:
+    return lambda buf, pos: int(bytes(buf[pos:pos+size]))
+  elif "af" == kind:
+    return lambda buf, pos: float(bytes(buf[pos:pos+size]))
+  return lambda buf, pos: bytes(buf[pos:pos+size])
+
+class Column(object):
+  """
+  The layout of a column of a table, as compiled by :class:`TableLayout`.
+
+  Items of the PDS data types below are decoded to:
+
+    - binary integers (e.g. ``MSB_INTEGER``, ``LSB_UNSIGNED_INTEGER``,
+      ``PC_INTEGER``) of 1, 2, 4 or 8 bytes: :obj:`int` objects.
+    - binary reals in IEEE 754 format (e.g. ``IEEE_REAL``, ``PC_REAL``) of 4
+      or 8 bytes: :obj:`float` objects.
+    - ``CHARACTER``, ``DATE`` and ``TIME``: :obj:`str` objects, without any
+      leading or trailing whitespace.
+    - ``ASCII_INTEGER`` and ``ASCII_REAL``: :obj:`int` and :obj:`float`
+      objects.
+
+  Items of any other data type (e.g. ``VAX_REAL`` or ``MSB_BIT_STRING``) are
+  left as :obj:`bytes` objects.
+
+  Parameters
+    - `statements` (:class:`ObjectStatements`)
+
+      The statements of a ``COLUMN`` object. ``NAME``, ``DATA_TYPE``,
+      ``START_BYTE`` and ``BYTES`` are required. ``ITEMS``, ``ITEM_BYTES``
+      and ``ITEM_OFFSET`` are used if present.
+
+  Raises
+    - :exc:`KeyError`
+
+      If a required statement is missing.
+
+    - :exc:`ValueError`
+
+      If the size of a binary integer or real is not supported.
+
+  Attributes
+    .. attribute:: name
+
+        The name of the column. A :obj:`str` instance.
+
+    .. attribute:: data_type
+
+        The PDS data type of its items (e.g. ``"MSB_INTEGER"``). A :obj:`str`
+        instance.
+
+    .. attribute:: start
+
+        Offset of the column from the start of the row (i.e. ``START_BYTE``
+        minus 1). An :obj:`int` instance.
+
+    .. attribute:: bytes
+
+        Size of the column. An :obj:`int` instance.
+
+    .. attribute:: items
+
+        Number of items in the column, or :obj:`None` if it holds a single
+        value. An :obj:`int` instance.
+
+    .. attribute:: item_bytes
+
+        Size of each item. An :obj:`int` instance.
+
+    .. attribute:: item_offset
+
+        Offset from the start of an item to the start of the next. An
+        :obj:`int` instance.
+  """
+
+  def __init__(self, statements):
+    self.name = str(statements["NAME"].value)
+    self.data_type = \
+      str(statements["DATA_TYPE"].value).upper().replace(" ", "_")
+    self.start = _int(statements, "START_BYTE") - 1
+    self.bytes = _int(statements, "BYTES")
+    if "ITEMS" in statements:
+      self.items = _int(statements, "ITEMS")
+      self.item_bytes = \
+        _int(statements, "ITEM_BYTES", self.bytes // self.items)
+      self.item_offset = _int(statements, "ITEM_OFFSET", self.item_bytes)
+    else:
+      self.items = None
+      self.item_bytes = self.item_offset = self.bytes
+    self._kind, self._order = _DATA_TYPES.get(self.data_type, ("", ""))
+    self._decode = self._decoder()
+
+  def _decoder(self):
+    start = self.start
+    items = self.items
+    item_offset = self.item_offset
+    kind = self._kind
+    if items is None:
+      decode = _item_decoder(kind, self._order, self.bytes)
+      return lambda buf, pos: decode(buf, pos + start)
+    if item_offset == self.item_bytes and \
+      self.item_bytes in _STRUCT_CODES.get(kind, ()):
+      # Contiguous binary items are unpacked all at once.
+      unpack_from = Struct("{}{}{}".format(
+        self._order, items, _STRUCT_CODES[kind][self.item_bytes]
+      )).unpack_from
+      return lambda buf, pos: unpack_from(buf, pos + start)
+    decode = _item_decoder(kind, self._order, self.item_bytes)
+    offsets = tuple(start + i * item_offset for i in range(items))
+    return lambda buf, pos: tuple(
+      decode(buf, pos + offset) for offset in offsets
+    )
+
+  def decode(self, buf, pos = 0):
+    """
+    Return the value of the column in the row starting at `pos` in `buf` (a
+    :obj:`tuple` of values if the column has ``ITEMS``).
+
+    Parameters
+      - `buf` (:obj:`bytes`, :class:`mmap.mmap` or any other buffer)
+
+      - `pos` (:obj:`int`)
+
+        Offset of the row in `buf`, not including any row prefix.
+    """
+    return self._decode(buf, pos)
+
+  def _numpy_format(self):
+    kind = self._kind
+    if kind in _STRUCT_CODES:
+      item = "{}{}{}".format(self._order, kind, self.item_bytes)
+    elif kind:
+      item = "S{}".format(self.item_bytes)
+    else:
+      item = "V{}".format(self.item_bytes)
+    if self.items is None:
+      return item
+    if self.item_offset == self.item_bytes:
+      return (item, (self.items,))
+    return "V{}".format(self.bytes)
+
+class TableLayout(object):
+  """
+  The compiled layout of the rows of a ``TABLE`` (or other table-like object,
+  e.g. a ``SERIES``): where each column is and how to decode it.
+
+  Compiling the layout once and reusing it to read any number of rows (or
+  tables with the same layout, see :class:`LayoutCache`) avoids looking up and
+  converting the statements of each column every time.
+
+  The ``COLUMN`` objects are looked up with :meth:`ObjectStatements.getall`,
+  so a table with more than one column must have been parsed with
+  ``duplicates=True``.
+
+  Parameters
+    - `table` (:class:`ObjectStatements`)
+
+      The statements of the table object. ``ROW_BYTES`` is required, and
+      ``ROW_PREFIX_BYTES`` and ``ROW_SUFFIX_BYTES`` are used if present.
+
+  Raises
+    - :exc:`KeyError`
+
+      If a required statement is missing.
+
+    - :exc:`ValueError`
+
+      If the size of a binary integer or real is not supported.
+
+  Attributes
+    .. attribute:: columns
+
+        A :obj:`tuple` of :class:`Column` objects, in order.
+
+    .. attribute:: row_bytes
+
+        Size of a row, not including its prefix and suffix. An :obj:`int`
+        instance.
+
+    .. attribute:: row_prefix_bytes
+
+        An :obj:`int` instance.
+
+    .. attribute:: row_suffix_bytes
+
+        An :obj:`int` instance.
+
+    .. attribute:: record_bytes
+
+        Offset from the start of a row to the start of the next (i.e. the
+        size of a row including its prefix and suffix). An :obj:`int`
+        instance.
+  """
+
+  def __init__(self, table):
+    self.columns = tuple(
+      Column(column) for column in table.getall("COLUMN")
+    )
+    self.row_bytes = _int(table, "ROW_BYTES")
+    self.row_prefix_bytes = _int(table, "ROW_PREFIX_BYTES", 0)
+    self.row_suffix_bytes = _int(table, "ROW_SUFFIX_BYTES", 0)
+    self.record_bytes = \
+      self.row_prefix_bytes + self.row_bytes + self.row_suffix_bytes
+    self._decoders = tuple(column._decode for column in self.columns)
+    self._dtype = None
+
+  @property
+  def names(self):
+    """
+    The names of the columns, in order. A :obj:`tuple` of :obj:`str`.
+    """
+    return tuple(column.name for column in self.columns)
+
+  def _count(self, buf, offset, count):
+    if count is None:
+      return (len(buf) - offset) // self.record_bytes
+    return count
+
+  def row(self, buf, index, offset = 0):
+    """
+    Return a :obj:`tuple` of the values of the columns in row `index` of the
+    table that starts at `offset` in `buf`.
+
+    Parameters
+      - `buf` (:obj:`bytes`, :class:`mmap.mmap` or any other buffer)
+
+      - `index` (:obj:`int`)
+
+        Index of the row, starting at 0.
+
+      - `offset` (:obj:`int`)
+
+        Offset of the table in `buf`. Default is 0.
+    """
+    pos = offset + index * self.record_bytes + self.row_prefix_bytes
+    return tuple(decode(buf, pos) for decode in self._decoders)
+
+  def rows(self, buf, offset = 0, count = None):
+    """
+    Yield a :obj:`tuple` of the values of the columns for each row of the
+    table that starts at `offset` in `buf`.
+
+    Parameters
+      - `buf` (:obj:`bytes`, :class:`mmap.mmap` or any other buffer)
+
+      - `offset` (:obj:`int`)
+
+        Offset of the table in `buf`. Default is 0.
+
+      - `count` (:obj:`int`)
+
+        Number of rows (e.g. the value of ``ROWS``). Default is as many rows
+        as fit in the rest of `buf`.
+    """
+    decoders = self._decoders
+    record_bytes = self.record_bytes
+    pos = offset + self.row_prefix_bytes
+    for _ in range(self._count(buf, offset, count)):
+      yield tuple(decode(buf, pos) for decode in decoders)
+      pos += record_bytes
+
+  @property
+  def dtype(self):
+    """
+    A :class:`numpy.dtype` describing a row (including its prefix and
+    suffix), with a field named after each column. Binary integers and reals
+    are fields of the same type, and characters, ASCII numbers and other data
+    types are byte strings. Read-only.
+
+    Raises
+      - :exc:`ImportError`
+
+        If NumPy is not installed.
+    """
+    if numpy is None:
+      raise ImportError("NumPy is required")
+    if self._dtype is None:
+      self._dtype = numpy.dtype({
+        "names": [column.name for column in self.columns],
+        "formats": [column._numpy_format() for column in self.columns],
+        "offsets": [
+          self.row_prefix_bytes + column.start for column in self.columns
+        ],
+        "itemsize": self.record_bytes,
+      })
+    return self._dtype
+
+  def read(self, buf, offset = 0, count = None):
+    """
+    Read the rows of the table that starts at `offset` in `buf`.
+
+    If NumPy is installed, a structured :class:`numpy.ndarray` (see
+    :attr:`dtype`) is returned, which is a view of `buf` rather than a copy
+    (so nothing is decoded, or read from an :class:`mmap.mmap`, until it's
+    accessed). Otherwise, a :obj:`list` of the rows returned by :meth:`rows`
+    is returned.
+
+    Parameters
+      - `buf` (:obj:`bytes`, :class:`mmap.mmap` or any other buffer)
+
+      - `offset` (:obj:`int`)
+
+        Offset of the table in `buf`. Default is 0.
+
+      - `count` (:obj:`int`)
+
+        Number of rows. Default is as many rows as fit in the rest of `buf`.
+    """
+    count = self._count(buf, offset, count)
+    if numpy is not None:
+      return numpy.frombuffer(buf, self.dtype, count, offset)
+    return list(self.rows(buf, offset, count))
+
+class LayoutCache(object):
+  """
+  Compiles :class:`TableLayout` objects, and keeps a single copy of each one
+  for any number of tables with the same layout (e.g. the tables of every
+  product of a volume, which share the same format).
+
+  Layouts are looked up by the :meth:`~Statements.fingerprint` of each
+  ``COLUMN`` object, along with the values of ``ROW_BYTES``,
+  ``ROW_PREFIX_BYTES`` and ``ROW_SUFFIX_BYTES``. Other statements of the
+  table (e.g. ``ROWS``, which usually differs from one product to the next)
+  don't affect the layout, so they aren't part of the key. Fingerprints are
+  cached by the objects themselves, and column objects shared by labels
+  interned in a :class:`DedupPool` are only fingerprinted once.
+
+  A cache keeps every layout it has compiled alive. It can be used by many
+  threads at once; at worst, the same layout is compiled more than once.
+
+  Attributes
+    .. attribute:: hits
+
+        Number of tables whose layout was already in the cache. An :obj:`int`
+        instance.
+
+    .. attribute:: misses
+
+        Number of tables whose layout was compiled. An :obj:`int` instance.
+  """
+
+  def __init__(self):
+    self._layouts = {}
+    self.hits = 0
+    self.misses = 0
+
+  def __len__(self):
+    """
+    Return the number of distinct layouts in the cache.
+
+    Called by :func:`len`.
+    """
+    return len(self._layouts)
+
+  def clear(self):
+    """
+    Remove every layout from the cache and reset the statistics.
+    """
+    self.__init__()
+
+  def compile(self, table):
+    """
+    Return the :class:`TableLayout` of `table`, compiling it only if no table
+    with the same layout was compiled before.
+
+    Parameters
+      - `table` (:class:`ObjectStatements`)
+
+    Raises
+      - :exc:`KeyError`
+
+        If a required statement is missing.
+
+      - :exc:`ValueError`
+
+        If the size of a binary integer or real is not supported.
+    """
+    key = (
+      _int(table, "ROW_BYTES"),
+      _int(table, "ROW_PREFIX_BYTES", 0),
+      _int(table, "ROW_SUFFIX_BYTES", 0),
+      tuple(column.fingerprint() for column in table.getall("COLUMN")),
+    )
+    layout = self._layouts.get(key)
+    if layout is None:
+      self.misses += 1
+      layout = self._layouts.setdefault(key, TableLayout(table))
+    else:
+      self.hits += 1
+    return layout
@@ -0,0 +1,355 @@
+# vim: filetype=python3 tabstop=2 expandtab
+
+# pyds
+# Copyright (C) 2015 Jashandeep Sohi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Utilities for generating synthetic PDS labels, e.g. for benchmarking and
+stress testing the parser.
+"""
+
+from . import statements
+from . import values
+from bisect import bisect
+from itertools import accumulate
+from random import Random
+
+__all__ = (
+  "VALUE_KINDS",
+  "DEFAULT_VALUE_MIX",
+  "generate_label",
+  "generate_label_bytes",
+)
+
+# Words used to build identifiers, symbols and text values. None of these (or
+# any combination of them joined by an underscore) is a reserved identifier.
+_WORDS = (
+  "ANGLE", "AZIMUTH", "BAND", "CAMERA", "CLOCK", "COUNT", "DATA", "DETECTOR",
+  "DRIVE", "ELEVATION", "EXPOSURE", "FILTER", "FRAME", "GAIN", "HEIGHT",
+  "IMAGE", "INSTRUMENT", "LINE", "MISSION", "MODEL", "NAME", "OFFSET", "PHASE",
+  "PRODUCT", "RADIANCE", "RATE", "ROVER", "SAMPLE", "SITE", "SOLAR", "SOURCE",
+  "SPACECRAFT", "START", "STOP", "TARGET", "TEMPERATURE", "TIME", "TYPE",
+  "VECTOR", "WIDTH",
+)
+
+_UNITS = (
+  "KM", "M", "SEC", "BYTES", "DEGREES", "K", "M/SEC", "KM**2*SEC**-1",
+  "W/M**2/SR/NM",
+)
+
+_RADIXES = (
+  (2, "b"),
+  (8, "o"),
+  (10, "d"),
+  (16, "X"),
+)
+
+VALUE_KINDS = (
+  "integer",
+  "based_integer",
+  "real",
+  "text",
+  "symbol",
+  "identifier",
+  "date",
+  "time",
+  "date_time",
+  "set",
+  "sequence_1d",
+  "sequence_2d",
+)
+
+_NON_SCALAR_KINDS = frozenset(("set", "sequence_1d", "sequence_2d"))
+
+DEFAULT_VALUE_MIX = {
+  "integer": 20,
+  "based_integer": 2,
+  "real": 15,
+  "text": 15,
+  "symbol": 5,
+  "identifier": 15,
+  "date": 2,
+  "time": 2,
+  "date_time": 5,
+  "set": 2,
+  "sequence_1d": 12,
+  "sequence_2d": 5,
+}
+
+class _Generator(object):
+  """
+  Used internally to generate random statements and values from a seeded
+  random number generator.
+  """
+
+  def __init__(self, depth, value_mix, seed):
+    if value_mix is None:
+      value_mix = DEFAULT_VALUE_MIX
+    unknown = set(value_mix) - set(VALUE_KINDS)
+    if unknown:
+      raise ValueError("unknown value kinds {!r}".format(sorted(unknown)))
+    kinds = [k for k in VALUE_KINDS if value_mix.get(k, 0) > 0]
+    if not kinds:
+      raise ValueError("value_mix does not have any positive weights")
+
+    # Values nested in sequences must be scalars.
+    scalar_kinds = [k for k in kinds if k not in _NON_SCALAR_KINDS] or \
+      ["integer"]
+
+    self.depth = depth
+    self.random = Random(seed)
+    self.cum_weights = list(accumulate(value_mix[k] for k in kinds))
+    self.value_funcs = [getattr(self, "_gen_" + k) for k in kinds]
+    self.scalar_cum_weights = list(accumulate(
+      value_mix.get(k, 1) for k in scalar_kinds
+    ))
+    self.scalar_funcs = [getattr(self, "_gen_" + k) for k in scalar_kinds]
+
+  def words(self, n, sep = "_"):
+    choice = self.random.choice
+    return sep.join(choice(_WORDS) for _ in range(n))
+
+  def units(self):
+    if self.random.random() < 0.3:
+      return values.Units(self.random.choice(_UNITS), False)
+    return None
+
+  def value(self):
+    i = bisect(self.cum_weights, self.random.random() * self.cum_weights[-1])
+    return self.value_funcs[i]()
+
+  def scalar(self):
+    cum_weights = self.scalar_cum_weights
+    i = bisect(cum_weights, self.random.random() * cum_weights[-1])
+    return self.scalar_funcs[i]()
+
+  def _gen_integer(self):
+    return values.Integer(self.random.randint(-10**6, 10**6), self.units())
+
+  def _gen_based_integer(self):
+    radix, fmt = self.random.choice(_RADIXES)
+    return values.BasedInteger(
+      radix,
+      format(self.random.randint(0, 2**32), fmt),
+      self.units()
+    )
+
+  def _gen_real(self):
+    return values.Real(
+      round(self.random.uniform(-1e5, 1e5), self.random.randint(0, 6)),
+      self.units()
+    )
+
+  def _gen_text(self):
+    lines = [
+      self.words(self.random.randint(1, 8), " ")
+      for _ in range(self.random.randint(1, 3))
+    ]
+    return values.Text("\r\n".join(lines), False)
+
+  def _gen_symbol(self):
+    return values.Symbol(self.words(self.random.randint(1, 3), "-"), False)
+
+  def _gen_identifier(self):
+    return values.Identifier(self.words(self.random.randint(1, 3)), False)
+
+  def _date_args(self):
+    year = self.random.randint(1970, 2030)
+    if self.random.random() < 0.2:
+      return year, None, self.random.randint(1, 365)
+    else:
+      return year, self.random.randint(1, 12), self.random.randint(1, 28)
+
+  def _time_args(self):
+    randint = self.random.randint
+    second = None
+    if self.random.random() < 0.8:
+      second = round(self.random.uniform(0, 59), randint(0, 3))
+    utc = self.random.random() < 0.5
+    zone_hour = randint(-12, 12) if not utc and self.random.random() < 0.3 \
+      else None
+    return randint(0, 23), randint(0, 59), second, utc, zone_hour
+
+  def _gen_date(self):
+    return values.Date(*self._date_args())
+
+  def _gen_time(self):
+    return values.Time(*self._time_args())
+
+  def _gen_date_time(self):
+    return values.DateTime(*(self._date_args() + self._time_args()))
+
+  def _gen_set(self):
+    if self.random.random() < 0.5:
+      return values.Set(*(
+        values.Symbol(self.words(1), False)
+        for _ in range(self.random.randint(0, 5))
+      ))
+    else:
+      return values.Set(*(
+        values.Integer(self.random.randint(0, 1000))
+        for _ in range(self.random.randint(0, 5))
+      ))
+
+  def _gen_sequence_1d(self):
+    return values.Sequence1D(*(
+      self.scalar() for _ in range(self.random.randint(1, 8))
+    ))
+
+  def _gen_sequence_2d(self):
+    return values.Sequence2D(*(
+      self._gen_sequence_1d() for _ in range(self.random.randint(1, 4))
+    ))
+
+  def fill(self, container, budget, level):
+    """
+    Append up to `budget` statements (counting nested statements) to
+    `container`, which is at nesting level `level`. Return the number of
+    statements appended.
+    """
+    random = self.random
+    is_group = isinstance(container, statements.GroupStatements)
+    count = 0
+    while count < budget:
+      identifier = "{}_{}".format(self.words(random.randint(1, 3)), count)
+      nest = random.random()
+      if is_group or level >= self.depth or budget - count < 2 or nest < 0.85:
+        container._append(
+          statements.Attribute(identifier, self.value(), False)
+        )
+        count += 1
+      elif nest < 0.93:
+        group_statements = statements.GroupStatements()
+        size = min(budget - count - 1, random.randint(1, 20))
+        count += 1 + self.fill(group_statements, size, level + 1)
+        container._append(
+          statements.Group(identifier, group_statements, False)
+        )
+      else:
+        object_statements = statements.ObjectStatements()
+        size = min(budget - count - 1, random.randint(1, 50))
+        count += 1 + self.fill(object_statements, size, level + 1)
+        container._append(
+          statements.Object(identifier, object_statements, False)
+        )
+    return count
+
+  def serialize(self, container, indent, width, comments, lines):
+    """
+    Append PDS serialized lines of the statements in `container` to `lines`,
+    randomly interspersing comments.
+    """
+    random = self.random
+    sub_indent = indent + " "
+    for stmt in container:
+      if comments and random.random() < comments:
+        lines.append("{}/* {} */".format(indent, self.words(3, " ")))
+      if isinstance(stmt, statements.Attribute) and \
+        isinstance(stmt.value, values.Set):
+        # Sets are iterated in an order that varies between processes (with
+        # hash randomization), so sort their items to make the output only
+        # depend on the seed.
+        lines.append("{}{} = {{{}}}".format(
+          indent,
+          format(stmt.identifier, width),
+          ", ".join(sorted(str(item) for item in stmt.value))
+        ))
+      elif isinstance(stmt, statements.Attribute):
+        lines.append(stmt._format(indent, width))
+      else:
+        begin, end = ("GROUP", "END_GROUP") \
+          if isinstance(stmt, statements.Group) else ("OBJECT", "END_OBJECT")
+        lines.append("{}{} = {}".format(
+          indent, format(begin, width), stmt.identifier
+        ))
+        self.serialize(
+          stmt.statements,
+          sub_indent,
+          str(stmt.statements._max_identifier_width),
+          comments,
+          lines
+        )
+        lines.append("{}{} = {}".format(
+          indent, format(end, width), stmt.identifier
+        ))
+
+
+def generate_label(n_statements = 1000, depth = 3, value_mix = None,
+  seed = None):
+  """
+  Return a randomly generated, but valid, :class:`Label`.
+
+  Parameters
+    - `n_statements` (:obj:`int`)
+
+      Total number of statements in the label, including the statements nested
+      in groups and objects.
+
+    - `depth` (:obj:`int`)
+
+      Maximum nesting depth of group and object statements. If ``0``, the label
+      only contains attribute assignment statements.
+
+    - `value_mix` (:obj:`None` or :obj:`dict`)
+
+      A mapping of value kinds (see :data:`VALUE_KINDS`) to relative weights
+      that controls how often each kind of value is generated. Kinds that are
+      missing are not generated. Default is :data:`DEFAULT_VALUE_MIX`.
+
+    - `seed`
+
+      Seed for the random number generator. The same seed (and arguments)
+      always generates the same label.
+
+  Raises
+    - :exc:`ValueError`
+
+      If `value_mix` contains an unknown kind or no positive weights.
+  """
+  generator = _Generator(depth, value_mix, seed)
+  label = statements.Label()
+  label._append(
+    statements.Attribute("PDS_VERSION_ID", values.Identifier("PDS3"))
+  )
+  generator.fill(label, n_statements - 1, 0)
+  return label
+
+def generate_label_bytes(n_statements = 1000, depth = 3, value_mix = None,
+  seed = None, comments = 0.05):
+  """
+  Return a randomly generated PDS label serialized as an ascii :obj:`bytes`
+  string.
+
+  Unlike ``bytes(generate_label(...))``, the serialized label also contains
+  comments, and the items of sets are sorted, so the same seed (and arguments)
+  always generates the same bytes, in any process.
+
+  Parameters
+    - `comments` (:obj:`float`)
+
+      Probability of a comment preceding each statement.
+
+  .. seealso::
+      :func:`generate_label` for the rest of the parameters.
+  """
+  label = generate_label(n_statements, depth, value_mix, seed)
+  generator = _Generator(depth, value_mix, seed)
+  lines = []
+  generator.serialize(
+    label, "", str(label._max_identifier_width), comments, lines
+  )
+  lines.append("END")
+  return "\r\n".join(lines).encode("ascii")
@@ -38,6 +38,9 @@ __all__ = (
   "Set",
   "Sequence1D",
   "Sequence2D",
+  "FrozenSet",
+  "FrozenSequence1D",
+  "FrozenSequence2D",
 )
 
 class Value(object, metaclass = abc.ABCMeta):
@@ -55,6 +58,34 @@ class Value(object, metaclass = abc.ABCMeta):
   @abc.abstractmethod
   def __init__(self, *args, **kwargs):
     pass
+  
+  def to_dict(self):
+    """
+    Return a :obj:`dict` representing the value, which only contains objects
+    that can be serialized to JSON (i.e. :obj:`dict`, :obj:`list`, :obj:`str`,
+    :obj:`int`, :obj:`float`, :obj:`bool` and :obj:`None`).
+    
+    The ``"type"`` item is the name of the value's class, and the rest of the
+    items are the value's attributes. For example, ``Integer(5, Units("KM"))``
+    is represented as ``{"type": "Integer", "value": 5, "units": "KM"}``.
+    
+    .. seealso::
+        :meth:`from_dict`
+    """
+    return _to_dict(self)
+  
+  @staticmethod
+  def from_dict(value_dict):
+    """
+    Return a new value created from `value_dict`, a :obj:`dict` as returned by
+    :meth:`to_dict`.
+    
+    Raises
+      - :exc:`ValueError`
+      
+        If `value_dict` has an unknown type.
+    """
+    return _from_dict(value_dict)
 
 class Scalar(Value):
   """
@@ -132,7 +163,7 @@ class Units(object):
   
   def __ne__(self, other):
     if isinstance(other, Units):
-      return self.expresion != other.expression
+      return self.expression != other.expression
     else:
       return NotImplemented
   
@@ -757,7 +788,7 @@ class Date(Scalar):
         of month :attr:`month`. :obj:`int`. Read-only.
   """
   
-  MONTH_DAYS = [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+  MONTH_DAYS = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
   
   def __init__(self, year, month, day):
     year = int(year)
@@ -1065,3 +1096,190 @@ class Sequence2D(Sequence1D):
       self._list.insert(index, value)
     else:
       raise TypeError("value is not an instance of Sequence1D")
+
+
+def _read_only(self, *args, **kwargs):
+  raise TypeError("{} object is read-only".format(type(self).__name__))
+
+class FrozenSet(Set):
+  """
+  A read-only :class:`Set`.
+  
+  It can be read just like a :class:`Set`, but any method that would modify
+  it raises a :exc:`TypeError`. Frozen labels (see :meth:`Statements.freeze`)
+  contain frozen sets instead of sets.
+  """
+  
+  def __init__(self, *values):
+    # Let Set validate the values.
+    self._set = frozenset(Set(*values))
+  
+  add = discard = _read_only
+
+class FrozenSequence1D(Sequence1D):
+  """
+  A read-only :class:`Sequence1D`.
+  
+  .. seealso::
+      :class:`FrozenSet`
+  """
+  
+  def __init__(self, *values):
+    # Let Sequence1D validate the values.
+    self._list = tuple(Sequence1D(*values))
+  
+  insert = __setitem__ = __delitem__ = _read_only
+
+class FrozenSequence2D(Sequence2D):
+  """
+  A read-only :class:`Sequence2D`, whose rows are frozen too.
+  
+  .. seealso::
+      :class:`FrozenSet`
+  """
+  
+  def __init__(self, *values):
+    # Let Sequence2D validate the values.
+    self._list = tuple(_freeze(row) for row in Sequence2D(*values))
+  
+  insert = __setitem__ = __delitem__ = _read_only
+
+_FROZEN_TYPES = {
+  Set: FrozenSet,
+  Sequence1D: FrozenSequence1D,
+  Sequence2D: FrozenSequence2D,
+}
+
+_MUTABLE_TYPES = {frozen: cls for cls, frozen in _FROZEN_TYPES.items()}
+
+def _freeze(value):
+  """
+  Return `value` if it can't be modified in place, or otherwise a read-only
+  copy of it.
+  """
+  for cls in type(value).__mro__:
+    if cls in _MUTABLE_TYPES:
+      return value
+    if cls in _FROZEN_TYPES:
+      return _FROZEN_TYPES[cls](*value)
+  return value
+
+def _value_type(value):
+  """
+  Return the type of `value`, counting read-only values as their mutable type
+  (e.g. :class:`Set` for a :class:`FrozenSet`).
+  """
+  cls = type(value)
+  return _MUTABLE_TYPES.get(cls, cls)
+
+def _numeric_to_dict(value, value_dict):
+  if value.units is not None:
+    value_dict["units"] = value.units.expression
+  return value_dict
+
+def _time_items(time):
+  return {
+    "hour": time.hour,
+    "minute": time.minute,
+    "second": time.second,
+    "utc": time.utc,
+    "zone_hour": time.zone_hour,
+    "zone_minute": time.zone_minute,
+  }
+
+# These dicts map each value type (or its name) to a function that converts
+# a value of that type to (or from) a dict. They are used by Value.to_dict and
+# Value.from_dict.
+_TO_DICT = {
+  Integer: lambda value: _numeric_to_dict(
+    value, {"type": "Integer", "value": value.value}
+  ),
+  BasedInteger: lambda value: _numeric_to_dict(
+    value,
+    {"type": "BasedInteger", "radix": value.radix, "digits": value.digits}
+  ),
+  Real: lambda value: _numeric_to_dict(
+    value, {"type": "Real", "value": value.value}
+  ),
+  Text: lambda value: {"type": "Text", "value": value.value},
+  Symbol: lambda value: {"type": "Symbol", "value": value.value},
+  Identifier: lambda value: {"type": "Identifier", "value": value.value},
+  Date: lambda value: {
+    "type": "Date",
+    "year": value.year,
+    "month": value.month,
+    "day": value.day,
+  },
+  Time: lambda value: dict({"type": "Time"}, **_time_items(value)),
+  DateTime: lambda value: dict(
+    {
+      "type": "DateTime",
+      "year": value.date.year,
+      "month": value.date.month,
+      "day": value.date.day,
+    },
+    **_time_items(value.time)
+  ),
+  Set: lambda value: {
+    "type": "Set",
+    "values": [_to_dict(v) for v in value],
+  },
+  Sequence1D: lambda value: {
+    "type": "Sequence1D",
+    "values": [_to_dict(v) for v in value],
+  },
+  Sequence2D: lambda value: {
+    "type": "Sequence2D",
+    "values": [_to_dict(v) for v in value],
+  },
+}
+
+def _units_from_dict(value_dict):
+  expression = value_dict.get("units")
+  return None if expression is None else Units(expression)
+
+def _time_args(value_dict):
+  return (
+    value_dict["hour"],
+    value_dict["minute"],
+    value_dict.get("second"),
+    value_dict.get("utc", False),
+    value_dict.get("zone_hour"),
+    value_dict.get("zone_minute"),
+  )
+
+_FROM_DICT = {
+  "Integer": lambda d: Integer(d["value"], _units_from_dict(d)),
+  "BasedInteger": lambda d: BasedInteger(
+    d["radix"], d["digits"], _units_from_dict(d)
+  ),
+  "Real": lambda d: Real(d["value"], _units_from_dict(d)),
+  "Text": lambda d: Text(d["value"]),
+  "Symbol": lambda d: Symbol(d["value"]),
+  "Identifier": lambda d: Identifier(d["value"]),
+  "Date": lambda d: Date(d["year"], d.get("month"), d["day"]),
+  "Time": lambda d: Time(*_time_args(d)),
+  "DateTime": lambda d: DateTime(
+    d["year"], d.get("month"), d["day"], *_time_args(d)
+  ),
+  "Set": lambda d: Set(*map(_from_dict, d["values"])),
+  "Sequence1D": lambda d: Sequence1D(*map(_from_dict, d["values"])),
+  "Sequence2D": lambda d: Sequence2D(*map(_from_dict, d["values"])),
+}
+
+def _to_dict(value):
+  try:
+    to_dict = _TO_DICT[type(value)]
+  except KeyError:
+    # Subclasses are represented by the closest known type.
+    to_dict = next(
+      _TO_DICT[cls] for cls in type(value).__mro__ if cls in _TO_DICT
+    )
+  return to_dict(value)
+
+def _from_dict(value_dict):
+  try:
+    from_dict = _FROM_DICT[value_dict["type"]]
+  except KeyError:
+    raise ValueError("unknown value type {!r}".format(value_dict.get("type")))
+  return from_dict(value_dict)
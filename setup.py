@@ -36,7 +36,7 @@ if __name__ == "__main__":
      "Intended Audience :: Science/Research",
      "Intended Audience :: Education",
      "License :: OSI Approved :: GNU General Public License v3 (GPLv3)",
-     "Programming Language :: Python :: 3.4",
+     "Programming Language :: Python :: 3.6",
      "Programming Language :: Python :: 3 :: Only",
      "Topic :: Software Development :: Libraries :: Python Modules",
      "Topic :: Scientific/Engineering :: Astronomy",
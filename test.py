@@ -10,6 +10,7 @@ if __name__ == "__main__":
   os.chdir("./docs")
   failed, tested = doctest.testfile(
     "./userguide.rst",
+    module_relative = False,
     verbose = False,
     optionflags = doctest.ELLIPSIS
   )